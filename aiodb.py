@@ -0,0 +1,115 @@
+import asyncio
+import functools
+import inspect
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import metrics
+
+_executor = ThreadPoolExecutor(max_workers=db.DB_POOL_MAX, thread_name_prefix="db")
+_wrappers = {}
+_inflight = {}
+stats = {"executed": 0, "coalesced": 0}
+
+COALESCED_READS = frozenset({
+    "jugador_existe", "get_monedas", "find_belen", "get_user_belen", "get_join_request",
+    "get_pending_requests_for_belen", "list_store_items", "get_store_item", "get_store_items_page",
+    "count_store_items", "get_belen_pieces", "get_belen_members", "list_tareas", "get_tarea",
+    "get_available_tareas", "get_available_tareas_page", "count_available_tareas",
+    "get_pending_tarea_submissions", "get_pending_tarea_submissions_page", "count_pending_tarea_submissions",
+    "get_tarea_submission", "has_pending_submission", "get_setting",
+})
+
+WRITES = frozenset({
+    "registrar_jugador", "set_setting", "update_monedas", "bulk_update_monedas", "bulk_update_belen_monedas",
+    "add_admin", "remove_admin", "block_user", "unblock_user", "create_belen", "delete_belen",
+    "add_member_to_belen", "leave_belen", "create_join_request", "accept_join_request", "reject_join_request",
+    "create_store_item", "update_store_item", "delete_store_item", "record_purchase", "purchase",
+    "rebuild_contributions", "create_tarea", "update_tarea", "delete_tarea", "submit_tarea",
+    "approve_tarea_submission", "reject_tarea_submission", "review_tarea_submissions",
+    "import_store_items", "import_tareas",
+})
+
+async def run(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    try:
+        return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+    finally:
+        metrics.record_db(time.perf_counter() - start)
+
+async def run_write(func, *args, **kwargs):
+    try:
+        return await run(func, *args, **kwargs)
+    finally:
+        _inflight.clear()
+
+def _wrap(func, write: bool = False):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await (run_write if write else run)(func, *args, **kwargs)
+    return wrapper
+
+def _forget(key, future) -> None:
+    if _inflight.get(key) is future:
+        del _inflight[key]
+
+def _coalesce(func):
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        key = (name, args, tuple(sorted(kwargs.items())))
+        try:
+            future = _inflight.get(key)
+        except TypeError:
+            return await run(func, *args, **kwargs)
+        if future is None:
+            stats["executed"] += 1
+            metrics.increment("botevento_db_reads_total", (("name", name), ("result", "executed")))
+            future = asyncio.ensure_future(run(func, *args, **kwargs))
+            _inflight[key] = future
+            future.add_done_callback(functools.partial(_forget, key))
+        else:
+            stats["coalesced"] += 1
+            metrics.increment("botevento_db_reads_total", (("name", name), ("result", "coalesced")))
+        return await asyncio.shield(future)
+    return wrapper
+
+_refreshing = {}
+
+def refresh_index(index) -> None:
+    if index in _refreshing:
+        _refreshing[index] = True
+        return
+    _refreshing[index] = False
+    future = asyncio.get_running_loop().run_in_executor(_executor, index.refresh)
+    future.add_done_callback(functools.partial(_refreshed, index))
+
+def _refreshed(index, future) -> None:
+    again = _refreshing.pop(index, False)
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Error recargando el índice de búsqueda: {future.exception()}")
+    if again:
+        refresh_index(index)
+
+def apply_invalidation(event: dict) -> bool:
+    return db.apply_invalidation(event, refresh_index)
+
+async def get_permissions(user_id: int) -> tuple:
+    if db.permissions_loaded():
+        return db.get_permissions(user_id)
+    return await run(db.get_permissions, user_id)
+
+def shutdown(wait: bool = True) -> None:
+    _executor.shutdown(wait=wait)
+
+def __getattr__(name: str):
+    if name in _wrappers:
+        return _wrappers[name]
+    func = getattr(db, name, None)
+    if name.startswith("_") or not inspect.isfunction(func) or func.__module__ != db.__name__ or name == "get_connection":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    _wrappers[name] = _coalesce(func) if name in COALESCED_READS else _wrap(func, name in WRITES)
+    return _wrappers[name]
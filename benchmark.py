@@ -0,0 +1,324 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+BASE_ID = 10 ** 15
+PREFIX = "bench"
+
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{user_id}>"
+        self.bot = False
+
+    def __str__(self):
+        return self.name
+
+
+class FakeResponse:
+    def __init__(self):
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def defer(self, **kwargs):
+        self._done = True
+
+    async def send_message(self, *args, **kwargs):
+        self._done = True
+
+    async def edit_message(self, *args, **kwargs):
+        self._done = True
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        self.interaction.messages.append(content if content is not None else kwargs.get("embed"))
+        if kwargs.get("view") is not None:
+            self.interaction.views.append(kwargs["view"])
+
+
+class FakeInteraction:
+    def __init__(self, user: FakeUser):
+        self.user = user
+        self.response = FakeResponse()
+        self.followup = FakeFollowup(self)
+        self.extras = {}
+        self.messages = []
+        self.views = []
+
+    async def edit_original_response(self, **kwargs):
+        self.messages.append(kwargs.get("content"))
+
+
+def _percentile(ordered: list, q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "?"
+
+
+class Benchmark:
+    def __init__(self, players: int, iterations: int, concurrency: int):
+        import db
+        self.db = db
+        self.players = [FakeUser(BASE_ID + i, f"{PREFIX}-jugador-{i}") for i in range(1, players + 1)]
+        self.admin = FakeUser(BASE_ID, f"{PREFIX}-admin")
+        self.iterations = iterations
+        self.concurrency = concurrency
+        self.belen_ids = []
+        self.item_names = []
+        self.tarea_ids = []
+        self.join_requests = []
+
+    def seed(self) -> None:
+        db = self.db
+        db.ensure_player(self.admin.id, self.admin.display_name)
+        db.add_admin(self.admin.id)
+        for player in self.players:
+            db.ensure_player(player.id, player.display_name)
+            db.update_monedas(player.id, 10 ** 6)
+        for i in range(20):
+            name = f"{PREFIX}-pieza-{i}"
+            if not db.get_store_item(name):
+                db.create_store_item(name, 5 + i, f"Pieza de prueba {i}")
+            self.item_names.append(name)
+        existing = {t['nombre']: t['id'] for t in db.list_tareas()}
+        for i in range(20):
+            name = f"{PREFIX}-tarea-{i}"
+            self.tarea_ids.append(existing.get(name) or db.create_tarea(name, "Tarea de prueba", 10 + i))
+        half = len(self.players) // 2
+        self.creators = self.players[:half]
+        self.joiners = self.players[half:]
+        for creator in self.creators:
+            belen = db.get_user_belen(creator.id)
+            if belen is None:
+                belen_id = db.create_belen(f"{PREFIX}-belen-{creator.id}", creator.id, "Belén de prueba")
+            else:
+                belen_id = belen['id']
+            self.belen_ids.append((creator, belen_id))
+
+    def prepare_join_requests(self, count: int) -> None:
+        db = self.db
+        self.join_requests = []
+        pairs = itertools.cycle(itertools.product(self.belen_ids, self.joiners))
+        for _ in range(count):
+            (creator, belen_id), joiner = next(pairs)
+            self.join_requests.append((creator, db.create_join_request(belen_id, joiner.id)))
+
+    def scenarios(self):
+        players = itertools.cycle(self.players)
+        creators = itertools.cycle(self.creators)
+        items = itertools.cycle(self.item_names)
+        tareas = itertools.cycle(self.tarea_ids)
+        belen_names = itertools.cycle([f"{PREFIX}-belen-{creator.id}" for creator, _ in self.belen_ids])
+        joiners = itertools.cycle(self.joiners)
+        requests = iter(self.join_requests)
+
+        def aceptar():
+            creator, request_id = next(requests)
+            return creator, {"solicitud_id": request_id}
+
+        return {
+            "ayuda": lambda: (next(players), {}),
+            "monedas": lambda: (next(players), {}),
+            "ver_belen": lambda: (next(creators), {}),
+            "tienda": lambda: (next(players), {}),
+            "tareas": lambda: (next(players), {}),
+            "tienda_comprar": lambda: (next(creators), {"pieza": next(items), "cantidad": 1}),
+            "unirse_belen": lambda: (next(joiners), {"identificador": next(belen_names)}),
+            "aceptar_solicitud": aceptar,
+            "agregar_tarea": lambda: (next(players), {"tarea_id": next(tareas)}),
+            "admin_ver_solicitudes_tareas": lambda: (self.admin, {}),
+        }
+
+    async def _invoke(self, command, user: FakeUser, kwargs: dict, latencies: list, errors: list):
+        interaction = FakeInteraction(user)
+        start = time.perf_counter()
+        try:
+            await command.callback(interaction, **kwargs)
+            for view in interaction.views:
+                confirm = getattr(view, "confirm", None)
+                if confirm is not None:
+                    await confirm.callback(FakeInteraction(user))
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+        latencies.append(time.perf_counter() - start)
+
+    async def run_command(self, name: str, factory) -> dict:
+        import aiodb
+        import bot
+        from profiler import profiler
+        command = bot.bot.tree.get_command(name)
+        if command is None:
+            raise SystemExit(f"Comando desconocido: {name}")
+        semaphore = asyncio.Semaphore(self.concurrency)
+        latencies = []
+        errors = []
+
+        async def one():
+            async with semaphore:
+                user, kwargs = factory()
+                await self._invoke(command, user, kwargs, latencies, errors)
+
+        queries_before = sum(entry["calls"] for entry in profiler.top(10 ** 6))
+        db_before = self._aiodb_calls()
+        coalesced_before = aiodb.stats["coalesced"]
+        start = time.perf_counter()
+        await asyncio.gather(*[one() for _ in range(self.iterations)])
+        elapsed = time.perf_counter() - start
+        db_calls = self._aiodb_calls() - db_before
+        coalesced = aiodb.stats["coalesced"] - coalesced_before
+        queries = sum(entry["calls"] for entry in profiler.top(10 ** 6)) - queries_before
+        ordered = sorted(latencies)
+        return {
+            "invocations": len(latencies),
+            "errors": len(errors),
+            "error_samples": sorted(set(errors))[:5],
+            "elapsed_s": round(elapsed, 4),
+            "commands_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": {
+                "p50": round(_percentile(ordered, 0.5) * 1000, 3),
+                "p95": round(_percentile(ordered, 0.95) * 1000, 3),
+                "p99": round(_percentile(ordered, 0.99) * 1000, 3),
+                "max": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+            },
+            "db_calls_per_command": round(db_calls / len(latencies), 2) if latencies else 0.0,
+            "queries_per_command": round(queries / len(latencies), 2) if latencies else 0.0,
+            "coalesced_reads": coalesced,
+        }
+
+    async def check_concurrent_purchases(self, attempts: int, affordable: int) -> dict:
+        import bot
+        db = self.db
+        buyer = FakeUser(BASE_ID + len(self.players) + 1, f"{PREFIX}-comprador")
+        await asyncio.to_thread(db.ensure_player, buyer.id, buyer.display_name)
+        if await asyncio.to_thread(db.get_user_belen, buyer.id) is None:
+            await asyncio.to_thread(db.create_belen, f"{PREFIX}-belen-{buyer.id}", buyer.id, "Belén de prueba")
+        item = db.get_store_item(self.item_names[0])
+        start_balance = affordable * item['precio']
+        await asyncio.to_thread(db.update_monedas, buyer.id, start_balance - await asyncio.to_thread(db.get_monedas, buyer.id))
+
+        command = bot.bot.tree.get_command("tienda_comprar")
+        interactions = [FakeInteraction(buyer) for _ in range(attempts)]
+        await asyncio.gather(*[command.callback(interaction, pieza=item['nombre'], cantidad=1) for interaction in interactions])
+        confirms = [view.confirm for interaction in interactions for view in interaction.views if getattr(view, "confirm", None)]
+        clicks = [FakeInteraction(buyer) for _ in confirms]
+        await asyncio.gather(*[confirm.callback(click) for confirm, click in zip(confirms, clicks)])
+
+        succeeded = sum(1 for click in clicks if any(str(message).startswith("✅") for message in click.messages))
+        final_balance = await asyncio.to_thread(db.get_monedas, buyer.id)
+        return {
+            "attempts": attempts,
+            "confirmed": len(confirms),
+            "affordable": affordable,
+            "succeeded": succeeded,
+            "start_balance": start_balance,
+            "final_balance": final_balance,
+            "ok": succeeded == affordable and final_balance == start_balance - succeeded * item['precio'] and final_balance >= 0,
+        }
+
+    def _aiodb_calls(self) -> int:
+        import metrics
+        return metrics.counter_value("botevento_db_calls_total")
+
+    async def run(self, names: list) -> dict:
+        from profiler import profiler
+        profiler.enabled = True
+        results = {}
+        factories = self.scenarios()
+        for name in names:
+            if name == "aceptar_solicitud":
+                await asyncio.to_thread(self.prepare_join_requests, self.iterations)
+                factories = self.scenarios()
+            results[name] = await self.run_command(name, factories[name])
+            print(f"{name:32s} {results[name]['commands_per_s']:9.1f} cmd/s  "
+                  f"p50 {results[name]['latency_ms']['p50']:8.2f} ms  p99 {results[name]['latency_ms']['p99']:8.2f} ms  "
+                  f"{results[name]['queries_per_command']:5.2f} consultas/cmd  {results[name]['errors']} errores")
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline de los comandos del bot contra una base de datos local")
+    parser.add_argument("--backend", choices=("postgres", "memory"), default=os.environ.get("DB_BACKEND", "postgres"))
+    parser.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="Base de datos de pruebas (por defecto DATABASE_URL)")
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=200, help="Invocaciones por comando")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--commands", default=None, help="Lista separada por comas (por defecto todos)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--label", default="", help="Etiqueta para comparar ejecuciones")
+    parser.add_argument("--purchase-race", type=int, default=0, metavar="N",
+                        help="Lanza N compras a la vez con saldo solo para --purchase-race-affordable y comprueba el resultado")
+    parser.add_argument("--purchase-race-affordable", type=int, default=5, metavar="K")
+    args = parser.parse_args(argv)
+
+    if args.backend == "postgres" and not args.dsn:
+        parser.error("Indica --dsn o DATABASE_URL (¡usa una base de datos de pruebas, el benchmark escribe datos!)")
+    os.environ["DB_BACKEND"] = args.backend
+    if args.dsn:
+        os.environ["DATABASE_URL"] = args.dsn
+
+    import db
+    import migrations
+    db.DATABASE_URL = args.dsn
+    migrations.migrate()
+
+    benchmark = Benchmark(args.players, args.iterations, args.concurrency)
+    benchmark.seed()
+    names = [name for name in args.commands.split(",") if name] if args.commands is not None else list(benchmark.scenarios())
+
+    async def run_all():
+        results = await benchmark.run(names)
+        if not args.purchase_race:
+            return results, None
+        return results, await benchmark.check_concurrent_purchases(args.purchase_race, args.purchase_race_affordable)
+
+    results, race = asyncio.run(run_all())
+    if race is not None:
+        print(f"{'✅' if race['ok'] else '❌'} compras concurrentes: {race['succeeded']} de {race['attempts']} con saldo para "
+              f"{race['affordable']}, saldo {race['start_balance']} → {race['final_balance']}")
+    report = {
+        "label": args.label,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": _git_revision(),
+        "python": sys.version.split()[0],
+        "config": {
+            "backend": args.backend,
+            "players": args.players,
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "db_pool_max": db.DB_POOL_MAX,
+        },
+        "pool": db.pool_stats(),
+        "results": results,
+        "purchase_race": race,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+    print(f"Resultados guardados en {args.output}")
+    if race is not None and not race['ok']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
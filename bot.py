@@ -1,45 +1,168 @@
-print(">>> Bot arrancando...")
+import time
+STARTED_AT = time.perf_counter()
 import os
+import asyncio
+import csv
+import functools
+import hashlib
+import io
+import json
+import tempfile
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 import db
-from views import ConfirmView, StorePaginatorView, TasksPaginatorView, PendingSubmissionsPaginatorView
+import aiodb
+import migrations
+import export
+import importer
+import metrics
+from profiler import DB_PROFILE, profiler
+from notifications import NotificationQueue
+from invalidation import InvalidationListener
+from users import UserResolver
+from views import ConfirmView, PaginatorButton, StorePaginator, TasksPaginator, PendingSubmissionsPaginator
 
 DISCORD_TOKEN = os.environ.get("DISCORD_TOKEN")
+PERMISSIONS_REFRESH_SECONDS = float(os.environ.get("PERMISSIONS_REFRESH_SECONDS", "300"))
+NOTIFY_CONCURRENCY = int(os.environ.get("NOTIFY_CONCURRENCY", "4"))
+NOTIFY_DIGEST_SECONDS = float(os.environ.get("NOTIFY_DIGEST_SECONDS", "60"))
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "1000"))
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "600"))
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9300"))
+BULK_CSV_MAX_BYTES = 1024 * 1024
+IMPORT_MAX_BYTES = 5 * 1024 * 1024
+FORCE_COMMAND_SYNC = os.environ.get("FORCE_COMMAND_SYNC", "").lower() in ("1", "true", "yes")
+ROLE_MEMBERS_INTENT = os.environ.get("ROLE_MEMBERS_INTENT", "").lower() in ("1", "true", "yes")
+CACHE_LISTEN = db.DB_BACKEND == "postgres" and os.environ.get("CACHE_LISTEN", "1").lower() not in ("0", "false", "no")
 
 intents = discord.Intents.default()
 intents.message_content = True
+intents.members = ROLE_MEMBERS_INTENT
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+class EventBot(commands.Bot):
+    async def close(self):
+        await notifier.stop()
+        await invalidations.stop()
+        await super().close()
 
-def check_blocked(user_id: int) -> bool:
-    return not db.is_blocked(user_id)
+bot = EventBot(command_prefix="!", intents=intents)
+users = UserResolver(bot, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+notifier = NotificationQueue(bot, concurrency=NOTIFY_CONCURRENCY, digest_window=NOTIFY_DIGEST_SECONDS, resolve_user=users.resolve)
+startup = {}
 
-def admin_only(user_id: int) -> bool:
-    return db.is_admin(user_id)
+async def reload_caches():
+    counts = await aiodb.refresh_all_caches()
+    print(f"Cachés recargadas tras reconectar la escucha: {counts}")
 
-def ensure_player_registered(user_id: int, username: str):
-    db.ensure_player(user_id, username)
+invalidations = InvalidationListener(db.DATABASE_URL, db.CACHE_CHANNEL, aiodb.apply_invalidation, origin=db.INSTANCE_ID, on_reconnect=reload_caches)
 
-@bot.event
-async def on_ready():
-    print(f"Bot conectado como {bot.user}")
+def player_command(admin: bool = False, ephemeral: bool = False):
+    def decorator(func):
+        @functools.wraps(func)
+        @metrics.instrument(func.__name__)
+        async def wrapper(interaction: discord.Interaction, *args, **kwargs):
+            await interaction.response.defer(ephemeral=ephemeral)
+            metrics.mark_deferred()
+            context = await aiodb.get_request_context(interaction.user.id, interaction.user.display_name)
+            context['is_admin'], context['is_blocked'] = await aiodb.get_permissions(interaction.user.id)
+            if admin and not context['is_admin']:
+                await interaction.followup.send("No tienes permisos de administrador.", ephemeral=True)
+                return
+            if not admin and context['is_blocked']:
+                await interaction.followup.send("Estás bloqueado y no puedes usar comandos.", ephemeral=True)
+                return
+            interaction.extras['player'] = context
+            return await func(interaction, *args, **kwargs)
+        return wrapper
+    return decorator
+
+async def belen_autocomplete(interaction: discord.Interaction, current: str):
+    return [app_commands.Choice(name=label[:100], value=str(belen_id)) for belen_id, label in db.search_belenes(current)]
+
+async def pieza_autocomplete(interaction: discord.Interaction, current: str):
+    return [app_commands.Choice(name=label[:100], value=str(item_id)) for item_id, label in db.search_store_items(current)]
+
+async def tarea_autocomplete(interaction: discord.Interaction, current: str):
+    return [app_commands.Choice(name=label[:100], value=tarea_id) for tarea_id, label in db.search_tareas(current)]
+
+@tasks.loop(seconds=PERMISSIONS_REFRESH_SECONDS)
+async def refresh_permissions():
+    if refresh_permissions.current_loop == 0:
+        return
+    try:
+        await aiodb.refresh_permission_caches()
+    except Exception as e:
+        print(f"Error refrescando permisos: {e}")
+
+def command_tree_hash() -> str:
+    commands_data = [command.to_dict(bot.tree) for command in sorted(bot.tree.get_commands(), key=lambda command: command.name)]
+    return hashlib.sha256(json.dumps(commands_data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+async def sync_commands_if_changed():
+    key = f"command_tree_hash:{bot.application_id}"
+    current = command_tree_hash()
+    if not FORCE_COMMAND_SYNC and await aiodb.get_setting(key) == current:
+        print(f"Comandos sin cambios ({current[:12]}), no se sincronizan")
+        return
+    start = time.perf_counter()
     try:
         synced = await bot.tree.sync()
-        print(f"Sincronizados {len(synced)} comandos")
     except Exception as e:
         print(f"Error sincronizando comandos: {e}")
+        return
+    await aiodb.set_setting(key, current)
+    startup['command_sync_seconds'] = time.perf_counter() - start
+    print(f"Sincronizados {len(synced)} comandos en {startup['command_sync_seconds']:.2f}s ({current[:12]})")
+
+@bot.event
+async def setup_hook():
+    applied = await aiodb.run(migrations.migrate)
+    if applied:
+        print(f"Migraciones aplicadas: {', '.join(map(str, applied))}")
+    if CACHE_LISTEN:
+        if await invalidations.start():
+            print(f"Escuchando invalidaciones en '{db.CACHE_CHANNEL}'")
+        else:
+            print("No se pudo iniciar la escucha de invalidaciones, se reintentará en segundo plano")
+    counts = await aiodb.refresh_permission_caches()
+    print(f"Permisos cargados: {counts['admins']} admins, {counts['blocked']} bloqueados")
+    items = await aiodb.list_store_items()
+    print(f"Catálogo cargado: {len(items)} piezas")
+    counts = await aiodb.refresh_search_indexes()
+    print(f"Índices de búsqueda: {counts['belenes']} belenes, {counts['piezas']} piezas, {counts['tareas']} tareas")
+    bot.add_dynamic_items(PaginatorButton)
+    await sync_commands_if_changed()
+    refresh_permissions.start()
+    notifier.start()
+    metrics.register_gauges("botevento_db_pool", db.pool_stats)
+    metrics.register_gauges("botevento_notifications", lambda: notifier.stats)
+    metrics.register_gauges("botevento_user_cache", lambda: users.stats)
+    metrics.register_gauges("botevento_startup", lambda: startup)
+    metrics.register_gauges("botevento_cache_invalidation", lambda: invalidations.stats)
+    metrics.register_gauges("botevento_read_coalescing", lambda: aiodb.stats)
+    if METRICS_PORT:
+        await metrics.start_server(METRICS_HOST, METRICS_PORT)
+        print(f"Métricas en http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+@bot.event
+async def on_ready():
+    if 'ready_seconds' not in startup:
+        startup['ready_seconds'] = time.perf_counter() - STARTED_AT
+        print(f"Bot conectado como {bot.user} en {startup['ready_seconds']:.2f}s")
+    else:
+        print(f"Bot reconectado como {bot.user}")
+
+@bot.event
+async def on_interaction(interaction: discord.Interaction):
+    if 'first_command_seconds' not in startup and interaction.type == discord.InteractionType.application_command:
+        startup['first_command_seconds'] = time.perf_counter() - STARTED_AT
+        print(f"Primer comando (/{interaction.command.name if interaction.command else '?'}) a los {startup['first_command_seconds']:.2f}s del arranque")
 
 @bot.tree.command(name="ayuda", description="Muestra todos los comandos disponibles")
+@player_command()
 async def ayuda(interaction: discord.Interaction):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not check_blocked(interaction.user.id):
-        await interaction.followup.send("Estás bloqueado y no puedes usar comandos.", ephemeral=True)
-        return
-
     embed = discord.Embed(
         title="🎄 Ayuda - Bot de Belén Colaborativo",
         description="Construye un Belén junto con otros usuarios.",
@@ -70,25 +193,19 @@ async def ayuda(interaction: discord.Interaction):
         inline=False
     )
     
-    if db.is_admin(interaction.user.id):
+    if interaction.extras['player']['is_admin']:
         embed.add_field(
             name="⚙️ Comandos de Admin",
-            value="**Usuarios:** `/agregar_admin`, `/admin_bloquear`, `/admin_desbloquear`, `/admin_dar_monedas`, `/admin_quitar_monedas`\n**Belenes:** `/admin_eliminar_belen`\n**Tienda:** `/admin_agregar_producto`, `/admin_modificar_producto`, `/admin_eliminar_producto`\n**Tareas:** `/admin_agregar_tarea`, `/admin_modificar_tarea`, `/admin_eliminar_tarea`, `/admin_aceptar_tarea`, `/admin_rechazar_tarea`, `/admin_ver_solicitudes_tareas`",
+            value="**Usuarios:** `/agregar_admin`, `/admin_bloquear`, `/admin_desbloquear`, `/admin_dar_monedas`, `/admin_quitar_monedas`, `/admin_dar_monedas_masivo`, `/admin_quitar_monedas_masivo`\n**Belenes:** `/admin_eliminar_belen`\n**Tienda:** `/admin_agregar_producto`, `/admin_modificar_producto`, `/admin_eliminar_producto`, `/admin_importar`\n**Tareas:** `/admin_agregar_tarea`, `/admin_modificar_tarea`, `/admin_eliminar_tarea`, `/admin_aceptar_tarea`, `/admin_rechazar_tarea`, `/admin_revisar_tareas`, `/admin_ver_solicitudes_tareas`\n**Sistema:** `/admin_estado_db`, `/admin_verificar_contribuciones`, `/admin_perfil_sql`, `/admin_exportar`",
             inline=False
         )
     
     await interaction.followup.send(embed=embed)
 
 @bot.tree.command(name="monedas", description="Muestra tu saldo de monedas")
+@player_command()
 async def monedas(interaction: discord.Interaction):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not check_blocked(interaction.user.id):
-        await interaction.followup.send("Estás bloqueado y no puedes usar comandos.", ephemeral=True)
-        return
-    
-    saldo = db.get_monedas(interaction.user.id)
+    saldo = interaction.extras['player']['monedas']
     embed = discord.Embed(
         title="💰 Tu Saldo",
         description=f"Tienes **{saldo}** 🪙 monedas",
@@ -98,20 +215,14 @@ async def monedas(interaction: discord.Interaction):
 
 @bot.tree.command(name="crear_belen", description="Crea tu propio belén")
 @app_commands.describe(nombre="Nombre del belén", descripcion="Descripción opcional del belén")
+@player_command()
 async def crear_belen(interaction: discord.Interaction, nombre: str, descripcion: str = None):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not check_blocked(interaction.user.id):
-        await interaction.followup.send("Estás bloqueado y no puedes usar comandos.", ephemeral=True)
-        return
-    
-    existing = db.get_user_belen(interaction.user.id)
+    existing = await aiodb.get_user_belen(interaction.user.id)
     if existing:
         await interaction.followup.send(f"Ya perteneces al belén **{existing['nombre']}**. Debes salir primero.", ephemeral=True)
         return
     
-    existing_name = db.find_belen(nombre)
+    existing_name = await aiodb.find_belen(nombre)
     if existing_name:
         await interaction.followup.send(f"Ya existe un belén con el nombre **{nombre}**.", ephemeral=True)
         return
@@ -126,7 +237,7 @@ async def crear_belen(interaction: discord.Interaction, nombre: str, descripcion
     
     async def on_confirm(inter: discord.Interaction):
         await inter.response.defer()
-        belen_id = db.create_belen(nombre, interaction.user.id, descripcion)
+        belen_id = await aiodb.create_belen(nombre, interaction.user.id, descripcion)
         await inter.edit_original_response(
             content=f"✅ Belén **{nombre}** creado con éxito (ID: {belen_id}). ¡Ya eres miembro!",
             embed=None,
@@ -141,49 +252,34 @@ async def crear_belen(interaction: discord.Interaction, nombre: str, descripcion
 
 @bot.tree.command(name="unirse_belen", description="Solicita unirte a un belén")
 @app_commands.describe(identificador="ID o nombre del belén")
+@app_commands.autocomplete(identificador=belen_autocomplete)
+@player_command()
 async def unirse_belen(interaction: discord.Interaction, identificador: str):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not check_blocked(interaction.user.id):
-        await interaction.followup.send("Estás bloqueado y no puedes usar comandos.", ephemeral=True)
-        return
-    
-    existing = db.get_user_belen(interaction.user.id)
+    existing = await aiodb.get_user_belen(interaction.user.id)
     if existing:
         await interaction.followup.send(f"Ya perteneces al belén **{existing['nombre']}**. Debes salir primero.", ephemeral=True)
         return
     
-    belen = db.find_belen(identificador)
+    belen = await aiodb.find_belen(identificador)
     if not belen:
         await interaction.followup.send("No se encontró ese belén.", ephemeral=True)
         return
     
-    request_id = db.create_join_request(belen['id'], interaction.user.id)
+    request_id = await aiodb.create_join_request(belen['id'], interaction.user.id)
     
-    try:
-        creator = await bot.fetch_user(belen['creador_id'])
-        embed = discord.Embed(
-            title="📨 Nueva solicitud de unión",
-            description=f"**{interaction.user.display_name}** quiere unirse a tu belén **{belen['nombre']}**.\n\nUsa `/aceptar_solicitud {request_id}` para aceptar o `/rechazar_solicitud {request_id}` para rechazar.",
-            color=discord.Color.blue()
-        )
-        await creator.send(embed=embed)
-        await interaction.followup.send(f"✅ Solicitud enviada al creador del belén **{belen['nombre']}** (ID solicitud: {request_id}).")
-    except:
-        await interaction.followup.send(f"✅ Solicitud creada (ID: {request_id}), pero no se pudo notificar al creador. Dile manualmente que revise las solicitudes.")
+    notifier.notify_digest(
+        belen['creador_id'],
+        f"solicitudes:{belen['id']}",
+        "📨 Nuevas solicitudes de unión",
+        f"**{interaction.user.display_name}** quiere unirse a tu belén **{belen['nombre']}**.\nUsa `/aceptar_solicitud {request_id}` para aceptar o `/rechazar_solicitud {request_id}` para rechazar."
+    )
+    await interaction.followup.send(f"✅ Solicitud enviada al creador del belén **{belen['nombre']}** (ID solicitud: {request_id}).")
 
 @bot.tree.command(name="aceptar_solicitud", description="Acepta una solicitud de unión a tu belén")
 @app_commands.describe(solicitud_id="ID de la solicitud")
+@player_command()
 async def aceptar_solicitud(interaction: discord.Interaction, solicitud_id: int):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not check_blocked(interaction.user.id):
-        await interaction.followup.send("Estás bloqueado y no puedes usar comandos.", ephemeral=True)
-        return
-    
-    request = db.get_join_request(solicitud_id)
+    request = await aiodb.get_join_request(solicitud_id)
     if not request:
         await interaction.followup.send("Solicitud no encontrada.", ephemeral=True)
         return
@@ -192,31 +288,21 @@ async def aceptar_solicitud(interaction: discord.Interaction, solicitud_id: int)
         await interaction.followup.send("Esta solicitud ya fue procesada.", ephemeral=True)
         return
     
-    if request['creador_id'] != interaction.user.id and not db.is_admin(interaction.user.id):
+    if request['creador_id'] != interaction.user.id and not interaction.extras['player']['is_admin']:
         await interaction.followup.send("No tienes permiso para gestionar esta solicitud.", ephemeral=True)
         return
     
-    if db.accept_join_request(solicitud_id):
+    if await aiodb.accept_join_request(solicitud_id):
         await interaction.followup.send(f"✅ **{request['username']}** ha sido aceptado en el belén **{request['belen_nombre']}**.")
-        try:
-            user = await bot.fetch_user(request['jugador_id'])
-            await user.send(f"🎉 Tu solicitud para unirte al belén **{request['belen_nombre']}** ha sido aceptada.")
-        except:
-            pass
+        notifier.notify(request['jugador_id'], f"🎉 Tu solicitud para unirte al belén **{request['belen_nombre']}** ha sido aceptada.")
     else:
         await interaction.followup.send("Error al procesar la solicitud.", ephemeral=True)
 
 @bot.tree.command(name="rechazar_solicitud", description="Rechaza una solicitud de unión")
 @app_commands.describe(solicitud_id="ID de la solicitud")
+@player_command()
 async def rechazar_solicitud(interaction: discord.Interaction, solicitud_id: int):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not check_blocked(interaction.user.id):
-        await interaction.followup.send("Estás bloqueado y no puedes usar comandos.", ephemeral=True)
-        return
-    
-    request = db.get_join_request(solicitud_id)
+    request = await aiodb.get_join_request(solicitud_id)
     if not request:
         await interaction.followup.send("Solicitud no encontrada.", ephemeral=True)
         return
@@ -225,30 +311,20 @@ async def rechazar_solicitud(interaction: discord.Interaction, solicitud_id: int
         await interaction.followup.send("Esta solicitud ya fue procesada.", ephemeral=True)
         return
     
-    if request['creador_id'] != interaction.user.id and not db.is_admin(interaction.user.id):
+    if request['creador_id'] != interaction.user.id and not interaction.extras['player']['is_admin']:
         await interaction.followup.send("No tienes permiso para gestionar esta solicitud.", ephemeral=True)
         return
     
-    if db.reject_join_request(solicitud_id):
+    if await aiodb.reject_join_request(solicitud_id):
         await interaction.followup.send(f"❌ Solicitud de **{request['username']}** rechazada.")
-        try:
-            user = await bot.fetch_user(request['jugador_id'])
-            await user.send(f"😔 Tu solicitud para unirte al belén **{request['belen_nombre']}** ha sido rechazada.")
-        except:
-            pass
+        notifier.notify(request['jugador_id'], f"😔 Tu solicitud para unirte al belén **{request['belen_nombre']}** ha sido rechazada.")
     else:
         await interaction.followup.send("Error al procesar la solicitud.", ephemeral=True)
 
 @bot.tree.command(name="salir_belen", description="Sal de tu belén actual")
+@player_command()
 async def salir_belen(interaction: discord.Interaction):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not check_blocked(interaction.user.id):
-        await interaction.followup.send("Estás bloqueado y no puedes usar comandos.", ephemeral=True)
-        return
-    
-    belen = db.get_user_belen(interaction.user.id)
+    belen = await aiodb.get_user_belen(interaction.user.id)
     if not belen:
         await interaction.followup.send("No perteneces a ningún belén.", ephemeral=True)
         return
@@ -270,7 +346,7 @@ async def salir_belen(interaction: discord.Interaction):
     
     async def on_confirm(inter: discord.Interaction):
         await inter.response.defer()
-        result = db.leave_belen(interaction.user.id)
+        result = await aiodb.leave_belen(interaction.user.id)
         if result:
             if result['deleted']:
                 await inter.edit_original_response(content=f"🗑️ El belén **{belen['nombre']}** ha sido eliminado.", embed=None, view=None)
@@ -285,23 +361,26 @@ async def salir_belen(interaction: discord.Interaction):
     view = ConfirmView(interaction.user.id, on_confirm, on_cancel)
     await interaction.followup.send(embed=embed, view=view)
 
+def format_buyers(piece) -> str:
+    buyers = ", ".join(piece['compradores'])
+    others = piece['num_compradores'] - len(piece['compradores'])
+    if others > 0:
+        buyers += f" y {others} más"
+    return buyers
+
 @bot.tree.command(name="ver_belen", description="Ver información de tu belén")
+@player_command()
 async def ver_belen(interaction: discord.Interaction):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not check_blocked(interaction.user.id):
-        await interaction.followup.send("Estás bloqueado y no puedes usar comandos.", ephemeral=True)
-        return
-    
-    belen = db.get_user_belen(interaction.user.id)
+    belen = await aiodb.get_user_belen(interaction.user.id)
     if not belen:
         await interaction.followup.send("No perteneces a ningún belén.", ephemeral=True)
         return
     
-    pieces = db.get_belen_pieces(belen['id'])
-    members = db.get_belen_members(belen['id'])
-    pending_requests = db.get_pending_requests_for_belen(belen['id'])
+    pieces, members, pending_requests = await asyncio.gather(
+        aiodb.get_belen_pieces(belen['id']),
+        aiodb.get_belen_members(belen['id']),
+        aiodb.get_pending_requests_for_belen(belen['id'])
+    )
     
     embed = discord.Embed(
         title=f"🏠 Belén: {belen['nombre']} (ID: {belen['id']})",
@@ -309,10 +388,10 @@ async def ver_belen(interaction: discord.Interaction):
         color=discord.Color.green()
     )
     
-    if pieces:
-        pieces_text = "\n".join([f"{p['emoji']} {p['nombre']} x{p['cantidad']} (por {p['comprador']})" for p in pieces[:10]])
-        if len(pieces) > 10:
-            pieces_text += f"\n... y {len(pieces) - 10} más"
+    if pieces['pieces']:
+        pieces_text = "\n".join([f"{p['emoji']} {p['nombre']} x{p['cantidad']} (por {format_buyers(p)})" for p in pieces['pieces']])
+        if pieces['total'] > len(pieces['pieces']):
+            pieces_text += f"\n... y {pieces['total'] - len(pieces['pieces'])} más"
         embed.add_field(name="🎁 Piezas Compradas", value=pieces_text, inline=False)
     else:
         embed.add_field(name="🎁 Piezas Compradas", value="Ninguna todavía", inline=False)
@@ -328,17 +407,10 @@ async def ver_belen(interaction: discord.Interaction):
     await interaction.followup.send(embed=embed)
 
 @bot.tree.command(name="tienda", description="Ver el catálogo de piezas")
+@player_command()
 async def tienda(interaction: discord.Interaction):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not check_blocked(interaction.user.id):
-        await interaction.followup.send("Estás bloqueado y no puedes usar comandos.", ephemeral=True)
-        return
-    
-    items = db.list_store_items()
-    view = StorePaginatorView(items, interaction.user.id)
-    await interaction.followup.send(embed=view.get_embed(), view=view)
+    embed, view = await StorePaginator(interaction.user.id).render()
+    await interaction.followup.send(embed=embed, view=view)
 
 @bot.tree.command(name="tienda_comprar", description="Compra una pieza para tu belén")
 @app_commands.describe(
@@ -346,26 +418,21 @@ async def tienda(interaction: discord.Interaction):
     cantidad="Cantidad a comprar",
     belen="ID o nombre del belén (opcional si solo perteneces a uno)"
 )
+@app_commands.autocomplete(pieza=pieza_autocomplete, belen=belen_autocomplete)
+@player_command()
 async def tienda_comprar(interaction: discord.Interaction, pieza: str, cantidad: int = 1, belen: str = None):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not check_blocked(interaction.user.id):
-        await interaction.followup.send("Estás bloqueado y no puedes usar comandos.", ephemeral=True)
-        return
-    
     if cantidad < 1:
         await interaction.followup.send("La cantidad debe ser al menos 1.", ephemeral=True)
         return
     
-    user_belen = db.get_user_belen(interaction.user.id)
+    user_belen = await aiodb.get_user_belen(interaction.user.id)
     if not user_belen:
         await interaction.followup.send("Debes pertenecer a un belén para comprar piezas.", ephemeral=True)
         return
     
     target_belen = user_belen
     if belen:
-        target_belen = db.find_belen(belen)
+        target_belen = await aiodb.find_belen(belen)
         if not target_belen:
             await interaction.followup.send("No se encontró ese belén.", ephemeral=True)
             return
@@ -373,13 +440,13 @@ async def tienda_comprar(interaction: discord.Interaction, pieza: str, cantidad:
             await interaction.followup.send("Solo puedes comprar piezas para tu propio belén.", ephemeral=True)
             return
     
-    item = db.get_store_item(pieza)
+    item = await aiodb.get_store_item(pieza)
     if not item:
         await interaction.followup.send("No se encontró esa pieza en la tienda.", ephemeral=True)
         return
     
     total_cost = item['precio'] * cantidad
-    current_balance = db.get_monedas(interaction.user.id)
+    current_balance = interaction.extras['player']['monedas']
     
     if current_balance < total_cost:
         await interaction.followup.send(f"No tienes suficientes monedas. Necesitas {total_cost} 🪙 pero tienes {current_balance} 🪙.", ephemeral=True)
@@ -395,8 +462,21 @@ async def tienda_comprar(interaction: discord.Interaction, pieza: str, cantidad:
     
     async def on_confirm(inter: discord.Interaction):
         await inter.response.defer()
-        new_balance = db.update_monedas(interaction.user.id, -total_cost)
-        db.record_purchase(target_belen['id'], item['id'], interaction.user.id, cantidad)
+        new_balance = await aiodb.purchase(interaction.user.id, target_belen['id'], item['id'], cantidad)
+        if isinstance(new_balance, db.PieceUnavailable):
+            await inter.edit_original_response(
+                content=f"La pieza **{item['nombre']}** ya no está disponible en la tienda.",
+                embed=None,
+                view=None
+            )
+            return
+        if isinstance(new_balance, db.InsufficientFunds):
+            await inter.edit_original_response(
+                content=f"No tienes suficientes monedas. Necesitas {new_balance.coste} 🪙 pero tienes {new_balance.monedas} 🪙.",
+                embed=None,
+                view=None
+            )
+            return
         await inter.edit_original_response(
             content=f"✅ Compraste **{cantidad}x {item['emoji']} {item['nombre']}** para el belén **{target_belen['nombre']}**. Saldo restante: {new_balance} 🪙",
             embed=None,
@@ -410,133 +490,195 @@ async def tienda_comprar(interaction: discord.Interaction, pieza: str, cantidad:
     await interaction.followup.send(embed=embed, view=view)
 
 @bot.tree.command(name="tareas", description="Ver tareas disponibles")
+@player_command()
 async def tareas(interaction: discord.Interaction):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not check_blocked(interaction.user.id):
-        await interaction.followup.send("Estás bloqueado y no puedes usar comandos.", ephemeral=True)
-        return
-    
-    tasks = db.get_available_tareas(interaction.user.id)
-    view = TasksPaginatorView(tasks, interaction.user.id)
-    await interaction.followup.send(embed=view.get_embed(), view=view)
+    embed, view = await TasksPaginator(interaction.user.id).render()
+    await interaction.followup.send(embed=embed, view=view)
 
 @bot.tree.command(name="agregar_tarea", description="Envía una tarea completada para revisión")
 @app_commands.describe(tarea_id="ID de la tarea", nota="Nota o evidencia opcional")
+@app_commands.autocomplete(tarea_id=tarea_autocomplete)
+@player_command()
 async def agregar_tarea(interaction: discord.Interaction, tarea_id: int, nota: str = None):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not check_blocked(interaction.user.id):
-        await interaction.followup.send("Estás bloqueado y no puedes usar comandos.", ephemeral=True)
-        return
-    
-    tarea = db.get_tarea(tarea_id)
+    tarea = await aiodb.get_tarea(tarea_id)
     if not tarea:
         await interaction.followup.send("No se encontró esa tarea.", ephemeral=True)
         return
     
-    if db.has_pending_submission(tarea_id, interaction.user.id):
+    if await aiodb.has_pending_submission(tarea_id, interaction.user.id):
         await interaction.followup.send("Ya tienes una solicitud pendiente para esta tarea.", ephemeral=True)
         return
     
-    submission_id = db.submit_tarea(tarea_id, interaction.user.id, nota)
+    submission_id = await aiodb.submit_tarea(tarea_id, interaction.user.id, nota)
     await interaction.followup.send(f"✅ Solicitud de tarea **{tarea['nombre']}** enviada para revisión (ID: {submission_id}). Un administrador la revisará pronto.")
 
 @bot.tree.command(name="agregar_admin", description="[ADMIN] Añade un administrador")
 @app_commands.describe(usuario="Usuario a hacer admin")
+@player_command(admin=True)
 async def agregar_admin(interaction: discord.Interaction, usuario: discord.User):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not admin_only(interaction.user.id):
-        await interaction.followup.send("No tienes permisos de administrador.", ephemeral=True)
-        return
-    
-    db.ensure_player(usuario.id, usuario.display_name)
-    if db.add_admin(usuario.id):
+    await aiodb.ensure_player(usuario.id, usuario.display_name)
+    if await aiodb.add_admin(usuario.id):
         await interaction.followup.send(f"✅ **{usuario.display_name}** ahora es administrador.")
     else:
         await interaction.followup.send(f"**{usuario.display_name}** ya es administrador.", ephemeral=True)
 
 @bot.tree.command(name="admin_bloquear", description="[ADMIN] Bloquea a un usuario")
 @app_commands.describe(usuario="Usuario a bloquear", razon="Razón del bloqueo")
+@player_command(admin=True)
 async def admin_bloquear(interaction: discord.Interaction, usuario: discord.User, razon: str = None):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not admin_only(interaction.user.id):
-        await interaction.followup.send("No tienes permisos de administrador.", ephemeral=True)
-        return
-    
-    db.ensure_player(usuario.id, usuario.display_name)
-    if db.block_user(usuario.id, razon):
+    await aiodb.ensure_player(usuario.id, usuario.display_name)
+    if await aiodb.block_user(usuario.id, razon):
         await interaction.followup.send(f"🚫 **{usuario.display_name}** ha sido bloqueado.")
     else:
         await interaction.followup.send(f"**{usuario.display_name}** ya estaba bloqueado.", ephemeral=True)
 
 @bot.tree.command(name="admin_desbloquear", description="[ADMIN] Desbloquea a un usuario")
 @app_commands.describe(usuario="Usuario a desbloquear")
+@player_command(admin=True)
 async def admin_desbloquear(interaction: discord.Interaction, usuario: discord.User):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not admin_only(interaction.user.id):
-        await interaction.followup.send("No tienes permisos de administrador.", ephemeral=True)
-        return
-    
-    if db.unblock_user(usuario.id):
+    if await aiodb.unblock_user(usuario.id):
         await interaction.followup.send(f"✅ **{usuario.display_name}** ha sido desbloqueado.")
     else:
         await interaction.followup.send(f"**{usuario.display_name}** no estaba bloqueado.", ephemeral=True)
 
 @bot.tree.command(name="admin_dar_monedas", description="[ADMIN] Da monedas a un usuario")
 @app_commands.describe(usuario="Usuario", cantidad="Cantidad de monedas")
+@player_command(admin=True)
 async def admin_dar_monedas(interaction: discord.Interaction, usuario: discord.User, cantidad: int):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not admin_only(interaction.user.id):
-        await interaction.followup.send("No tienes permisos de administrador.", ephemeral=True)
-        return
-    
     if cantidad <= 0:
         await interaction.followup.send("La cantidad debe ser positiva.", ephemeral=True)
         return
     
-    db.ensure_player(usuario.id, usuario.display_name)
-    new_balance = db.update_monedas(usuario.id, cantidad)
+    await aiodb.ensure_player(usuario.id, usuario.display_name)
+    new_balance = await aiodb.update_monedas(usuario.id, cantidad)
     await interaction.followup.send(f"✅ Se han dado **{cantidad} 🪙** a **{usuario.display_name}**. Nuevo saldo: {new_balance} 🪙")
 
 @bot.tree.command(name="admin_quitar_monedas", description="[ADMIN] Quita monedas a un usuario")
 @app_commands.describe(usuario="Usuario", cantidad="Cantidad de monedas")
+@player_command(admin=True)
 async def admin_quitar_monedas(interaction: discord.Interaction, usuario: discord.User, cantidad: int):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not admin_only(interaction.user.id):
-        await interaction.followup.send("No tienes permisos de administrador.", ephemeral=True)
-        return
-    
     if cantidad <= 0:
         await interaction.followup.send("La cantidad debe ser positiva.", ephemeral=True)
         return
     
-    new_balance = db.update_monedas(usuario.id, -cantidad)
+    new_balance = await aiodb.update_monedas(usuario.id, -cantidad)
     await interaction.followup.send(f"✅ Se han quitado **{cantidad} 🪙** a **{usuario.display_name}**. Nuevo saldo: {new_balance} 🪙")
 
+def parse_coin_csv(text: str, cantidad: int = None):
+    deltas = {}
+    usernames = {}
+    errores = []
+    for number, row in enumerate(csv.reader(io.StringIO(text)), start=1):
+        if not row or not row[0].strip():
+            continue
+        user_id = row[0].strip().strip("<@!>")
+        amount = row[1].strip() if len(row) > 1 and row[1].strip() else None
+        if not user_id.isdigit() or (amount is not None and not amount.isdigit()):
+            if number > 1:
+                errores.append(number)
+            continue
+        amount = int(amount) if amount is not None else cantidad
+        if not amount:
+            errores.append(number)
+            continue
+        deltas[int(user_id)] = deltas.get(int(user_id), 0) + amount
+        if len(row) > 2 and row[2].strip():
+            usernames[int(user_id)] = row[2].strip()
+    return deltas, usernames, errores
+
+async def apply_bulk_coins(interaction: discord.Interaction, sign: int, cantidad: int, rol: discord.Role, belen: str, archivo: discord.Attachment):
+    if sum(target is not None for target in (rol, belen, archivo)) != 1:
+        await interaction.followup.send("Indica exactamente un destino: un rol, un belén o un archivo CSV.", ephemeral=True)
+        return
+    if cantidad is not None and cantidad <= 0:
+        await interaction.followup.send("La cantidad debe ser positiva.", ephemeral=True)
+        return
+    if cantidad is None and archivo is None:
+        await interaction.followup.send("Indica la cantidad de monedas.", ephemeral=True)
+        return
+    
+    errores = []
+    aviso = None
+    if belen:
+        target = await aiodb.find_belen(belen)
+        if not target:
+            await interaction.followup.send("No se encontró ese belén.", ephemeral=True)
+            return
+        summary = await aiodb.bulk_update_belen_monedas(target['id'], sign * cantidad)
+        destino = f"miembros del belén **{target['nombre']}**"
+    elif rol:
+        if ROLE_MEMBERS_INTENT:
+            holders = [member async for member in rol.guild.fetch_members(limit=None) if rol in member.roles]
+        else:
+            holders = rol.members
+            aviso = ("⚠️ Solo se incluyen los miembros que el bot tiene en caché. Para incluir a todos, activa el intent "
+                     "«Server Members» en el portal de desarrolladores de Discord y define ROLE_MEMBERS_INTENT=1.")
+        members = [member for member in holders if not member.bot]
+        if not members:
+            await interaction.followup.send(f"No hay miembros con el rol **{rol.name}**." + (f"\n{aviso}" if aviso else ""), ephemeral=True)
+            return
+        deltas = {member.id: sign * cantidad for member in members}
+        usernames = {member.id: member.display_name for member in members}
+        summary = await aiodb.bulk_update_monedas(deltas, usernames, create=sign > 0)
+        destino = f"rol **{rol.name}**, {summary['jugadores']} de {len(members)} miembros con el rol"
+    else:
+        if archivo.size > BULK_CSV_MAX_BYTES:
+            await interaction.followup.send("El archivo CSV es demasiado grande (máximo 1 MB).", ephemeral=True)
+            return
+        try:
+            text = (await archivo.read()).decode("utf-8-sig")
+        except UnicodeDecodeError:
+            await interaction.followup.send("El archivo debe ser un CSV en UTF-8.", ephemeral=True)
+            return
+        deltas, usernames, errores = parse_coin_csv(text, cantidad)
+        if not deltas:
+            await interaction.followup.send("El CSV no contiene filas válidas (`id_usuario,cantidad[,nombre]`).", ephemeral=True)
+            return
+        summary = await aiodb.bulk_update_monedas({user_id: sign * amount for user_id, amount in deltas.items()}, usernames, create=sign > 0)
+        destino = f"archivo **{archivo.filename}**"
+    
+    verbo = "dado" if sign > 0 else "quitado"
+    lines = [f"✅ Se han {verbo} **{abs(summary['total'])} 🪙** en total a **{summary['jugadores']}** jugadores ({destino})."]
+    if summary['nuevos']:
+        lines.append(f"Jugadores registrados por primera vez: {summary['nuevos']}")
+    if summary['omitidos']:
+        lines.append(f"Omitidos por no estar registrados: {summary['omitidos']}")
+    if aviso:
+        lines.append(aviso)
+    if errores:
+        lines.append(f"Líneas del CSV ignoradas: {', '.join(map(str, errores[:20]))}{'…' if len(errores) > 20 else ''}")
+    await interaction.followup.send("\n".join(lines))
+
+@bot.tree.command(name="admin_dar_monedas_masivo", description="[ADMIN] Da monedas a un rol, a un belén o a una lista CSV")
+@app_commands.describe(
+    cantidad="Monedas por jugador (en el CSV, solo para filas sin cantidad)",
+    rol="Rol cuyos miembros recibirán las monedas (sin ROLE_MEMBERS_INTENT, solo los que estén en caché)",
+    belen="ID o nombre del belén cuyos miembros recibirán las monedas",
+    archivo="CSV con columnas id_usuario,cantidad[,nombre]"
+)
+@app_commands.autocomplete(belen=belen_autocomplete)
+@player_command(admin=True)
+async def admin_dar_monedas_masivo(interaction: discord.Interaction, cantidad: int = None, rol: discord.Role = None, belen: str = None, archivo: discord.Attachment = None):
+    await apply_bulk_coins(interaction, 1, cantidad, rol, belen, archivo)
+
+@bot.tree.command(name="admin_quitar_monedas_masivo", description="[ADMIN] Quita monedas a un rol, a un belén o a una lista CSV")
+@app_commands.describe(
+    cantidad="Monedas por jugador (en el CSV, solo para filas sin cantidad)",
+    rol="Rol cuyos miembros perderán las monedas (sin ROLE_MEMBERS_INTENT, solo los que estén en caché)",
+    belen="ID o nombre del belén cuyos miembros perderán las monedas",
+    archivo="CSV con columnas id_usuario,cantidad[,nombre]"
+)
+@app_commands.autocomplete(belen=belen_autocomplete)
+@player_command(admin=True)
+async def admin_quitar_monedas_masivo(interaction: discord.Interaction, cantidad: int = None, rol: discord.Role = None, belen: str = None, archivo: discord.Attachment = None):
+    await apply_bulk_coins(interaction, -1, cantidad, rol, belen, archivo)
+
 @bot.tree.command(name="admin_eliminar_belen", description="[ADMIN] Elimina un belén")
 @app_commands.describe(identificador="ID o nombre del belén")
+@app_commands.autocomplete(identificador=belen_autocomplete)
+@player_command(admin=True)
 async def admin_eliminar_belen(interaction: discord.Interaction, identificador: str):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not admin_only(interaction.user.id):
-        await interaction.followup.send("No tienes permisos de administrador.", ephemeral=True)
-        return
-    
-    belen = db.find_belen(identificador)
+    belen = await aiodb.find_belen(identificador)
     if not belen:
         await interaction.followup.send("No se encontró ese belén.", ephemeral=True)
         return
@@ -549,7 +691,7 @@ async def admin_eliminar_belen(interaction: discord.Interaction, identificador:
     
     async def on_confirm(inter: discord.Interaction):
         await inter.response.defer()
-        if db.delete_belen(belen['id']):
+        if await aiodb.delete_belen(belen['id']):
             await inter.edit_original_response(content=f"🗑️ Belén **{belen['nombre']}** eliminado.", embed=None, view=None)
         else:
             await inter.edit_original_response(content="Error al eliminar el belén.", embed=None, view=None)
@@ -562,35 +704,24 @@ async def admin_eliminar_belen(interaction: discord.Interaction, identificador:
 
 @bot.tree.command(name="admin_agregar_producto", description="[ADMIN] Añade un producto a la tienda")
 @app_commands.describe(nombre="Nombre del producto", precio="Precio en monedas", descripcion="Descripción", emoji="Emoji del producto")
+@player_command(admin=True)
 async def admin_agregar_producto(interaction: discord.Interaction, nombre: str, precio: int, descripcion: str = None, emoji: str = "🎁"):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not admin_only(interaction.user.id):
-        await interaction.followup.send("No tienes permisos de administrador.", ephemeral=True)
-        return
-    
     if precio <= 0:
         await interaction.followup.send("El precio debe ser positivo.", ephemeral=True)
         return
     
     try:
-        item_id = db.create_store_item(nombre, precio, descripcion, emoji)
+        item_id = await aiodb.create_store_item(nombre, precio, descripcion, emoji)
         await interaction.followup.send(f"✅ Producto **{emoji} {nombre}** añadido a la tienda (ID: {item_id}).")
     except Exception as e:
         await interaction.followup.send(f"Error al crear el producto: {str(e)}", ephemeral=True)
 
 @bot.tree.command(name="admin_modificar_producto", description="[ADMIN] Modifica un producto")
 @app_commands.describe(identificador="ID o nombre del producto", nombre="Nuevo nombre", precio="Nuevo precio", descripcion="Nueva descripción", emoji="Nuevo emoji")
+@app_commands.autocomplete(identificador=pieza_autocomplete)
+@player_command(admin=True)
 async def admin_modificar_producto(interaction: discord.Interaction, identificador: str, nombre: str = None, precio: int = None, descripcion: str = None, emoji: str = None):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not admin_only(interaction.user.id):
-        await interaction.followup.send("No tienes permisos de administrador.", ephemeral=True)
-        return
-    
-    item = db.get_store_item(identificador)
+    item = await aiodb.get_store_item(identificador)
     if not item:
         await interaction.followup.send("No se encontró ese producto.", ephemeral=True)
         return
@@ -599,59 +730,43 @@ async def admin_modificar_producto(interaction: discord.Interaction, identificad
         await interaction.followup.send("El precio debe ser positivo.", ephemeral=True)
         return
     
-    if db.update_store_item(item['id'], nombre, precio, descripcion, emoji):
+    if await aiodb.update_store_item(item['id'], nombre, precio, descripcion, emoji):
         await interaction.followup.send(f"✅ Producto **{item['nombre']}** modificado.")
     else:
         await interaction.followup.send("No se realizaron cambios.", ephemeral=True)
 
 @bot.tree.command(name="admin_eliminar_producto", description="[ADMIN] Elimina un producto de la tienda")
 @app_commands.describe(identificador="ID o nombre del producto")
+@app_commands.autocomplete(identificador=pieza_autocomplete)
+@player_command(admin=True)
 async def admin_eliminar_producto(interaction: discord.Interaction, identificador: str):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not admin_only(interaction.user.id):
-        await interaction.followup.send("No tienes permisos de administrador.", ephemeral=True)
-        return
-    
-    item = db.get_store_item(identificador)
+    item = await aiodb.get_store_item(identificador)
     if not item:
         await interaction.followup.send("No se encontró ese producto.", ephemeral=True)
         return
     
-    if db.delete_store_item(item['id']):
+    if await aiodb.delete_store_item(item['id']):
         await interaction.followup.send(f"🗑️ Producto **{item['nombre']}** eliminado de la tienda.")
     else:
         await interaction.followup.send("Error al eliminar el producto.", ephemeral=True)
 
 @bot.tree.command(name="admin_agregar_tarea", description="[ADMIN] Añade una tarea")
 @app_commands.describe(nombre="Nombre de la tarea", descripcion="Descripción de la tarea", recompensa="Recompensa en monedas")
+@player_command(admin=True)
 async def admin_agregar_tarea(interaction: discord.Interaction, nombre: str, descripcion: str, recompensa: int):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not admin_only(interaction.user.id):
-        await interaction.followup.send("No tienes permisos de administrador.", ephemeral=True)
-        return
-    
     if recompensa <= 0:
         await interaction.followup.send("La recompensa debe ser positiva.", ephemeral=True)
         return
     
-    tarea_id = db.create_tarea(nombre, descripcion, recompensa)
+    tarea_id = await aiodb.create_tarea(nombre, descripcion, recompensa)
     await interaction.followup.send(f"✅ Tarea **{nombre}** creada (ID: {tarea_id}). Recompensa: {recompensa} 🪙")
 
 @bot.tree.command(name="admin_modificar_tarea", description="[ADMIN] Modifica una tarea")
 @app_commands.describe(tarea_id="ID de la tarea", nombre="Nuevo nombre", descripcion="Nueva descripción", recompensa="Nueva recompensa")
+@app_commands.autocomplete(tarea_id=tarea_autocomplete)
+@player_command(admin=True)
 async def admin_modificar_tarea(interaction: discord.Interaction, tarea_id: int, nombre: str = None, descripcion: str = None, recompensa: int = None):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not admin_only(interaction.user.id):
-        await interaction.followup.send("No tienes permisos de administrador.", ephemeral=True)
-        return
-    
-    tarea = db.get_tarea(tarea_id)
+    tarea = await aiodb.get_tarea(tarea_id)
     if not tarea:
         await interaction.followup.send("No se encontró esa tarea.", ephemeral=True)
         return
@@ -660,55 +775,37 @@ async def admin_modificar_tarea(interaction: discord.Interaction, tarea_id: int,
         await interaction.followup.send("La recompensa debe ser positiva.", ephemeral=True)
         return
     
-    if db.update_tarea(tarea_id, nombre, descripcion, recompensa):
+    if await aiodb.update_tarea(tarea_id, nombre, descripcion, recompensa):
         await interaction.followup.send(f"✅ Tarea **{tarea['nombre']}** modificada.")
     else:
         await interaction.followup.send("No se realizaron cambios.", ephemeral=True)
 
 @bot.tree.command(name="admin_eliminar_tarea", description="[ADMIN] Elimina una tarea")
 @app_commands.describe(tarea_id="ID de la tarea")
+@app_commands.autocomplete(tarea_id=tarea_autocomplete)
+@player_command(admin=True)
 async def admin_eliminar_tarea(interaction: discord.Interaction, tarea_id: int):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not admin_only(interaction.user.id):
-        await interaction.followup.send("No tienes permisos de administrador.", ephemeral=True)
-        return
-    
-    tarea = db.get_tarea(tarea_id)
+    tarea = await aiodb.get_tarea(tarea_id)
     if not tarea:
         await interaction.followup.send("No se encontró esa tarea.", ephemeral=True)
         return
     
-    if db.delete_tarea(tarea_id):
+    if await aiodb.delete_tarea(tarea_id):
         await interaction.followup.send(f"🗑️ Tarea **{tarea['nombre']}** eliminada.")
     else:
         await interaction.followup.send("Error al eliminar la tarea.", ephemeral=True)
 
 @bot.tree.command(name="admin_ver_solicitudes_tareas", description="[ADMIN] Ver solicitudes de tareas pendientes")
+@player_command(admin=True)
 async def admin_ver_solicitudes_tareas(interaction: discord.Interaction):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not admin_only(interaction.user.id):
-        await interaction.followup.send("No tienes permisos de administrador.", ephemeral=True)
-        return
-    
-    submissions = db.get_pending_tarea_submissions()
-    view = PendingSubmissionsPaginatorView(submissions, interaction.user.id)
-    await interaction.followup.send(embed=view.get_embed(), view=view)
+    embed, view = await PendingSubmissionsPaginator(interaction.user.id).render()
+    await interaction.followup.send(embed=embed, view=view)
 
 @bot.tree.command(name="admin_aceptar_tarea", description="[ADMIN] Acepta una solicitud de tarea")
 @app_commands.describe(solicitud_id="ID de la solicitud")
+@player_command(admin=True)
 async def admin_aceptar_tarea(interaction: discord.Interaction, solicitud_id: int):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not admin_only(interaction.user.id):
-        await interaction.followup.send("No tienes permisos de administrador.", ephemeral=True)
-        return
-    
-    submission = db.get_tarea_submission(solicitud_id)
+    submission = await aiodb.get_tarea_submission(solicitud_id)
     if not submission:
         await interaction.followup.send("Solicitud no encontrada.", ephemeral=True)
         return
@@ -717,28 +814,18 @@ async def admin_aceptar_tarea(interaction: discord.Interaction, solicitud_id: in
         await interaction.followup.send("Esta solicitud ya fue procesada.", ephemeral=True)
         return
     
-    result = db.approve_tarea_submission(solicitud_id)
+    result = await aiodb.approve_tarea_submission(solicitud_id)
     if result:
         await interaction.followup.send(f"✅ Tarea **{submission['tarea_nombre']}** aprobada. Se han dado **{result['recompensa']} 🪙** a **{submission['username']}**.")
-        try:
-            user = await bot.fetch_user(submission['jugador_id'])
-            await user.send(f"🎉 Tu tarea **{submission['tarea_nombre']}** ha sido aprobada. Has ganado **{result['recompensa']} 🪙**!")
-        except:
-            pass
+        notifier.notify(submission['jugador_id'], f"🎉 Tu tarea **{submission['tarea_nombre']}** ha sido aprobada. Has ganado **{result['recompensa']} 🪙**!")
     else:
         await interaction.followup.send("Error al procesar la solicitud.", ephemeral=True)
 
 @bot.tree.command(name="admin_rechazar_tarea", description="[ADMIN] Rechaza una solicitud de tarea")
 @app_commands.describe(solicitud_id="ID de la solicitud")
+@player_command(admin=True)
 async def admin_rechazar_tarea(interaction: discord.Interaction, solicitud_id: int):
-    await interaction.response.defer()
-    ensure_player_registered(interaction.user.id, interaction.user.display_name)
-    
-    if not admin_only(interaction.user.id):
-        await interaction.followup.send("No tienes permisos de administrador.", ephemeral=True)
-        return
-    
-    submission = db.get_tarea_submission(solicitud_id)
+    submission = await aiodb.get_tarea_submission(solicitud_id)
     if not submission:
         await interaction.followup.send("Solicitud no encontrada.", ephemeral=True)
         return
@@ -747,19 +834,242 @@ async def admin_rechazar_tarea(interaction: discord.Interaction, solicitud_id: i
         await interaction.followup.send("Esta solicitud ya fue procesada.", ephemeral=True)
         return
     
-    if db.reject_tarea_submission(solicitud_id):
+    if await aiodb.reject_tarea_submission(solicitud_id):
         await interaction.followup.send(f"❌ Tarea **{submission['tarea_nombre']}** de **{submission['username']}** rechazada.")
-        try:
-            user = await bot.fetch_user(submission['jugador_id'])
-            await user.send(f"😔 Tu tarea **{submission['tarea_nombre']}** ha sido rechazada.")
-        except:
-            pass
+        notifier.notify(submission['jugador_id'], f"😔 Tu tarea **{submission['tarea_nombre']}** ha sido rechazada.")
     else:
         await interaction.followup.send("Error al procesar la solicitud.", ephemeral=True)
 
+def parse_id_list(text: str, max_ids: int = 1000) -> list:
+    ids = set()
+    for part in text.replace(";", ",").replace(" ", ",").split(","):
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        if not start.isdigit() or (end and not end.isdigit()):
+            raise ValueError(part)
+        first, last = int(start), int(end or start)
+        if last < first or len(ids) + last - first + 1 > max_ids:
+            raise ValueError(part)
+        ids.update(range(first, last + 1))
+    return sorted(ids)
+
+@bot.tree.command(name="admin_revisar_tareas", description="[ADMIN] Aprueba o rechaza varias solicitudes de tareas a la vez")
+@app_commands.describe(
+    accion="Aprobar o rechazar",
+    solicitudes="IDs de solicitudes separados por comas, admite rangos (ej: 3,5,10-20)",
+    tarea_id="Revisa todas las solicitudes pendientes de esta tarea"
+)
+@app_commands.choices(accion=[
+    app_commands.Choice(name="Aprobar", value="aprobar"),
+    app_commands.Choice(name="Rechazar", value="rechazar"),
+])
+@app_commands.autocomplete(tarea_id=tarea_autocomplete)
+@player_command(admin=True)
+async def admin_revisar_tareas(interaction: discord.Interaction, accion: app_commands.Choice[str], solicitudes: str = None, tarea_id: int = None):
+    if (solicitudes is None) == (tarea_id is None):
+        await interaction.followup.send("Indica las solicitudes o una tarea, pero no ambas.", ephemeral=True)
+        return
+    
+    ids = []
+    if solicitudes is not None:
+        try:
+            ids = parse_id_list(solicitudes)
+        except ValueError as e:
+            await interaction.followup.send(f"Lista de solicitudes no válida cerca de `{e}` (máximo 1000 IDs).", ephemeral=True)
+            return
+        if not ids:
+            await interaction.followup.send("Indica al menos una solicitud.", ephemeral=True)
+            return
+    
+    aprobar = accion.value == "aprobar"
+    reviewed = await aiodb.review_tarea_submissions(aprobar, ids, tarea_id)
+    if not reviewed:
+        await interaction.followup.send("No había solicitudes pendientes que coincidan.", ephemeral=True)
+        return
+    
+    by_player = {}
+    for row in reviewed:
+        by_player.setdefault(row['jugador_id'], []).append(row)
+    for jugador_id, rows in by_player.items():
+        tareas = ", ".join(f"**{row['tarea_nombre']}**" for row in rows)
+        if aprobar:
+            notifier.notify(jugador_id, f"🎉 Se han aprobado tus tareas: {tareas}. Has ganado **{sum(row['recompensa'] for row in rows)} 🪙**!")
+        else:
+            notifier.notify(jugador_id, f"😔 Se han rechazado tus tareas: {tareas}.")
+    
+    embed = discord.Embed(
+        title=f"{'✅ Tareas aprobadas' if aprobar else '❌ Tareas rechazadas'}: {len(reviewed)}",
+        color=discord.Color.green() if aprobar else discord.Color.red()
+    )
+    embed.add_field(name="Jugadores", value=str(len(by_player)), inline=True)
+    if aprobar:
+        embed.add_field(name="Monedas repartidas", value=f"{sum(row['recompensa'] for row in reviewed)} 🪙", inline=True)
+    if ids and len(ids) > len(reviewed):
+        embed.add_field(name="Omitidas", value=f"{len(ids) - len(reviewed)} (no existen o ya estaban revisadas)", inline=True)
+    lines = [f"ID {row['id']} | {row['tarea_nombre']} | {row['username']}" for row in reviewed[:15]]
+    if len(reviewed) > 15:
+        lines.append(f"… y {len(reviewed) - 15} más")
+    embed.add_field(name="Solicitudes", value="\n".join(lines), inline=False)
+    await interaction.followup.send(embed=embed)
+
+@bot.tree.command(name="admin_estado_db", description="[ADMIN] Muestra el estado del pool de conexiones")
+@player_command(admin=True, ephemeral=True)
+async def admin_estado_db(interaction: discord.Interaction):
+    stats = db.pool_stats()
+    embed = discord.Embed(title="🗄️ Pool de conexiones", color=discord.Color.dark_grey())
+    if not stats:
+        motivo = "el backend en memoria no usa conexiones" if db.DB_BACKEND == "memory" else "aún no se ha abierto ninguna conexión"
+        embed.add_field(name="Sin pool", value=f"No hay estadísticas: {motivo}.", inline=False)
+    else:
+        embed.add_field(name="En uso", value=str(stats['in_use']), inline=True)
+        embed.add_field(name="Libres", value=str(stats['idle']), inline=True)
+        embed.add_field(name="Tamaño", value=f"{stats['size']} ({stats['min_size']}-{stats['max_size']})", inline=True)
+        embed.add_field(name="Esperas", value=f"{stats['waits']} de {stats['checkouts']} préstamos", inline=True)
+        embed.add_field(name="Espera media", value=f"{stats['wait_time_avg'] * 1000:.1f} ms", inline=True)
+        embed.add_field(name="Espera máxima", value=f"{stats['wait_time_max'] * 1000:.1f} ms", inline=True)
+        embed.add_field(name="Reciclajes", value=f"{stats['recycled']} caducadas, {stats['failed_checks']} fallidas", inline=False)
+    user_stats = users.stats
+    embed.add_field(
+        name="Caché de usuarios",
+        value=f"{user_stats['client_hits']} en cliente, {user_stats['lru_hits']} en LRU, {user_stats['deduplicated']} deduplicadas, {user_stats['misses']} REST ({users.rest_calls_saved} llamadas ahorradas)",
+        inline=False
+    )
+    notify_stats = notifier.stats
+    embed.add_field(
+        name="Notificaciones",
+        value=f"{notify_stats['sent']} enviadas, {notify_stats['coalesced']} agrupadas, {notify_stats['retries']} reintentos, {notify_stats['failed']} fallidas",
+        inline=False
+    )
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="admin_verificar_contribuciones", description="[ADMIN] Verifica las contribuciones acumuladas de los belenes")
+@app_commands.describe(reparar="Reconstruye las contribuciones a partir de las compras si hay diferencias")
+@player_command(admin=True, ephemeral=True)
+async def admin_verificar_contribuciones(interaction: discord.Interaction, reparar: bool = False):
+    mismatches = await aiodb.rebuild_contributions(reparar)
+    if not mismatches:
+        await interaction.followup.send("✅ Las contribuciones coinciden con las compras registradas.", ephemeral=True)
+        return
+    
+    lines = "\n".join([f"Belén {m['belen_id']} / jugador {m['jugador_id']}: {m['actual']} 🪙 (esperado {m['esperado']} 🪙)" for m in mismatches[:10]])
+    if len(mismatches) > 10:
+        lines += f"\n... y {len(mismatches) - 10} más"
+    status = "🔧 Contribuciones reconstruidas." if reparar else "⚠️ Hay diferencias. Usa `reparar` para reconstruirlas."
+    await interaction.followup.send(f"{status}\n{lines}", ephemeral=True)
+
+@bot.tree.command(name="admin_exportar", description="[ADMIN] Exporta datos del evento como fichero comprimido")
+@app_commands.describe(datos="Datos a exportar", formato="Formato del fichero")
+@app_commands.choices(
+    datos=[
+        app_commands.Choice(name="Piezas de los belenes", value="piezas_belen"),
+        app_commands.Choice(name="Tareas completadas", value="tareas_completadas"),
+        app_commands.Choice(name="Saldos de monedas", value="saldos"),
+        app_commands.Choice(name="Miembros de los belenes", value="miembros"),
+    ],
+    formato=[
+        app_commands.Choice(name="CSV", value="csv"),
+        app_commands.Choice(name="JSON Lines", value="jsonl"),
+    ]
+)
+@player_command(admin=True, ephemeral=True)
+async def admin_exportar(interaction: discord.Interaction, datos: app_commands.Choice[str], formato: app_commands.Choice[str] = None):
+    fmt = formato.value if formato else "csv"
+    with tempfile.TemporaryFile() as f:
+        count = await aiodb.run(export.write_export, datos.value, f, fmt)
+        size = f.tell()
+        limit = interaction.guild.filesize_limit if interaction.guild else discord.utils.DEFAULT_FILE_SIZE_LIMIT_BYTES
+        if size > limit:
+            await interaction.followup.send(
+                f"La exportación ocupa {size / 1024 / 1024:.1f} MiB y supera el límite de {limit / 1024 / 1024:.0f} MiB. Usa `python export.py {datos.value}` en el servidor.",
+                ephemeral=True
+            )
+            return
+        f.seek(0)
+        await interaction.followup.send(
+            f"📦 **{datos.name}**: {count} filas ({size / 1024:.1f} KiB comprimido)",
+            file=discord.File(f, filename=export.export_filename(datos.value, fmt)),
+            ephemeral=True
+        )
+
+@bot.tree.command(name="admin_importar", description="[ADMIN] Importa piezas o tareas desde un CSV o JSON")
+@app_commands.describe(
+    tipo="Qué se importa",
+    archivo="CSV o JSON con columnas nombre, precio/recompensa, descripcion[, emoji]",
+    aplicar="Guarda los cambios; si no, solo muestra la diferencia"
+)
+@app_commands.choices(tipo=[
+    app_commands.Choice(name="Piezas de la tienda", value="piezas"),
+    app_commands.Choice(name="Tareas", value="tareas"),
+])
+@player_command(admin=True, ephemeral=True)
+async def admin_importar(interaction: discord.Interaction, tipo: app_commands.Choice[str], archivo: discord.Attachment, aplicar: bool = False):
+    if archivo.size > IMPORT_MAX_BYTES:
+        await interaction.followup.send("El archivo es demasiado grande (máximo 5 MB).", ephemeral=True)
+        return
+    try:
+        result = await aiodb.run_write(importer.import_file, tipo.value, await archivo.read(), archivo.filename, not aplicar)
+    except (ValueError, UnicodeDecodeError) as e:
+        await interaction.followup.send(f"No se pudo leer el archivo: {e}", ephemeral=True)
+        return
+    
+    if result['errores']:
+        lines = "\n".join(f"Fila {number}: {error}" for number, error in result['errores'][:10])
+        if len(result['errores']) > 10:
+            lines += f"\n... y {len(result['errores']) - 10} más"
+        await interaction.followup.send(f"❌ {len(result['errores'])} errores, no se ha importado nada:\n{lines}", ephemeral=True)
+        return
+    
+    embed = discord.Embed(
+        title=f"{'📥 Importación' if aplicar else '🔍 Vista previa'}: {tipo.name}",
+        description=f"{result['filas']} filas procesadas en {result['segundos']:.2f}s",
+        color=discord.Color.green() if aplicar else discord.Color.blue()
+    )
+    nuevos = "\n".join(result['nuevos'][:10]) + (f"\n... y {len(result['nuevos']) - 10} más" if len(result['nuevos']) > 10 else "")
+    embed.add_field(name=f"Nuevos ({len(result['nuevos'])})", value=nuevos[:1024] or "—", inline=False)
+    modificados = "\n".join(
+        f"{cambio['nombre']}: " + ", ".join(f"{column} {anterior} → {nuevo}" for column, (anterior, nuevo) in cambio['cambios'].items())
+        for cambio in result['modificados'][:10]
+    ) + (f"\n... y {len(result['modificados']) - 10} más" if len(result['modificados']) > 10 else "")
+    embed.add_field(name=f"Modificados ({len(result['modificados'])})", value=modificados[:1024] or "—", inline=False)
+    embed.add_field(name="Sin cambios", value=str(result['sin_cambios']), inline=False)
+    if not aplicar:
+        embed.set_footer(text="Repite el comando con aplicar:True para guardar los cambios")
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="admin_perfil_sql", description="[ADMIN] Muestra las consultas SQL más costosas")
+@app_commands.describe(top="Número de consultas a mostrar", activar="Activa o desactiva el perfilado", reiniciar="Borra las estadísticas acumuladas")
+@player_command(admin=True, ephemeral=True)
+async def admin_perfil_sql(interaction: discord.Interaction, top: int = 10, activar: bool = None, reiniciar: bool = False):
+    if activar is not None:
+        profiler.enabled = activar
+    if reiniciar:
+        profiler.reset()
+    
+    estado = "activo" if profiler.enabled else "inactivo"
+    entries = profiler.top(max(1, min(top, 25)))
+    if not entries:
+        await interaction.followup.send(f"Perfilado SQL {estado}. No hay consultas registradas.", ephemeral=True)
+        return
+    
+    embed = discord.Embed(
+        title="🐢 Consultas SQL más costosas",
+        description=f"Perfilado {estado} · umbral de consulta lenta {profiler.slow_threshold * 1000:.0f} ms",
+        color=discord.Color.dark_grey()
+    )
+    for entry in entries:
+        embed.add_field(
+            name=f"{entry['total'] * 1000:.1f} ms en {entry['calls']} llamadas ({entry['avg'] * 1000:.2f} ms media, {entry['slow']} lentas)",
+            value=f"`{entry['sql'][:300]}`\n{', '.join(entry['callers'])[:300]}",
+            inline=False
+        )
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
 if __name__ == "__main__":
     if not DISCORD_TOKEN:
         print("Error: DISCORD_TOKEN no está configurado")
         exit(1)
     bot.run(DISCORD_TOKEN)
     print(">>> client.run ejecutándose")
+    if DB_PROFILE:
+        profiler.log_report()
@@ -0,0 +1,112 @@
+import threading
+import time
+
+
+class IdSetCache:
+    def __init__(self, loader):
+        self._loader = loader
+        self._ids = None
+        self._changes = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.loaded_at = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._ids is not None
+
+    def refresh(self) -> int:
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self) -> int:
+        with self._lock:
+            self._changes = []
+        try:
+            ids = set(self._loader())
+        except Exception:
+            with self._lock:
+                self._changes = None
+            raise
+        with self._lock:
+            for present, user_id in self._changes:
+                if present:
+                    ids.add(user_id)
+                else:
+                    ids.discard(user_id)
+            self._changes = None
+            self._ids = ids
+            self.loaded_at = time.time()
+            return len(ids)
+
+    def contains(self, user_id: int) -> bool:
+        if self._ids is None:
+            with self._refresh_lock:
+                if self._ids is None:
+                    self._refresh()
+        return user_id in self._ids
+
+    def _apply(self, user_id: int, present: bool) -> None:
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((present, user_id))
+            if self._ids is not None:
+                if present:
+                    self._ids.add(user_id)
+                else:
+                    self._ids.discard(user_id)
+
+    def add(self, user_id: int) -> None:
+        self._apply(user_id, True)
+
+    def discard(self, user_id: int) -> None:
+        self._apply(user_id, False)
+
+    def __len__(self) -> int:
+        return len(self._ids) if self._ids is not None else 0
+
+
+class CatalogCache:
+    def __init__(self, loader):
+        self._loader = loader
+        self._version = 0
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def invalidate(self) -> int:
+        with self._lock:
+            self._version += 1
+            return self._version
+
+    def _load(self):
+        version = self._version
+        items = list(self._loader())
+        by_id = {}
+        by_name = {}
+        for item in items:
+            by_id[item['id']] = item
+            by_name.setdefault(item['nombre'].casefold(), item)
+        snapshot = (version, items, by_id, by_name)
+        with self._lock:
+            if self._snapshot is None or self._snapshot[0] <= version:
+                self._snapshot = snapshot
+        return snapshot
+
+    def _current(self):
+        snapshot = self._snapshot
+        if snapshot is None or snapshot[0] != self._version:
+            snapshot = self._load()
+        return snapshot
+
+    def items(self) -> list:
+        return self._current()[1]
+
+    def get(self, item_id: int):
+        return self._current()[2].get(item_id)
+
+    def find(self, nombre: str):
+        return self._current()[3].get(nombre.casefold())
@@ -1,28 +1,126 @@
+import csv
+import functools
+import io
+import json
 import os
+import threading
+import uuid
+from bisect import bisect_left, bisect_right
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 from contextlib import contextmanager
+from typing import NamedTuple
+from pool import ConnectionPool
+from cache import IdSetCache, CatalogCache
+from search_index import SearchIndex
+from profiler import ProfilingConnection
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
+DB_BACKEND = os.environ.get("DB_BACKEND", "postgres")
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+DB_POOL_MAX_IDLE = float(os.environ.get("DB_POOL_MAX_IDLE", "300"))
+DB_POOL_MAX_LIFETIME = float(os.environ.get("DB_POOL_MAX_LIFETIME", "1800"))
+DB_POOL_CHECK_AFTER = float(os.environ.get("DB_POOL_CHECK_AFTER", "30"))
+CACHE_CHANNEL = os.environ.get("CACHE_NOTIFY_CHANNEL", "botevento_cache")
+INSTANCE_ID = uuid.uuid4().hex
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _dispatch(func):
+    if DB_BACKEND == "postgres":
+        return func
+    if DB_BACKEND != "memory":
+        raise ValueError(f"DB_BACKEND desconocido: {DB_BACKEND}")
+
+    @functools.wraps(func)
+    def dispatched(*args, **kwargs):
+        import memory_backend
+        return getattr(memory_backend, func.__name__)(*args, **kwargs)
+    return dispatched
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    DATABASE_URL,
+                    min_size=DB_POOL_MIN,
+                    max_size=DB_POOL_MAX,
+                    timeout=DB_POOL_TIMEOUT,
+                    max_idle=DB_POOL_MAX_IDLE,
+                    max_lifetime=DB_POOL_MAX_LIFETIME,
+                    check_after=DB_POOL_CHECK_AFTER,
+                    connection_factory=ProfilingConnection,
+                )
+    return _pool
+
+def pool_stats() -> dict:
+    if _pool is None:
+        return {}
+    return _pool.stats()
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
 
 @contextmanager
 def get_connection():
-    conn = psycopg2.connect(DATABASE_URL)
+    pool = get_pool()
+    conn = pool.getconn()
+    broken = False
     try:
         yield conn
         conn.commit()
     except Exception as e:
-        conn.rollback()
+        broken = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
         raise e
     finally:
-        conn.close()
+        pool.putconn(conn, close=broken or conn.closed)
+
+def _notify(cur, entity: str, entity_id: int, op: str, fields: dict = None) -> None:
+    payload = {'origin': INSTANCE_ID, 'entity': entity, 'id': entity_id, 'op': op}
+    if fields:
+        payload['fields'] = {key: value for key, value in fields.items() if key != 'descripcion'}
+    cur.execute("SELECT pg_notify(%s, %s)", (CACHE_CHANNEL, json.dumps(payload, ensure_ascii=False)))
+
+@_dispatch
+def get_setting(clave: str):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT valor FROM bot_estado WHERE clave = %s", (clave,))
+            result = cur.fetchone()
+            return result[0] if result else None
+
+@_dispatch
+def set_setting(clave: str, valor: str) -> None:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """INSERT INTO bot_estado (clave, valor) VALUES (%s, %s)
+                   ON CONFLICT (clave) DO UPDATE SET valor = EXCLUDED.valor, updated_at = CURRENT_TIMESTAMP""",
+                (clave, valor)
+            )
 
+@_dispatch
 def jugador_existe(user_id: int) -> bool:
     with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("SELECT 1 FROM jugadores WHERE id = %s", (user_id,))
             return cur.fetchone() is not None
 
+@_dispatch
 def registrar_jugador(user_id: int, username: str) -> None:
     with get_connection() as conn:
         with conn.cursor() as cur:
@@ -31,6 +129,7 @@ def registrar_jugador(user_id: int, username: str) -> None:
                 (user_id, username)
             )
 
+@_dispatch
 def actualizar_username(user_id: int, username: str) -> None:
     with get_connection() as conn:
         with conn.cursor() as cur:
@@ -39,24 +138,68 @@ def actualizar_username(user_id: int, username: str) -> None:
                 (username, user_id)
             )
 
+@_dispatch
 def ensure_player(user_id: int, username: str) -> None:
-    if not jugador_existe(user_id):
-        registrar_jugador(user_id, username)
-    else:
-        actualizar_username(user_id, username)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """INSERT INTO jugadores (id, username, monedas) VALUES (%s, %s, 0)
+                   ON CONFLICT (id) DO UPDATE SET username = EXCLUDED.username
+                   WHERE jugadores.username IS DISTINCT FROM EXCLUDED.username""",
+                (user_id, username)
+            )
 
-def is_admin(user_id: int) -> bool:
+@_dispatch
+def get_request_context(user_id: int, username: str) -> dict:
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                WITH upsert AS (
+                    INSERT INTO jugadores (id, username, monedas) VALUES (%(id)s, %(username)s, 0)
+                    ON CONFLICT (id) DO UPDATE SET username = EXCLUDED.username
+                    WHERE jugadores.username IS DISTINCT FROM EXCLUDED.username
+                    RETURNING monedas
+                )
+                SELECT COALESCE((SELECT monedas FROM upsert), (SELECT monedas FROM jugadores WHERE id = %(id)s), 0) AS monedas
+            """, {'id': user_id, 'username': username})
+            return cur.fetchone()
+
+@_dispatch
+def _load_admin_ids():
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT 1 FROM administradores WHERE id = %s", (user_id,))
-            return cur.fetchone() is not None
+            cur.execute("SELECT id FROM administradores")
+            return [row[0] for row in cur.fetchall()]
 
-def is_blocked(user_id: int) -> bool:
+@_dispatch
+def _load_blocked_ids():
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT 1 FROM usuarios_bloqueados WHERE id = %s", (user_id,))
-            return cur.fetchone() is not None
+            cur.execute("SELECT id FROM usuarios_bloqueados")
+            return [row[0] for row in cur.fetchall()]
 
+_admins = IdSetCache(_load_admin_ids)
+_blocked = IdSetCache(_load_blocked_ids)
+
+def refresh_permission_caches() -> dict:
+    return {'admins': _admins.refresh(), 'blocked': _blocked.refresh()}
+
+def refresh_search_indexes() -> dict:
+    return {'belenes': _belen_index.refresh(), 'piezas': _piece_index.refresh(), 'tareas': _tarea_index.refresh()}
+
+def is_admin(user_id: int) -> bool:
+    return _admins.contains(user_id)
+
+def is_blocked(user_id: int) -> bool:
+    return _blocked.contains(user_id)
+
+def permissions_loaded() -> bool:
+    return _admins.loaded and _blocked.loaded
+
+def get_permissions(user_id: int) -> tuple:
+    return _admins.contains(user_id), _blocked.contains(user_id)
+
+@_dispatch
 def get_monedas(user_id: int) -> int:
     with get_connection() as conn:
         with conn.cursor() as cur:
@@ -64,6 +207,7 @@ def get_monedas(user_id: int) -> int:
             result = cur.fetchone()
             return result[0] if result else 0
 
+@_dispatch
 def update_monedas(user_id: int, delta: int) -> int:
     with get_connection() as conn:
         with conn.cursor() as cur:
@@ -74,62 +218,148 @@ def update_monedas(user_id: int, delta: int) -> int:
             result = cur.fetchone()
             return result[0] if result else 0
 
-def add_admin(user_id: int) -> bool:
+@_dispatch
+def bulk_update_monedas(deltas: dict, usernames: dict = None, create: bool = True) -> dict:
+    if not deltas:
+        return {'jugadores': 0, 'nuevos': 0, 'omitidos': 0, 'total': 0}
+    usernames = usernames or {}
     with get_connection() as conn:
         with conn.cursor() as cur:
-            try:
-                cur.execute(
-                    "INSERT INTO administradores (id) VALUES (%s) ON CONFLICT DO NOTHING",
-                    (user_id,)
-                )
-                return cur.rowcount > 0
-            except:
-                return False
+            if create:
+                rows = [(user_id, usernames.get(user_id), delta) for user_id, delta in deltas.items()]
+                results = execute_values(cur, """
+                    INSERT INTO jugadores (id, username, monedas) VALUES %s
+                    ON CONFLICT (id) DO UPDATE
+                    SET monedas = jugadores.monedas + EXCLUDED.monedas,
+                        username = COALESCE(EXCLUDED.username, jugadores.username)
+                    RETURNING id, (xmax = 0)
+                """, rows, page_size=len(rows), fetch=True)
+            else:
+                rows = list(deltas.items())
+                results = execute_values(cur, """
+                    UPDATE jugadores j SET monedas = j.monedas + d.delta
+                    FROM (VALUES %s) AS d (id, delta)
+                    WHERE j.id = d.id
+                    RETURNING j.id, false
+                """, rows, page_size=len(rows), fetch=True)
+    return {
+        'jugadores': len(results),
+        'nuevos': sum(1 for _, inserted in results if inserted),
+        'omitidos': len(deltas) - len(results),
+        'total': sum(deltas[user_id] for user_id, _ in results),
+    }
 
-def remove_admin(user_id: int) -> bool:
+@_dispatch
+def bulk_update_belen_monedas(belen_id: int, delta: int) -> dict:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE jugadores j SET monedas = j.monedas + %s
+                FROM miembros_belen mb
+                WHERE mb.jugador_id = j.id AND mb.belen_id = %s
+            """, (delta, belen_id))
+            updated = cur.rowcount
+    return {'jugadores': updated, 'nuevos': 0, 'omitidos': 0, 'total': delta * updated}
+
+@_dispatch
+def _insert_admin(user_id: int) -> bool:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO administradores (id) VALUES (%s) ON CONFLICT DO NOTHING",
+                (user_id,)
+            )
+            added = cur.rowcount > 0
+            if added:
+                _notify(cur, 'admin', user_id, 'insert')
+            return added
+
+@_dispatch
+def _delete_admin(user_id: int) -> bool:
     with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("DELETE FROM administradores WHERE id = %s", (user_id,))
-            return cur.rowcount > 0
+            removed = cur.rowcount > 0
+            if removed:
+                _notify(cur, 'admin', user_id, 'delete')
+            return removed
 
-def block_user(user_id: int, reason: str = None) -> bool:
+@_dispatch
+def _insert_blocked(user_id: int, reason: str = None) -> bool:
     with get_connection() as conn:
         with conn.cursor() as cur:
-            try:
-                cur.execute(
-                    "INSERT INTO usuarios_bloqueados (id, reason) VALUES (%s, %s) ON CONFLICT DO NOTHING",
-                    (user_id, reason)
-                )
-                return cur.rowcount > 0
-            except:
-                return False
+            cur.execute(
+                "INSERT INTO usuarios_bloqueados (id, reason) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                (user_id, reason)
+            )
+            added = cur.rowcount > 0
+            if added:
+                _notify(cur, 'bloqueado', user_id, 'insert')
+            return added
 
-def unblock_user(user_id: int) -> bool:
+@_dispatch
+def _delete_blocked(user_id: int) -> bool:
     with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("DELETE FROM usuarios_bloqueados WHERE id = %s", (user_id,))
-            return cur.rowcount > 0
+            removed = cur.rowcount > 0
+            if removed:
+                _notify(cur, 'bloqueado', user_id, 'delete')
+            return removed
 
+def add_admin(user_id: int) -> bool:
+    try:
+        added = _insert_admin(user_id)
+    except:
+        return False
+    _admins.add(user_id)
+    return added
+
+def remove_admin(user_id: int) -> bool:
+    removed = _delete_admin(user_id)
+    _admins.discard(user_id)
+    return removed
+
+def block_user(user_id: int, reason: str = None) -> bool:
+    try:
+        added = _insert_blocked(user_id, reason)
+    except:
+        return False
+    _blocked.add(user_id)
+    return added
+
+def unblock_user(user_id: int) -> bool:
+    removed = _delete_blocked(user_id)
+    _blocked.discard(user_id)
+    return removed
+
+FIND_BELEN_SQL = "SELECT * FROM belenes WHERE LOWER(nombre) = LOWER(%s)"
+
+USER_BELEN_SQL = """
+    SELECT b.* FROM belenes b
+    JOIN miembros_belen mb ON b.id = mb.belen_id
+    WHERE mb.jugador_id = %s
+"""
+
+@_dispatch
 def find_belen(identifier: str):
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             if identifier.isdigit():
                 cur.execute("SELECT * FROM belenes WHERE id = %s", (int(identifier),))
             else:
-                cur.execute("SELECT * FROM belenes WHERE LOWER(nombre) = LOWER(%s)", (identifier,))
+                cur.execute(FIND_BELEN_SQL, (identifier,))
             return cur.fetchone()
 
+@_dispatch
 def get_user_belen(user_id: int):
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("""
-                SELECT b.* FROM belenes b
-                JOIN miembros_belen mb ON b.id = mb.belen_id
-                WHERE mb.jugador_id = %s
-            """, (user_id,))
+            cur.execute(USER_BELEN_SQL, (user_id,))
             return cur.fetchone()
 
-def create_belen(nombre: str, creador_id: int, descripcion: str = None) -> int:
+@_dispatch
+def _insert_belen(nombre: str, creador_id: int, descripcion: str = None) -> int:
     with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
@@ -141,14 +371,42 @@ def create_belen(nombre: str, creador_id: int, descripcion: str = None) -> int:
                 "INSERT INTO miembros_belen (belen_id, jugador_id) VALUES (%s, %s)",
                 (belen_id, creador_id)
             )
+            _notify(cur, 'belen', belen_id, 'insert', {'nombre': nombre})
             return belen_id
 
-def delete_belen(belen_id: int) -> bool:
+@_dispatch
+def _delete_belen(belen_id: int) -> bool:
     with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("DELETE FROM belenes WHERE id = %s", (belen_id,))
-            return cur.rowcount > 0
+            deleted = cur.rowcount > 0
+            if deleted:
+                _notify(cur, 'belen', belen_id, 'delete')
+            return deleted
+
+@_dispatch
+def _load_belenes():
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SELECT id, nombre FROM belenes")
+            return cur.fetchall()
 
+_belen_index = SearchIndex(_load_belenes)
+
+def create_belen(nombre: str, creador_id: int, descripcion: str = None) -> int:
+    belen_id = _insert_belen(nombre, creador_id, descripcion)
+    _belen_index.put({'id': belen_id, 'nombre': nombre})
+    return belen_id
+
+def delete_belen(belen_id: int) -> bool:
+    deleted = _delete_belen(belen_id)
+    _belen_index.remove(belen_id)
+    return deleted
+
+def search_belenes(query: str, limit: int = 25) -> list:
+    return _belen_index.search(query, limit)
+
+@_dispatch
 def add_member_to_belen(belen_id: int, jugador_id: int) -> bool:
     with get_connection() as conn:
         with conn.cursor() as cur:
@@ -161,7 +419,8 @@ def add_member_to_belen(belen_id: int, jugador_id: int) -> bool:
             except:
                 return False
 
-def leave_belen(jugador_id: int) -> dict:
+@_dispatch
+def _leave_belen(jugador_id: int) -> dict:
     belen = get_user_belen(jugador_id)
     if not belen:
         return None
@@ -170,6 +429,7 @@ def leave_belen(jugador_id: int) -> dict:
         with conn.cursor() as cur:
             if belen['creador_id'] == jugador_id:
                 cur.execute("DELETE FROM belenes WHERE id = %s", (belen['id'],))
+                _notify(cur, 'belen', belen['id'], 'delete')
                 return {'deleted': True, 'belen': belen}
             else:
                 cur.execute(
@@ -178,6 +438,13 @@ def leave_belen(jugador_id: int) -> dict:
                 )
                 return {'deleted': False, 'belen': belen}
 
+def leave_belen(jugador_id: int) -> dict:
+    result = _leave_belen(jugador_id)
+    if result and result['deleted']:
+        _belen_index.remove(result['belen']['id'])
+    return result
+
+@_dispatch
 def create_join_request(belen_id: int, jugador_id: int) -> int:
     with get_connection() as conn:
         with conn.cursor() as cur:
@@ -188,8 +455,10 @@ def create_join_request(belen_id: int, jugador_id: int) -> int:
                    RETURNING id""",
                 (belen_id, jugador_id)
             )
-            return cur.fetchone()[0]
+            request_id = cur.fetchone()[0]
+            return request_id
 
+@_dispatch
 def get_join_request(request_id: int):
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -202,18 +471,22 @@ def get_join_request(request_id: int):
             """, (request_id,))
             return cur.fetchone()
 
+PENDING_REQUESTS_SQL = """
+    SELECT s.*, j.username
+    FROM solicitudes_union s
+    JOIN jugadores j ON s.jugador_id = j.id
+    WHERE s.belen_id = %s AND s.estado = 'pendiente'
+    ORDER BY s.created_at
+"""
+
+@_dispatch
 def get_pending_requests_for_belen(belen_id: int):
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("""
-                SELECT s.*, j.username
-                FROM solicitudes_union s
-                JOIN jugadores j ON s.jugador_id = j.id
-                WHERE s.belen_id = %s AND s.estado = 'pendiente'
-                ORDER BY s.created_at
-            """, (belen_id,))
+            cur.execute(PENDING_REQUESTS_SQL, (belen_id,))
             return cur.fetchall()
 
+@_dispatch
 def accept_join_request(request_id: int) -> bool:
     with get_connection() as conn:
         with conn.cursor() as cur:
@@ -231,6 +504,7 @@ def accept_join_request(request_id: int) -> bool:
                 return True
             return False
 
+@_dispatch
 def reject_join_request(request_id: int) -> bool:
     with get_connection() as conn:
         with conn.cursor() as cur:
@@ -240,163 +514,409 @@ def reject_join_request(request_id: int) -> bool:
             )
             return cur.rowcount > 0
 
-def list_store_items():
+@_dispatch
+def _load_store_items():
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("SELECT * FROM piezas_catalogo ORDER BY precio")
+            cur.execute("SELECT * FROM piezas_catalogo ORDER BY precio, id")
             return cur.fetchall()
 
+_catalog = CatalogCache(_load_store_items)
+_piece_index = SearchIndex(_load_store_items, label=lambda item: f"{item['emoji'] or '🎁'} {item['nombre']} — {item['precio']} 🪙")
+
+def catalog_version() -> int:
+    return _catalog.version
+
+def list_store_items():
+    return _catalog.items()
+
 def get_store_item(identifier: str):
-    with get_connection() as conn:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            if identifier.isdigit():
-                cur.execute("SELECT * FROM piezas_catalogo WHERE id = %s", (int(identifier),))
-            else:
-                cur.execute("SELECT * FROM piezas_catalogo WHERE LOWER(nombre) = LOWER(%s)", (identifier,))
-            return cur.fetchone()
+    if identifier.isdigit():
+        return _catalog.get(int(identifier))
+    return _catalog.find(identifier)
 
-def create_store_item(nombre: str, precio: int, descripcion: str = None, emoji: str = '🎁') -> int:
+def get_store_items_page(after: tuple = None, before: tuple = None, limit: int = 5, last: bool = False) -> list:
+    items = _catalog.items()
+    if after is not None:
+        start = bisect_right(items, tuple(after), key=lambda item: (item['precio'], item['id']))
+        return items[start:start + limit]
+    if before is not None:
+        end = bisect_left(items, tuple(before), key=lambda item: (item['precio'], item['id']))
+        return items[max(0, end - limit):end]
+    if last:
+        return items[-limit:] if limit else []
+    return items[:limit]
+
+def count_store_items() -> int:
+    return len(_catalog.items())
+
+@_dispatch
+def _insert_store_item(nombre: str, precio: int, descripcion: str, emoji: str) -> int:
     with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 "INSERT INTO piezas_catalogo (nombre, precio, descripcion, emoji) VALUES (%s, %s, %s, %s) RETURNING id",
                 (nombre, precio, descripcion, emoji)
             )
-            return cur.fetchone()[0]
+            item_id = cur.fetchone()[0]
+            _notify(cur, 'pieza', item_id, 'insert', {'nombre': nombre, 'precio': precio, 'emoji': emoji})
+            return item_id
+
+@_dispatch
+def _update_store_item(item_id: int, fields: dict) -> bool:
+    updates = [f"{column} = %s" for column in fields]
+    params = list(fields.values()) + [item_id]
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"UPDATE piezas_catalogo SET {', '.join(updates)} WHERE id = %s", params)
+            updated = cur.rowcount > 0
+            if updated:
+                _notify(cur, 'pieza', item_id, 'update', fields)
+            return updated
+
+@_dispatch
+def _delete_store_item(item_id: int) -> bool:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM piezas_catalogo WHERE id = %s", (item_id,))
+            deleted = cur.rowcount > 0
+            if deleted:
+                _notify(cur, 'pieza', item_id, 'delete')
+            return deleted
+
+def create_store_item(nombre: str, precio: int, descripcion: str = None, emoji: str = '🎁') -> int:
+    item_id = _insert_store_item(nombre, precio, descripcion, emoji)
+    _catalog.invalidate()
+    _piece_index.put({'id': item_id, 'nombre': nombre, 'precio': precio, 'emoji': emoji})
+    return item_id
 
 def update_store_item(item_id: int, nombre: str = None, precio: int = None, descripcion: str = None, emoji: str = None) -> bool:
-    updates = []
-    params = []
+    fields = {}
     if nombre is not None:
-        updates.append("nombre = %s")
-        params.append(nombre)
+        fields['nombre'] = nombre
     if precio is not None:
-        updates.append("precio = %s")
-        params.append(precio)
+        fields['precio'] = precio
     if descripcion is not None:
-        updates.append("descripcion = %s")
-        params.append(descripcion)
+        fields['descripcion'] = descripcion
     if emoji is not None:
-        updates.append("emoji = %s")
-        params.append(emoji)
+        fields['emoji'] = emoji
     
-    if not updates:
+    if not fields:
         return False
     
-    params.append(item_id)
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(f"UPDATE piezas_catalogo SET {', '.join(updates)} WHERE id = %s", params)
-            return cur.rowcount > 0
+    updated = _update_store_item(item_id, fields)
+    _catalog.invalidate()
+    if updated:
+        _piece_index.update(item_id, fields)
+    return updated
 
 def delete_store_item(item_id: int) -> bool:
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM piezas_catalogo WHERE id = %s", (item_id,))
-            return cur.rowcount > 0
+    deleted = _delete_store_item(item_id)
+    _catalog.invalidate()
+    _piece_index.remove(item_id)
+    return deleted
+
+def search_store_items(query: str, limit: int = 25) -> list:
+    return _piece_index.search(query, limit)
+
+_INSERT_PIECE_SQL = """
+    INSERT INTO piezas_belen (belen_id, pieza_id, comprador_id, cantidad, precio_unitario)
+    SELECT %(belen)s, %(pieza)s, %(jugador)s, %(cantidad)s, (SELECT precio FROM piezas_catalogo WHERE id = %(pieza)s)
+"""
+
+_ADD_CONTRIBUTION_SQL = """
+    INSERT INTO contribuciones_belen (belen_id, jugador_id, contribucion)
+    SELECT belen_id, comprador_id, cantidad * precio_unitario FROM compra
+    ON CONFLICT (belen_id, jugador_id) DO UPDATE
+    SET contribucion = contribuciones_belen.contribucion + EXCLUDED.contribucion
+"""
 
+@_dispatch
 def record_purchase(belen_id: int, pieza_id: int, comprador_id: int, cantidad: int) -> bool:
     with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
-                "INSERT INTO piezas_belen (belen_id, pieza_id, comprador_id, cantidad) VALUES (%s, %s, %s, %s)",
-                (belen_id, pieza_id, comprador_id, cantidad)
+                f"WITH compra AS ({_INSERT_PIECE_SQL} RETURNING belen_id, comprador_id, cantidad, precio_unitario) {_ADD_CONTRIBUTION_SQL}",
+                {'belen': belen_id, 'jugador': comprador_id, 'pieza': pieza_id, 'cantidad': cantidad}
             )
             return True
 
-def get_belen_pieces(belen_id: int):
+class InsufficientFunds(NamedTuple):
+    monedas: int
+    coste: int
+
+class PieceUnavailable(NamedTuple):
+    pieza_id: int
+
+@_dispatch
+def purchase(jugador_id: int, belen_id: int, pieza_id: int, cantidad: int):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                WITH pieza AS (
+                    SELECT id, precio, precio * %(cantidad)s AS coste
+                    FROM piezas_catalogo WHERE id = %(pieza)s
+                    FOR SHARE
+                ), debit AS (
+                    UPDATE jugadores j SET monedas = j.monedas - p.coste
+                    FROM pieza p
+                    WHERE j.id = %(jugador)s AND j.monedas >= p.coste
+                    RETURNING j.monedas
+                ), compra AS (
+                    INSERT INTO piezas_belen (belen_id, pieza_id, comprador_id, cantidad, precio_unitario)
+                    SELECT %(belen)s, p.id, %(jugador)s, %(cantidad)s, p.precio FROM pieza p, debit
+                    RETURNING belen_id, comprador_id, cantidad, precio_unitario
+                ), aporte AS ({_ADD_CONTRIBUTION_SQL})
+                SELECT (SELECT coste FROM pieza), (SELECT monedas FROM debit), (SELECT monedas FROM jugadores WHERE id = %(jugador)s)
+            """, {'jugador': jugador_id, 'belen': belen_id, 'pieza': pieza_id, 'cantidad': cantidad})
+            coste, new_balance, balance = cur.fetchone()
+            if coste is None:
+                return PieceUnavailable(pieza_id)
+            if new_balance is None:
+                return InsufficientFunds(balance or 0, coste)
+            return new_balance
+
+BELEN_PIECES_SQL = """
+    SELECT pc.nombre, pc.emoji, SUM(pb.cantidad) as cantidad,
+           (ARRAY_AGG(DISTINCT j.username))[1:%s] as compradores,
+           COUNT(DISTINCT pb.comprador_id) as num_compradores,
+           COUNT(*) OVER () as total
+    FROM piezas_belen pb
+    JOIN piezas_catalogo pc ON pb.pieza_id = pc.id
+    JOIN jugadores j ON pb.comprador_id = j.id
+    WHERE pb.belen_id = %s
+    GROUP BY pc.id, pc.nombre, pc.emoji
+    ORDER BY MAX(pb.purchased_at) DESC, pc.id
+    LIMIT %s
+"""
+
+BELEN_MEMBERS_SQL = """
+    SELECT j.id, j.username,
+           COALESCE(cb.contribucion, 0) as contribucion
+    FROM miembros_belen mb
+    JOIN jugadores j ON mb.jugador_id = j.id
+    LEFT JOIN contribuciones_belen cb ON cb.belen_id = mb.belen_id AND cb.jugador_id = mb.jugador_id
+    WHERE mb.belen_id = %s
+    ORDER BY contribucion DESC
+"""
+
+@_dispatch
+def get_belen_pieces(belen_id: int, limit: int = 10, max_buyers: int = 3) -> dict:
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("""
-                SELECT pc.nombre, pc.emoji, pb.cantidad, j.username as comprador
-                FROM piezas_belen pb
-                JOIN piezas_catalogo pc ON pb.pieza_id = pc.id
-                JOIN jugadores j ON pb.comprador_id = j.id
-                WHERE pb.belen_id = %s
-                ORDER BY pb.purchased_at DESC
-            """, (belen_id,))
-            return cur.fetchall()
+            cur.execute(BELEN_PIECES_SQL, (max_buyers, belen_id, limit))
+            rows = cur.fetchall()
+            return {'pieces': rows, 'total': rows[0]['total'] if rows else 0}
 
+@_dispatch
 def get_belen_members(belen_id: int):
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("""
-                SELECT j.id, j.username, 
-                       COALESCE(SUM(pb.cantidad * pc.precio), 0) as contribucion
-                FROM miembros_belen mb
-                JOIN jugadores j ON mb.jugador_id = j.id
-                LEFT JOIN piezas_belen pb ON pb.comprador_id = j.id AND pb.belen_id = mb.belen_id
-                LEFT JOIN piezas_catalogo pc ON pb.pieza_id = pc.id
-                WHERE mb.belen_id = %s
-                GROUP BY j.id, j.username
-                ORDER BY contribucion DESC
-            """, (belen_id,))
+            cur.execute(BELEN_MEMBERS_SQL, (belen_id,))
             return cur.fetchall()
 
+_RAW_CONTRIBUTIONS_SQL = """
+    SELECT belen_id, comprador_id AS jugador_id, SUM(cantidad * precio_unitario) AS contribucion
+    FROM piezas_belen
+    GROUP BY belen_id, comprador_id
+"""
+
+@_dispatch
+def rebuild_contributions(apply: bool = False) -> list:
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            if apply:
+                cur.execute("LOCK TABLE piezas_belen IN SHARE MODE")
+            cur.execute(f"""
+                WITH raw AS ({_RAW_CONTRIBUTIONS_SQL})
+                SELECT COALESCE(raw.belen_id, cb.belen_id) AS belen_id,
+                       COALESCE(raw.jugador_id, cb.jugador_id) AS jugador_id,
+                       COALESCE(raw.contribucion, 0) AS esperado,
+                       COALESCE(cb.contribucion, 0) AS actual
+                FROM raw
+                FULL OUTER JOIN contribuciones_belen cb
+                  ON cb.belen_id = raw.belen_id AND cb.jugador_id = raw.jugador_id
+                WHERE COALESCE(raw.contribucion, 0) <> COALESCE(cb.contribucion, 0)
+                ORDER BY belen_id, jugador_id
+            """)
+            mismatches = cur.fetchall()
+            if apply and mismatches:
+                cur.execute("DELETE FROM contribuciones_belen")
+                cur.execute(f"INSERT INTO contribuciones_belen (belen_id, jugador_id, contribucion) {_RAW_CONTRIBUTIONS_SQL}")
+            return mismatches
+
+@_dispatch
 def list_tareas():
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute("SELECT * FROM tareas ORDER BY recompensa DESC")
             return cur.fetchall()
 
+@_dispatch
 def get_tarea(tarea_id: int):
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute("SELECT * FROM tareas WHERE id = %s", (tarea_id,))
             return cur.fetchone()
 
+AVAILABLE_TAREAS_SQL = """
+    SELECT t.* FROM tareas t
+    WHERE NOT EXISTS (
+        SELECT 1 FROM tareas_completadas tc
+        WHERE tc.tarea_id = t.id
+        AND tc.jugador_id = %s
+        AND tc.estado = 'aprobada'
+    )
+"""
+AVAILABLE_TAREAS_ORDER = ("t.recompensa", "t.id")
+
+@_dispatch
 def get_available_tareas(user_id: int):
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("""
-                SELECT t.* FROM tareas t
-                WHERE NOT EXISTS (
-                    SELECT 1 FROM tareas_completadas tc 
-                    WHERE tc.tarea_id = t.id 
-                    AND tc.jugador_id = %s 
-                    AND tc.estado = 'aprobada'
-                )
-                ORDER BY t.recompensa DESC
-            """, (user_id,))
+            cur.execute(f"{AVAILABLE_TAREAS_SQL} ORDER BY t.recompensa DESC", (user_id,))
             return cur.fetchall()
 
-def create_tarea(nombre: str, descripcion: str, recompensa: int) -> int:
+def keyset_query(sql: str, columns: tuple, descending: bool, mode: str = "first") -> str:
+    columns_sql = ", ".join(columns)
+    placeholders = ", ".join(["%s"] * len(columns))
+    direction = "ASC" if descending == (mode in ("before", "last")) else "DESC"
+    condition = ""
+    if mode in ("after", "before"):
+        op = "<" if descending == (mode == "after") else ">"
+        condition = f" AND ({columns_sql}) {op} ({placeholders})"
+    return f"{sql}{condition} ORDER BY {', '.join(c + ' ' + direction for c in columns)} LIMIT %s"
+
+def _keyset_page(cur, sql: str, params: list, columns: tuple, descending: bool, after, before, limit: int, last: bool) -> list:
+    if after is not None:
+        cur.execute(keyset_query(sql, columns, descending, "after"), params + list(after) + [limit])
+        return cur.fetchall()
+    if before is not None:
+        cur.execute(keyset_query(sql, columns, descending, "before"), params + list(before) + [limit])
+        return list(reversed(cur.fetchall()))
+    if last:
+        cur.execute(keyset_query(sql, columns, descending, "last"), params + [limit])
+        return list(reversed(cur.fetchall()))
+    cur.execute(keyset_query(sql, columns, descending), params + [limit])
+    return cur.fetchall()
+
+@_dispatch
+def get_available_tareas_page(user_id: int, after: tuple = None, before: tuple = None, limit: int = 5, last: bool = False) -> list:
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            return _keyset_page(cur, AVAILABLE_TAREAS_SQL, [user_id], AVAILABLE_TAREAS_ORDER, True, after, before, limit, last)
+
+@_dispatch
+def count_available_tareas(user_id: int) -> int:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT COUNT(*) FROM ({AVAILABLE_TAREAS_SQL}) disponibles", (user_id,))
+            return cur.fetchone()[0]
+
+@_dispatch
+def _insert_tarea(nombre: str, descripcion: str, recompensa: int) -> int:
     with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 "INSERT INTO tareas (nombre, descripcion, recompensa) VALUES (%s, %s, %s) RETURNING id",
                 (nombre, descripcion, recompensa)
             )
-            return cur.fetchone()[0]
+            tarea_id = cur.fetchone()[0]
+            _notify(cur, 'tarea', tarea_id, 'insert', {'nombre': nombre, 'recompensa': recompensa})
+            return tarea_id
+
+@_dispatch
+def _update_tarea(tarea_id: int, fields: dict) -> bool:
+    updates = [f"{column} = %s" for column in fields]
+    params = list(fields.values()) + [tarea_id]
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"UPDATE tareas SET {', '.join(updates)} WHERE id = %s", params)
+            updated = cur.rowcount > 0
+            if updated:
+                _notify(cur, 'tarea', tarea_id, 'update', fields)
+            return updated
+
+@_dispatch
+def _delete_tarea(tarea_id: int) -> bool:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM tareas WHERE id = %s", (tarea_id,))
+            deleted = cur.rowcount > 0
+            if deleted:
+                _notify(cur, 'tarea', tarea_id, 'delete')
+            return deleted
+
+_tarea_index = SearchIndex(list_tareas, label=lambda tarea: f"{tarea['nombre']} — {tarea['recompensa']} 🪙")
+
+def create_tarea(nombre: str, descripcion: str, recompensa: int) -> int:
+    tarea_id = _insert_tarea(nombre, descripcion, recompensa)
+    _tarea_index.put({'id': tarea_id, 'nombre': nombre, 'recompensa': recompensa})
+    return tarea_id
 
 def update_tarea(tarea_id: int, nombre: str = None, descripcion: str = None, recompensa: int = None) -> bool:
-    updates = []
-    params = []
+    fields = {}
     if nombre is not None:
-        updates.append("nombre = %s")
-        params.append(nombre)
+        fields['nombre'] = nombre
     if descripcion is not None:
-        updates.append("descripcion = %s")
-        params.append(descripcion)
+        fields['descripcion'] = descripcion
     if recompensa is not None:
-        updates.append("recompensa = %s")
-        params.append(recompensa)
+        fields['recompensa'] = recompensa
     
-    if not updates:
+    if not fields:
         return False
     
-    params.append(tarea_id)
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(f"UPDATE tareas SET {', '.join(updates)} WHERE id = %s", params)
-            return cur.rowcount > 0
+    updated = _update_tarea(tarea_id, fields)
+    if updated:
+        _tarea_index.update(tarea_id, fields)
+    return updated
 
 def delete_tarea(tarea_id: int) -> bool:
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM tareas WHERE id = %s", (tarea_id,))
-            return cur.rowcount > 0
+    deleted = _delete_tarea(tarea_id)
+    _tarea_index.remove(tarea_id)
+    return deleted
+
+def search_tareas(query: str, limit: int = 25) -> list:
+    return _tarea_index.search(query, limit)
+
+def _apply_to_index(index: SearchIndex, entity_id: int, op: str, fields: dict, refresh) -> None:
+    if op == 'refresh':
+        refresh(index)
+    elif op == 'delete':
+        index.remove(entity_id)
+    elif op == 'insert':
+        index.put({**fields, 'id': entity_id})
+    else:
+        index.update(entity_id, fields)
+
+def apply_invalidation(event: dict, refresh=SearchIndex.refresh) -> bool:
+    entity = event.get('entity')
+    entity_id = event.get('id')
+    op = event.get('op')
+    fields = event.get('fields') or {}
+    if entity == 'admin':
+        (_admins.discard if op == 'delete' else _admins.add)(entity_id)
+    elif entity == 'bloqueado':
+        (_blocked.discard if op == 'delete' else _blocked.add)(entity_id)
+    elif entity == 'pieza':
+        _catalog.invalidate()
+        _apply_to_index(_piece_index, entity_id, op, fields, refresh)
+    elif entity == 'tarea':
+        _apply_to_index(_tarea_index, entity_id, op, fields, refresh)
+    elif entity == 'belen':
+        _apply_to_index(_belen_index, entity_id, op, fields, refresh)
+    else:
+        return False
+    return True
+
+def refresh_all_caches() -> dict:
+    _catalog.invalidate()
+    counts = refresh_permission_caches()
+    counts.update(refresh_search_indexes())
+    counts['catalog'] = len(_catalog.items())
+    return counts
 
+@_dispatch
 def submit_tarea(tarea_id: int, jugador_id: int, nota: str = None) -> int:
     with get_connection() as conn:
         with conn.cursor() as cur:
@@ -406,19 +926,36 @@ def submit_tarea(tarea_id: int, jugador_id: int, nota: str = None) -> int:
             )
             return cur.fetchone()[0]
 
+PENDING_SUBMISSIONS_SQL = """
+    SELECT tc.*, t.nombre as tarea_nombre, t.recompensa, j.username
+    FROM tareas_completadas tc
+    JOIN tareas t ON tc.tarea_id = t.id
+    JOIN jugadores j ON tc.jugador_id = j.id
+    WHERE tc.estado = 'pendiente'
+"""
+PENDING_SUBMISSIONS_ORDER = ("tc.created_at", "tc.id")
+
+@_dispatch
 def get_pending_tarea_submissions():
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("""
-                SELECT tc.*, t.nombre as tarea_nombre, t.recompensa, j.username
-                FROM tareas_completadas tc
-                JOIN tareas t ON tc.tarea_id = t.id
-                JOIN jugadores j ON tc.jugador_id = j.id
-                WHERE tc.estado = 'pendiente'
-                ORDER BY tc.created_at
-            """)
+            cur.execute(f"{PENDING_SUBMISSIONS_SQL} ORDER BY tc.created_at")
             return cur.fetchall()
 
+@_dispatch
+def get_pending_tarea_submissions_page(after: tuple = None, before: tuple = None, limit: int = 5, last: bool = False) -> list:
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            return _keyset_page(cur, PENDING_SUBMISSIONS_SQL, [], PENDING_SUBMISSIONS_ORDER, False, after, before, limit, last)
+
+@_dispatch
+def count_pending_tarea_submissions() -> int:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM tareas_completadas WHERE estado = 'pendiente'")
+            return cur.fetchone()[0]
+
+@_dispatch
 def get_tarea_submission(submission_id: int):
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -431,6 +968,7 @@ def get_tarea_submission(submission_id: int):
             """, (submission_id,))
             return cur.fetchone()
 
+@_dispatch
 def approve_tarea_submission(submission_id: int) -> dict:
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -451,6 +989,7 @@ def approve_tarea_submission(submission_id: int) -> dict:
                     return {'recompensa': tarea['recompensa'], 'jugador_id': result['jugador_id']}
             return None
 
+@_dispatch
 def reject_tarea_submission(submission_id: int) -> bool:
     with get_connection() as conn:
         with conn.cursor() as cur:
@@ -460,11 +999,154 @@ def reject_tarea_submission(submission_id: int) -> bool:
             )
             return cur.rowcount > 0
 
+@_dispatch
+def review_tarea_submissions(aprobar: bool, submission_ids: list = None, tarea_id: int = None) -> list:
+    premios = """, premios AS (
+                    UPDATE jugadores j SET monedas = j.monedas + r.total
+                    FROM (SELECT jugador_id, SUM(recompensa) AS total FROM revisadas GROUP BY jugador_id) r
+                    WHERE j.id = r.jugador_id
+                )""" if aprobar else ""
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f"""
+                WITH revisadas AS (
+                    UPDATE tareas_completadas tc SET estado = %(estado)s, reviewed_at = CURRENT_TIMESTAMP
+                    FROM tareas t
+                    WHERE t.id = tc.tarea_id AND tc.estado = 'pendiente'
+                      AND (tc.id = ANY(%(ids)s) OR tc.tarea_id = %(tarea)s)
+                    RETURNING tc.id, tc.jugador_id, t.nombre AS tarea_nombre, t.recompensa
+                ){premios}
+                SELECT r.*, j.username
+                FROM revisadas r
+                JOIN jugadores j ON j.id = r.jugador_id
+                ORDER BY r.id
+            """, {'estado': 'aprobada' if aprobar else 'rechazada', 'ids': list(submission_ids or []), 'tarea': tarea_id})
+            return cur.fetchall()
+
+HAS_PENDING_SUBMISSION_SQL = "SELECT 1 FROM tareas_completadas WHERE tarea_id = %s AND jugador_id = %s AND estado = 'pendiente'"
+
+@_dispatch
 def has_pending_submission(tarea_id: int, jugador_id: int) -> bool:
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                "SELECT 1 FROM tareas_completadas WHERE tarea_id = %s AND jugador_id = %s AND estado = 'pendiente'",
-                (tarea_id, jugador_id)
-            )
+            cur.execute(HAS_PENDING_SUBMISSION_SQL, (tarea_id, jugador_id))
             return cur.fetchone() is not None
+
+EXPORTS = {
+    'piezas_belen': (
+        ('id', 'belen_id', 'belen', 'pieza_id', 'pieza', 'precio', 'cantidad', 'comprador_id', 'comprador', 'purchased_at'),
+        """SELECT pb.id, pb.belen_id, b.nombre, pb.pieza_id, pc.nombre, pb.precio_unitario, pb.cantidad, pb.comprador_id, j.username, pb.purchased_at
+           FROM piezas_belen pb
+           JOIN belenes b ON b.id = pb.belen_id
+           LEFT JOIN piezas_catalogo pc ON pc.id = pb.pieza_id
+           JOIN jugadores j ON j.id = pb.comprador_id
+           ORDER BY pb.id""",
+    ),
+    'tareas_completadas': (
+        ('id', 'tarea_id', 'tarea', 'recompensa', 'jugador_id', 'username', 'estado', 'nota', 'created_at', 'reviewed_at'),
+        """SELECT tc.id, tc.tarea_id, t.nombre, t.recompensa, tc.jugador_id, j.username, tc.estado, tc.nota, tc.created_at, tc.reviewed_at
+           FROM tareas_completadas tc
+           JOIN tareas t ON t.id = tc.tarea_id
+           JOIN jugadores j ON j.id = tc.jugador_id
+           ORDER BY tc.id""",
+    ),
+    'saldos': (
+        ('id', 'username', 'monedas', 'created_at'),
+        "SELECT id, username, monedas, created_at FROM jugadores ORDER BY id",
+    ),
+    'miembros': (
+        ('belen_id', 'belen', 'jugador_id', 'username', 'creador', 'contribucion', 'joined_at'),
+        """SELECT mb.belen_id, b.nombre, mb.jugador_id, j.username, b.creador_id = mb.jugador_id, COALESCE(cb.contribucion, 0), mb.joined_at
+           FROM miembros_belen mb
+           JOIN belenes b ON b.id = mb.belen_id
+           JOIN jugadores j ON j.id = mb.jugador_id
+           LEFT JOIN contribuciones_belen cb ON cb.belen_id = mb.belen_id AND cb.jugador_id = mb.jugador_id
+           ORDER BY mb.belen_id, mb.joined_at, mb.jugador_id""",
+    ),
+}
+
+@_dispatch
+def iter_export(name: str, batch_size: int = 1000):
+    with get_connection() as conn:
+        with conn.cursor(name=f"export_{name}") as cur:
+            cur.itersize = batch_size
+            cur.execute(EXPORTS[name][1])
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+
+IMPORT_COLUMNS = {
+    'piezas_catalogo': ('nombre', 'precio', 'descripcion', 'emoji'),
+    'tareas': ('nombre', 'descripcion', 'recompensa'),
+}
+
+def diff_import(columns: tuple, pairs) -> dict:
+    nuevos = []
+    modificados = []
+    sin_cambios = 0
+    for nuevo, actual in pairs:
+        if actual is None:
+            nuevos.append(nuevo['nombre'])
+            continue
+        cambios = {column: [actual[column], nuevo[column]] for column in columns if actual[column] != nuevo[column]}
+        if cambios:
+            modificados.append({'nombre': nuevo['nombre'], 'cambios': cambios})
+        else:
+            sin_cambios += 1
+    return {'nuevos': nuevos, 'modificados': modificados, 'sin_cambios': sin_cambios}
+
+@_dispatch
+def _import_rows(table: str, rows: list, dry_run: bool = False) -> dict:
+    columns = IMPORT_COLUMNS[table]
+    column_list = ", ".join(columns)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([[row.get(column) for column in columns] for row in rows])
+    buffer.seek(0)
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            if not dry_run:
+                cur.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+            cur.execute(f"CREATE TEMP TABLE importacion ON COMMIT DROP AS SELECT {column_list} FROM {table} WITH NO DATA")
+            cur.copy_expert(f"COPY importacion ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+            cur.execute(f"""
+                SELECT {", ".join(f"i.{column}" for column in columns)}, t.id IS NOT NULL AS existe,
+                       {", ".join(f"t.{column} AS anterior_{column}" for column in columns)}
+                FROM importacion i
+                LEFT JOIN {table} t ON LOWER(t.nombre) = LOWER(i.nombre)
+            """)
+            pairs = [
+                ({column: row[column] for column in columns},
+                 {column: row[f"anterior_{column}"] for column in columns} if row['existe'] else None)
+                for row in cur.fetchall()
+            ]
+            diff = diff_import(columns, pairs)
+            if dry_run or not (diff['nuevos'] or diff['modificados']):
+                return diff
+            cur.execute(f"""
+                UPDATE {table} t SET {", ".join(f"{column} = i.{column}" for column in columns)}
+                FROM importacion i
+                WHERE LOWER(t.nombre) = LOWER(i.nombre)
+                  AND ({", ".join(f"t.{column}" for column in columns)}) IS DISTINCT FROM ({", ".join(f"i.{column}" for column in columns)})
+            """)
+            cur.execute(f"""
+                INSERT INTO {table} ({column_list})
+                SELECT {column_list} FROM importacion i
+                WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE LOWER(t.nombre) = LOWER(i.nombre))
+            """)
+            _notify(cur, 'pieza' if table == 'piezas_catalogo' else 'tarea', None, 'refresh')
+            return diff
+
+def import_store_items(rows: list, dry_run: bool = False) -> dict:
+    diff = _import_rows('piezas_catalogo', rows, dry_run)
+    if not dry_run and (diff['nuevos'] or diff['modificados']):
+        _catalog.invalidate()
+        _piece_index.refresh()
+    return diff
+
+def import_tareas(rows: list, dry_run: bool = False) -> dict:
+    diff = _import_rows('tareas', rows, dry_run)
+    if not dry_run and (diff['nuevos'] or diff['modificados']):
+        _tarea_index.refresh()
+    return diff
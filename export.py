@@ -0,0 +1,61 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+from datetime import date, datetime
+
+import db
+
+FORMATS = ("csv", "jsonl")
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+def export_filename(name: str, fmt: str) -> str:
+    return f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}.gz"
+
+def write_export(name: str, fileobj, fmt: str = "csv", batch_size: int = EXPORT_BATCH_SIZE) -> int:
+    if name not in db.EXPORTS:
+        raise ValueError(f"Exportación desconocida: {name}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato desconocido: {fmt}")
+    columns = db.EXPORTS[name][0]
+    count = 0
+    with gzip.GzipFile(fileobj=fileobj, mode="wb", filename=f"{name}.{fmt}") as compressed:
+        with io.TextIOWrapper(compressed, encoding="utf-8", newline="") as text:
+            if fmt == "csv":
+                writer = csv.writer(text)
+                writer.writerow(columns)
+            for rows in db.iter_export(name, batch_size):
+                if fmt == "csv":
+                    writer.writerows(rows)
+                else:
+                    text.writelines(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=_json_default) + "\n" for row in rows)
+                count += len(rows)
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta datos del evento en CSV o JSON Lines comprimidos con gzip")
+    parser.add_argument("tablas", nargs="+", choices=sorted(db.EXPORTS), help="Datos a exportar")
+    parser.add_argument("--format", choices=FORMATS, default="csv", help="Formato de salida")
+    parser.add_argument("--output-dir", default=".", help="Directorio donde se guardan los ficheros")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE, help="Filas leídas del cursor por lote")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name in args.tablas:
+        path = os.path.join(args.output_dir, export_filename(name, args.format))
+        with open(path, "wb") as f:
+            count = write_export(name, f, args.format, args.batch_size)
+        print(f"{name}: {count} filas en {path} ({os.path.getsize(path) / 1024:.1f} KiB)")
+    db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import argparse
+import csv
+import io
+import json
+import os
+import time
+
+import db
+
+IMPORT_MAX_ROWS = int(os.environ.get("IMPORT_MAX_ROWS", "20000"))
+MAX_VALUE = 2 ** 31 - 1
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+def _amount(value, field: str) -> int:
+    if isinstance(value, bool):
+        raise ValueError(f"'{field}' debe ser un número entero")
+    if isinstance(value, str):
+        value = value.strip()
+    try:
+        amount = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{field}' debe ser un número entero")
+    if amount != float(value) or not 1 <= amount <= MAX_VALUE:
+        raise ValueError(f"'{field}' debe ser un entero entre 1 y {MAX_VALUE}")
+    return amount
+
+def _pieza(record: dict) -> dict:
+    return {
+        'nombre': _text(record.get('nombre')),
+        'precio': _amount(record.get('precio'), 'precio'),
+        'descripcion': _text(record.get('descripcion')),
+        'emoji': _text(record.get('emoji')) or '🎁',
+    }
+
+def _tarea(record: dict) -> dict:
+    return {
+        'nombre': _text(record.get('nombre')),
+        'descripcion': _text(record.get('descripcion')),
+        'recompensa': _amount(record.get('recompensa'), 'recompensa'),
+    }
+
+KINDS = {
+    'piezas': (_pieza, db.import_store_items),
+    'tareas': (_tarea, db.import_tareas),
+}
+
+
+def parse_records(data: bytes, filename: str) -> list:
+    text = data.decode("utf-8-sig")
+    if filename.lower().endswith(".jsonl"):
+        return [(number, json.loads(line)) for number, line in enumerate(text.splitlines(), start=1) if line.strip()]
+    if filename.lower().endswith(".json"):
+        records = json.loads(text)
+        if isinstance(records, dict):
+            records = next((value for value in records.values() if isinstance(value, list)), None)
+        if not isinstance(records, list):
+            raise ValueError("El JSON debe ser una lista de objetos")
+        return list(enumerate(records, start=1))
+    reader = csv.DictReader(io.StringIO(text))
+    if reader.fieldnames is None:
+        return []
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    return [(reader.line_num, record) for record in reader if any((value or "").strip() for value in record.values() if isinstance(value, str))]
+
+def validate(kind: str, records: list):
+    build = KINDS[kind][0]
+    rows = []
+    errores = []
+    seen = {}
+    if len(records) > IMPORT_MAX_ROWS:
+        return [], [(0, f"Demasiadas filas ({len(records)}, máximo {IMPORT_MAX_ROWS})")]
+    for number, record in records:
+        if not isinstance(record, dict):
+            errores.append((number, "La fila debe ser un objeto"))
+            continue
+        try:
+            row = build(record)
+        except ValueError as e:
+            errores.append((number, str(e)))
+            continue
+        if not row['nombre']:
+            errores.append((number, "Falta 'nombre'"))
+            continue
+        key = row['nombre'].lower()
+        if key in seen:
+            errores.append((number, f"'{row['nombre']}' repetido (ya aparece en la fila {seen[key]})"))
+            continue
+        seen[key] = number
+        rows.append(row)
+    return rows, errores
+
+def import_file(kind: str, data: bytes, filename: str, dry_run: bool = False) -> dict:
+    rows, errores = validate(kind, parse_records(data, filename))
+    if errores:
+        return {'filas': len(rows), 'errores': errores}
+    start = time.perf_counter()
+    diff = KINDS[kind][1](rows, dry_run)
+    diff.update({'filas': len(rows), 'errores': [], 'segundos': time.perf_counter() - start})
+    return diff
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa piezas o tareas desde un CSV o JSON")
+    parser.add_argument("tipo", choices=sorted(KINDS), help="Qué se importa")
+    parser.add_argument("archivo", help="Fichero .csv, .json o .jsonl")
+    parser.add_argument("--aplicar", action="store_true", help="Guarda los cambios; sin esta opción solo se muestra la diferencia")
+    args = parser.parse_args()
+
+    with open(args.archivo, "rb") as f:
+        data = f.read()
+    try:
+        result = import_file(args.tipo, data, args.archivo, dry_run=not args.aplicar)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise SystemExit(f"No se pudo leer {args.archivo}: {e}")
+    finally:
+        db.close_pool()
+    if result['errores']:
+        for number, error in result['errores']:
+            print(f"Fila {number}: {error}")
+        raise SystemExit(f"{len(result['errores'])} errores, no se ha importado nada")
+    for nombre in result['nuevos']:
+        print(f"+ {nombre}")
+    for cambio in result['modificados']:
+        detalles = ", ".join(f"{column}: {anterior!r} → {nuevo!r}" for column, (anterior, nuevo) in cambio['cambios'].items())
+        print(f"~ {cambio['nombre']} ({detalles})")
+    estado = "Importado" if args.aplicar else "Vista previa (usa --aplicar para guardar)"
+    print(f"{estado}: {len(result['nuevos'])} nuevos, {len(result['modificados'])} modificados, "
+          f"{result['sin_cambios']} sin cambios de {result['filas']} filas en {result['segundos']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
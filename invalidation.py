@@ -0,0 +1,168 @@
+import asyncio
+import json
+
+import psycopg2
+from psycopg2 import extensions, sql
+
+
+class InvalidationListener:
+    def __init__(self, dsn: str, channel: str, apply, origin: str = None, on_reconnect=None,
+                 ping_interval: float = 60.0, ping_timeout: float = 10.0, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.dsn = dsn
+        self.channel = channel
+        self.apply = apply
+        self.origin = origin
+        self.on_reconnect = on_reconnect
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._conn = None
+        self._fd = None
+        self._lost = None
+        self._task = None
+        self._ready = None
+        self.stats = {"connected": 0, "received": 0, "applied": 0, "own": 0, "ignored": 0, "errors": 0, "reconnects": 0}
+
+    async def start(self, timeout: float = 10.0) -> bool:
+        if self._task is None:
+            self._ready = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._close()
+
+    async def _wait(self, conn) -> None:
+        loop = asyncio.get_running_loop()
+        fd = conn.fileno()
+        while True:
+            state = conn.poll()
+            if state == extensions.POLL_OK:
+                return
+            ready = loop.create_future()
+            if state == extensions.POLL_READ:
+                loop.add_reader(fd, ready.set_result, None)
+                remove = loop.remove_reader
+            else:
+                loop.add_writer(fd, ready.set_result, None)
+                remove = loop.remove_writer
+            try:
+                await ready
+            finally:
+                remove(fd)
+
+    async def _connect(self):
+        conn = psycopg2.connect(self.dsn, async_=1, keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3)
+        try:
+            await self._wait(conn)
+            await self._execute(conn, sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    async def _execute(self, conn, query) -> None:
+        cur = conn.cursor()
+        try:
+            cur.execute(query)
+            await self._wait(conn)
+        finally:
+            cur.close()
+
+    def _close(self) -> None:
+        conn, self._conn = self._conn, None
+        self.stats["connected"] = 0
+        if conn is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._fd)
+        if not conn.closed:
+            conn.close()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        delay = self.base_delay
+        retrying = False
+        while True:
+            try:
+                self._conn = await asyncio.wait_for(self._connect(), self.ping_timeout)
+                self._fd = self._conn.fileno()
+                self._lost = loop.create_future()
+                loop.add_reader(self._fd, self._on_readable)
+                self.stats["connected"] = 1
+                if retrying:
+                    self.stats["reconnects"] += 1
+                    if self.on_reconnect is not None:
+                        await self.on_reconnect()
+                self._ready.set()
+                delay = self.base_delay
+                while True:
+                    try:
+                        await asyncio.wait_for(asyncio.shield(self._lost), self.ping_interval)
+                    except asyncio.TimeoutError:
+                        await self._ping()
+                        continue
+                    self._lost.result()
+            except asyncio.CancelledError:
+                self._close()
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Escucha de invalidaciones caída: {e or type(e).__name__}. Reintentando en {delay:.0f}s")
+            self._close()
+            retrying = True
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_delay)
+
+    async def _ping(self) -> None:
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(self._fd)
+        try:
+            await asyncio.wait_for(self._execute(self._conn, "SELECT 1"), self.ping_timeout)
+        except asyncio.TimeoutError:
+            raise psycopg2.OperationalError("la conexión no responde al ping")
+        loop.add_reader(self._fd, self._on_readable)
+        self._drain()
+
+    def _on_readable(self) -> None:
+        try:
+            self._conn.poll()
+        except Exception as e:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            if not self._lost.done():
+                self._lost.set_exception(e)
+            return
+        self._drain()
+
+    def _drain(self) -> None:
+        while self._conn.notifies:
+            self._handle(self._conn.notifies.pop(0).payload)
+
+    def _handle(self, payload: str) -> None:
+        self.stats["received"] += 1
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            self.stats["errors"] += 1
+            return
+        if self.origin is not None and event.get("origin") == self.origin:
+            self.stats["own"] += 1
+            return
+        try:
+            applied = self.apply(event)
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Error aplicando invalidación {event}: {e}")
+            return
+        self.stats["applied" if applied else "ignored"] += 1
@@ -0,0 +1,595 @@
+import functools
+import threading
+from datetime import datetime
+
+import psycopg2
+
+from db import IMPORT_COLUMNS, InsufficientFunds, PieceUnavailable, diff_import
+
+
+class MemoryStore:
+    def __init__(self):
+        self.jugadores = {}
+        self.administradores = {}
+        self.usuarios_bloqueados = {}
+        self.belenes = {}
+        self.miembros_belen = {}
+        self.solicitudes_union = {}
+        self.piezas_catalogo = {}
+        self.piezas_belen = {}
+        self.contribuciones_belen = {}
+        self.tareas = {}
+        self.tareas_completadas = {}
+        self.bot_estado = {}
+        self._sequences = {}
+
+    def next_id(self, table: str) -> int:
+        self._sequences[table] = self._sequences.get(table, 0) + 1
+        return self._sequences[table]
+
+
+_store = MemoryStore()
+_lock = threading.RLock()
+
+def reset() -> None:
+    global _store
+    with _lock:
+        _store = MemoryStore()
+
+def _transaction(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _lock:
+            return func(_store, *args, **kwargs)
+    return wrapper
+
+def _require(table: dict, key, constraint: str) -> None:
+    if key not in table:
+        raise psycopg2.IntegrityError(f'insert or update violates foreign key constraint "{constraint}"')
+
+def _keyset(rows: list, key, descending: bool, after, before, limit: int, last: bool) -> list:
+    if after is not None:
+        after = tuple(after)
+        rows = [row for row in rows if (key(row) < after if descending else key(row) > after)]
+        return rows[:limit]
+    if before is not None or last:
+        if before is not None:
+            before = tuple(before)
+            rows = [row for row in rows if (key(row) > before if descending else key(row) < before)]
+        return rows[-limit:] if limit else []
+    return rows[:limit]
+
+def _delete_belen_rows(s: MemoryStore, belen_id: int) -> None:
+    del s.belenes[belen_id]
+    for table in (s.miembros_belen, s.contribuciones_belen):
+        for key in [key for key in table if key[0] == belen_id]:
+            del table[key]
+    for table in (s.solicitudes_union, s.piezas_belen):
+        for key in [key for key, row in table.items() if row['belen_id'] == belen_id]:
+            del table[key]
+
+def _add_contribution(s: MemoryStore, piece: dict) -> None:
+    key = (piece['belen_id'], piece['comprador_id'])
+    row = s.contribuciones_belen.setdefault(key, {'belen_id': key[0], 'jugador_id': key[1], 'contribucion': 0})
+    row['contribucion'] += piece['cantidad'] * piece['precio_unitario']
+
+def _ensure_player(s: MemoryStore, user_id: int, username: str) -> dict:
+    row = s.jugadores.get(user_id)
+    if row is None:
+        row = s.jugadores[user_id] = {'id': user_id, 'username': username, 'monedas': 0, 'created_at': datetime.now()}
+    else:
+        row['username'] = username
+    return row
+
+@_transaction
+def get_setting(s, clave: str):
+    return s.bot_estado.get(clave)
+
+@_transaction
+def set_setting(s, clave: str, valor: str) -> None:
+    s.bot_estado[clave] = valor
+
+@_transaction
+def jugador_existe(s, user_id: int) -> bool:
+    return user_id in s.jugadores
+
+@_transaction
+def registrar_jugador(s, user_id: int, username: str) -> None:
+    if user_id not in s.jugadores:
+        _ensure_player(s, user_id, username)
+
+@_transaction
+def actualizar_username(s, user_id: int, username: str) -> None:
+    if user_id in s.jugadores:
+        s.jugadores[user_id]['username'] = username
+
+@_transaction
+def ensure_player(s, user_id: int, username: str) -> None:
+    _ensure_player(s, user_id, username)
+
+@_transaction
+def get_request_context(s, user_id: int, username: str) -> dict:
+    player = _ensure_player(s, user_id, username)
+    return {'monedas': player['monedas']}
+
+@_transaction
+def _load_admin_ids(s):
+    return list(s.administradores)
+
+@_transaction
+def _load_blocked_ids(s):
+    return list(s.usuarios_bloqueados)
+
+@_transaction
+def get_monedas(s, user_id: int) -> int:
+    player = s.jugadores.get(user_id)
+    return player['monedas'] if player else 0
+
+@_transaction
+def update_monedas(s, user_id: int, delta: int) -> int:
+    player = s.jugadores.get(user_id)
+    if player is None:
+        return 0
+    player['monedas'] += delta
+    return player['monedas']
+
+@_transaction
+def bulk_update_monedas(s, deltas: dict, usernames: dict = None, create: bool = True) -> dict:
+    usernames = usernames or {}
+    applied = nuevos = total = 0
+    for user_id, delta in deltas.items():
+        player = s.jugadores.get(user_id)
+        if player is None:
+            if not create:
+                continue
+            player = _ensure_player(s, user_id, usernames.get(user_id))
+            nuevos += 1
+        elif usernames.get(user_id) is not None:
+            player['username'] = usernames[user_id]
+        player['monedas'] += delta
+        applied += 1
+        total += delta
+    return {'jugadores': applied, 'nuevos': nuevos, 'omitidos': len(deltas) - applied, 'total': total}
+
+@_transaction
+def bulk_update_belen_monedas(s, belen_id: int, delta: int) -> dict:
+    updated = 0
+    for member_belen_id, jugador_id in s.miembros_belen:
+        if member_belen_id == belen_id:
+            s.jugadores[jugador_id]['monedas'] += delta
+            updated += 1
+    return {'jugadores': updated, 'nuevos': 0, 'omitidos': 0, 'total': delta * updated}
+
+@_transaction
+def _insert_admin(s, user_id: int) -> bool:
+    if user_id in s.administradores:
+        return False
+    s.administradores[user_id] = {'id': user_id, 'created_at': datetime.now()}
+    return True
+
+@_transaction
+def _delete_admin(s, user_id: int) -> bool:
+    return s.administradores.pop(user_id, None) is not None
+
+@_transaction
+def _insert_blocked(s, user_id: int, reason: str = None) -> bool:
+    if user_id in s.usuarios_bloqueados:
+        return False
+    s.usuarios_bloqueados[user_id] = {'id': user_id, 'reason': reason, 'created_at': datetime.now()}
+    return True
+
+@_transaction
+def _delete_blocked(s, user_id: int) -> bool:
+    return s.usuarios_bloqueados.pop(user_id, None) is not None
+
+@_transaction
+def find_belen(s, identifier: str):
+    if identifier.isdigit():
+        belen = s.belenes.get(int(identifier))
+        return dict(belen) if belen else None
+    nombre = identifier.lower()
+    for belen in s.belenes.values():
+        if belen['nombre'].lower() == nombre:
+            return dict(belen)
+    return None
+
+@_transaction
+def get_user_belen(s, user_id: int):
+    for belen_id, jugador_id in s.miembros_belen:
+        if jugador_id == user_id:
+            return dict(s.belenes[belen_id])
+    return None
+
+@_transaction
+def _insert_belen(s, nombre: str, creador_id: int, descripcion: str = None) -> int:
+    _require(s.jugadores, creador_id, "belenes_creador_id_fkey")
+    belen_id = s.next_id("belenes")
+    now = datetime.now()
+    s.belenes[belen_id] = {'id': belen_id, 'nombre': nombre, 'creador_id': creador_id, 'descripcion': descripcion, 'created_at': now}
+    s.miembros_belen[(belen_id, creador_id)] = {'belen_id': belen_id, 'jugador_id': creador_id, 'joined_at': now}
+    return belen_id
+
+@_transaction
+def _delete_belen(s, belen_id: int) -> bool:
+    if belen_id not in s.belenes:
+        return False
+    _delete_belen_rows(s, belen_id)
+    return True
+
+@_transaction
+def _load_belenes(s):
+    return [{'id': belen['id'], 'nombre': belen['nombre']} for belen in s.belenes.values()]
+
+@_transaction
+def add_member_to_belen(s, belen_id: int, jugador_id: int) -> bool:
+    if belen_id not in s.belenes or jugador_id not in s.jugadores or (belen_id, jugador_id) in s.miembros_belen:
+        return False
+    s.miembros_belen[(belen_id, jugador_id)] = {'belen_id': belen_id, 'jugador_id': jugador_id, 'joined_at': datetime.now()}
+    return True
+
+@_transaction
+def _leave_belen(s, jugador_id: int) -> dict:
+    belen = get_user_belen(jugador_id)
+    if not belen:
+        return None
+    if belen['creador_id'] == jugador_id:
+        _delete_belen_rows(s, belen['id'])
+        return {'deleted': True, 'belen': belen}
+    del s.miembros_belen[(belen['id'], jugador_id)]
+    return {'deleted': False, 'belen': belen}
+
+@_transaction
+def create_join_request(s, belen_id: int, jugador_id: int) -> int:
+    _require(s.belenes, belen_id, "solicitudes_union_belen_id_fkey")
+    _require(s.jugadores, jugador_id, "solicitudes_union_jugador_id_fkey")
+    for request in s.solicitudes_union.values():
+        if request['belen_id'] == belen_id and request['jugador_id'] == jugador_id:
+            request['estado'] = 'pendiente'
+            request['created_at'] = datetime.now()
+            return request['id']
+    request_id = s.next_id("solicitudes_union")
+    s.solicitudes_union[request_id] = {
+        'id': request_id, 'belen_id': belen_id, 'jugador_id': jugador_id,
+        'estado': 'pendiente', 'created_at': datetime.now(),
+    }
+    return request_id
+
+@_transaction
+def get_join_request(s, request_id: int):
+    request = s.solicitudes_union.get(request_id)
+    if request is None:
+        return None
+    belen = s.belenes[request['belen_id']]
+    return dict(request, belen_nombre=belen['nombre'], creador_id=belen['creador_id'], username=s.jugadores[request['jugador_id']]['username'])
+
+@_transaction
+def get_pending_requests_for_belen(s, belen_id: int):
+    requests = [r for r in s.solicitudes_union.values() if r['belen_id'] == belen_id and r['estado'] == 'pendiente']
+    requests.sort(key=lambda r: (r['created_at'], r['id']))
+    return [dict(r, username=s.jugadores[r['jugador_id']]['username']) for r in requests]
+
+@_transaction
+def accept_join_request(s, request_id: int) -> bool:
+    request = s.solicitudes_union.get(request_id)
+    if request is None or request['estado'] != 'pendiente':
+        return False
+    request['estado'] = 'aceptada'
+    key = (request['belen_id'], request['jugador_id'])
+    if key not in s.miembros_belen:
+        s.miembros_belen[key] = {'belen_id': key[0], 'jugador_id': key[1], 'joined_at': datetime.now()}
+    return True
+
+@_transaction
+def reject_join_request(s, request_id: int) -> bool:
+    request = s.solicitudes_union.get(request_id)
+    if request is None or request['estado'] != 'pendiente':
+        return False
+    request['estado'] = 'rechazada'
+    return True
+
+@_transaction
+def _load_store_items(s):
+    return [dict(item) for item in sorted(s.piezas_catalogo.values(), key=lambda item: (item['precio'], item['id']))]
+
+@_transaction
+def _insert_store_item(s, nombre: str, precio: int, descripcion: str, emoji: str) -> int:
+    item_id = s.next_id("piezas_catalogo")
+    s.piezas_catalogo[item_id] = {
+        'id': item_id, 'nombre': nombre, 'precio': precio, 'descripcion': descripcion,
+        'emoji': emoji, 'created_at': datetime.now(),
+    }
+    return item_id
+
+@_transaction
+def _update_store_item(s, item_id: int, fields: dict) -> bool:
+    item = s.piezas_catalogo.get(item_id)
+    if item is None:
+        return False
+    item.update(fields)
+    return True
+
+@_transaction
+def _delete_store_item(s, item_id: int) -> bool:
+    if s.piezas_catalogo.pop(item_id, None) is None:
+        return False
+    for row in s.piezas_belen.values():
+        if row['pieza_id'] == item_id:
+            row['pieza_id'] = None
+    return True
+
+def _insert_piece(s: MemoryStore, belen_id: int, pieza_id: int, comprador_id: int, cantidad: int) -> dict:
+    piece_id = s.next_id("piezas_belen")
+    piece = s.piezas_belen[piece_id] = {
+        'id': piece_id, 'belen_id': belen_id, 'pieza_id': pieza_id, 'comprador_id': comprador_id,
+        'cantidad': cantidad, 'precio_unitario': s.piezas_catalogo[pieza_id]['precio'], 'purchased_at': datetime.now(),
+    }
+    return piece
+
+@_transaction
+def record_purchase(s, belen_id: int, pieza_id: int, comprador_id: int, cantidad: int) -> bool:
+    _require(s.belenes, belen_id, "piezas_belen_belen_id_fkey")
+    _require(s.piezas_catalogo, pieza_id, "piezas_belen_pieza_id_fkey")
+    _require(s.jugadores, comprador_id, "piezas_belen_comprador_id_fkey")
+    _add_contribution(s, _insert_piece(s, belen_id, pieza_id, comprador_id, cantidad))
+    return True
+
+@_transaction
+def purchase(s, jugador_id: int, belen_id: int, pieza_id: int, cantidad: int):
+    item = s.piezas_catalogo.get(pieza_id)
+    if item is None:
+        return PieceUnavailable(pieza_id)
+    coste = item['precio'] * cantidad
+    player = s.jugadores.get(jugador_id)
+    if player is None or player['monedas'] < coste:
+        return InsufficientFunds(player['monedas'] if player else 0, coste)
+    _require(s.belenes, belen_id, "piezas_belen_belen_id_fkey")
+    player['monedas'] -= coste
+    _add_contribution(s, _insert_piece(s, belen_id, pieza_id, jugador_id, cantidad))
+    return player['monedas']
+
+@_transaction
+def get_belen_pieces(s, belen_id: int, limit: int = 10, max_buyers: int = 3) -> dict:
+    groups = {}
+    for row in s.piezas_belen.values():
+        if row['belen_id'] != belen_id or row['pieza_id'] is None:
+            continue
+        group = groups.setdefault(row['pieza_id'], {'cantidad': 0, 'compradores': set(), 'last': row['purchased_at']})
+        group['cantidad'] += row['cantidad']
+        group['compradores'].add(row['comprador_id'])
+        group['last'] = max(group['last'], row['purchased_at'])
+    ordered = sorted(groups.items(), key=lambda item: (-item[1]['last'].timestamp(), item[0]))
+    pieces = []
+    for pieza_id, group in ordered[:limit]:
+        pieza = s.piezas_catalogo[pieza_id]
+        names = sorted({s.jugadores[comprador]['username'] for comprador in group['compradores']})
+        pieces.append({
+            'nombre': pieza['nombre'],
+            'emoji': pieza['emoji'],
+            'cantidad': group['cantidad'],
+            'compradores': names[:max_buyers],
+            'num_compradores': len(group['compradores']),
+            'total': len(groups),
+        })
+    return {'pieces': pieces, 'total': len(groups)}
+
+@_transaction
+def get_belen_members(s, belen_id: int):
+    members = []
+    for key in s.miembros_belen:
+        if key[0] != belen_id:
+            continue
+        player = s.jugadores[key[1]]
+        contribution = s.contribuciones_belen.get(key)
+        members.append({'id': player['id'], 'username': player['username'], 'contribucion': contribution['contribucion'] if contribution else 0})
+    members.sort(key=lambda member: member['contribucion'], reverse=True)
+    return members
+
+@_transaction
+def rebuild_contributions(s, apply: bool = False) -> list:
+    raw = {}
+    for row in s.piezas_belen.values():
+        key = (row['belen_id'], row['comprador_id'])
+        raw[key] = raw.get(key, 0) + row['cantidad'] * row['precio_unitario']
+    mismatches = []
+    for key in sorted(set(raw) | set(s.contribuciones_belen)):
+        esperado = raw.get(key, 0)
+        actual = s.contribuciones_belen[key]['contribucion'] if key in s.contribuciones_belen else 0
+        if esperado != actual:
+            mismatches.append({'belen_id': key[0], 'jugador_id': key[1], 'esperado': esperado, 'actual': actual})
+    if apply and mismatches:
+        s.contribuciones_belen = {
+            key: {'belen_id': key[0], 'jugador_id': key[1], 'contribucion': value} for key, value in raw.items()
+        }
+    return mismatches
+
+def _available_tareas(s: MemoryStore, user_id: int) -> list:
+    approved = {row['tarea_id'] for row in s.tareas_completadas.values() if row['jugador_id'] == user_id and row['estado'] == 'aprobada'}
+    return [tarea for tarea in s.tareas.values() if tarea['id'] not in approved]
+
+@_transaction
+def list_tareas(s):
+    return [dict(tarea) for tarea in sorted(s.tareas.values(), key=lambda tarea: tarea['recompensa'], reverse=True)]
+
+@_transaction
+def get_tarea(s, tarea_id: int):
+    tarea = s.tareas.get(tarea_id)
+    return dict(tarea) if tarea else None
+
+@_transaction
+def get_available_tareas(s, user_id: int):
+    return [dict(tarea) for tarea in sorted(_available_tareas(s, user_id), key=lambda tarea: tarea['recompensa'], reverse=True)]
+
+@_transaction
+def get_available_tareas_page(s, user_id: int, after: tuple = None, before: tuple = None, limit: int = 5, last: bool = False) -> list:
+    key = lambda tarea: (tarea['recompensa'], tarea['id'])
+    rows = sorted(_available_tareas(s, user_id), key=key, reverse=True)
+    return [dict(tarea) for tarea in _keyset(rows, key, True, after, before, limit, last)]
+
+@_transaction
+def count_available_tareas(s, user_id: int) -> int:
+    return len(_available_tareas(s, user_id))
+
+@_transaction
+def _insert_tarea(s, nombre: str, descripcion: str, recompensa: int) -> int:
+    tarea_id = s.next_id("tareas")
+    s.tareas[tarea_id] = {'id': tarea_id, 'nombre': nombre, 'descripcion': descripcion, 'recompensa': recompensa, 'created_at': datetime.now()}
+    return tarea_id
+
+@_transaction
+def _update_tarea(s, tarea_id: int, fields: dict) -> bool:
+    if tarea_id not in s.tareas:
+        return False
+    s.tareas[tarea_id].update(fields)
+    return True
+
+@_transaction
+def _delete_tarea(s, tarea_id: int) -> bool:
+    if s.tareas.pop(tarea_id, None) is None:
+        return False
+    for key in [key for key, row in s.tareas_completadas.items() if row['tarea_id'] == tarea_id]:
+        del s.tareas_completadas[key]
+    return True
+
+@_transaction
+def submit_tarea(s, tarea_id: int, jugador_id: int, nota: str = None) -> int:
+    _require(s.tareas, tarea_id, "tareas_completadas_tarea_id_fkey")
+    _require(s.jugadores, jugador_id, "tareas_completadas_jugador_id_fkey")
+    submission_id = s.next_id("tareas_completadas")
+    s.tareas_completadas[submission_id] = {
+        'id': submission_id, 'tarea_id': tarea_id, 'jugador_id': jugador_id, 'nota': nota,
+        'estado': 'pendiente', 'created_at': datetime.now(), 'reviewed_at': None,
+    }
+    return submission_id
+
+def _submission_row(s: MemoryStore, submission: dict) -> dict:
+    tarea = s.tareas[submission['tarea_id']]
+    return dict(submission, tarea_nombre=tarea['nombre'], recompensa=tarea['recompensa'], username=s.jugadores[submission['jugador_id']]['username'])
+
+def _pending_submissions(s: MemoryStore) -> list:
+    key = lambda row: (row['created_at'], row['id'])
+    return sorted((row for row in s.tareas_completadas.values() if row['estado'] == 'pendiente'), key=key)
+
+@_transaction
+def get_pending_tarea_submissions(s):
+    return [_submission_row(s, row) for row in _pending_submissions(s)]
+
+@_transaction
+def get_pending_tarea_submissions_page(s, after: tuple = None, before: tuple = None, limit: int = 5, last: bool = False) -> list:
+    rows = _keyset(_pending_submissions(s), lambda row: (row['created_at'], row['id']), False, after, before, limit, last)
+    return [_submission_row(s, row) for row in rows]
+
+@_transaction
+def count_pending_tarea_submissions(s) -> int:
+    return len(_pending_submissions(s))
+
+@_transaction
+def get_tarea_submission(s, submission_id: int):
+    submission = s.tareas_completadas.get(submission_id)
+    return _submission_row(s, submission) if submission else None
+
+@_transaction
+def approve_tarea_submission(s, submission_id: int) -> dict:
+    submission = s.tareas_completadas.get(submission_id)
+    if submission is None or submission['estado'] != 'pendiente':
+        return None
+    submission['estado'] = 'aprobada'
+    submission['reviewed_at'] = datetime.now()
+    tarea = s.tareas[submission['tarea_id']]
+    player = s.jugadores.get(submission['jugador_id'])
+    if player is not None:
+        player['monedas'] += tarea['recompensa']
+    return {'recompensa': tarea['recompensa'], 'jugador_id': submission['jugador_id']}
+
+@_transaction
+def reject_tarea_submission(s, submission_id: int) -> bool:
+    submission = s.tareas_completadas.get(submission_id)
+    if submission is None or submission['estado'] != 'pendiente':
+        return False
+    submission['estado'] = 'rechazada'
+    submission['reviewed_at'] = datetime.now()
+    return True
+
+@_transaction
+def review_tarea_submissions(s, aprobar: bool, submission_ids: list = None, tarea_id: int = None) -> list:
+    ids = set(submission_ids or [])
+    reviewed = []
+    now = datetime.now()
+    for submission in sorted(s.tareas_completadas.values(), key=lambda row: row['id']):
+        if submission['estado'] != 'pendiente' or (submission['id'] not in ids and submission['tarea_id'] != tarea_id):
+            continue
+        submission['estado'] = 'aprobada' if aprobar else 'rechazada'
+        submission['reviewed_at'] = now
+        tarea = s.tareas[submission['tarea_id']]
+        reviewed.append({
+            'id': submission['id'], 'jugador_id': submission['jugador_id'], 'tarea_nombre': tarea['nombre'],
+            'recompensa': tarea['recompensa'], 'username': s.jugadores[submission['jugador_id']]['username'],
+        })
+    if aprobar:
+        for row in reviewed:
+            s.jugadores[row['jugador_id']]['monedas'] += row['recompensa']
+    return reviewed
+
+@_transaction
+def has_pending_submission(s, tarea_id: int, jugador_id: int) -> bool:
+    return any(
+        row['tarea_id'] == tarea_id and row['jugador_id'] == jugador_id and row['estado'] == 'pendiente'
+        for row in s.tareas_completadas.values()
+    )
+
+def _batches(rows: list, batch_size: int):
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
+
+@_transaction
+def iter_export(s, name: str, batch_size: int = 1000):
+    if name == 'piezas_belen':
+        rows = [
+            (row['id'], row['belen_id'], s.belenes[row['belen_id']]['nombre'], row['pieza_id'],
+             s.piezas_catalogo[row['pieza_id']]['nombre'] if row['pieza_id'] is not None else None, row['precio_unitario'], row['cantidad'],
+             row['comprador_id'], s.jugadores[row['comprador_id']]['username'], row['purchased_at'])
+            for row in sorted(s.piezas_belen.values(), key=lambda row: row['id'])
+        ]
+    elif name == 'tareas_completadas':
+        rows = [
+            (row['id'], row['tarea_id'], s.tareas[row['tarea_id']]['nombre'], s.tareas[row['tarea_id']]['recompensa'],
+             row['jugador_id'], s.jugadores[row['jugador_id']]['username'], row['estado'], row['nota'], row['created_at'], row['reviewed_at'])
+            for row in sorted(s.tareas_completadas.values(), key=lambda row: row['id'])
+        ]
+    elif name == 'saldos':
+        rows = [(row['id'], row['username'], row['monedas'], row['created_at']) for row in sorted(s.jugadores.values(), key=lambda row: row['id'])]
+    elif name == 'miembros':
+        rows = []
+        for key, row in sorted(s.miembros_belen.items(), key=lambda item: (item[0][0], item[1]['joined_at'], item[0][1])):
+            belen = s.belenes[key[0]]
+            contribution = s.contribuciones_belen.get(key)
+            rows.append((key[0], belen['nombre'], key[1], s.jugadores[key[1]]['username'], belen['creador_id'] == key[1],
+                         contribution['contribucion'] if contribution else 0, row['joined_at']))
+    else:
+        raise KeyError(name)
+    return _batches(rows, batch_size)
+
+@_transaction
+def _import_rows(s, table: str, rows: list, dry_run: bool = False) -> dict:
+    columns = IMPORT_COLUMNS[table]
+    target = getattr(s, table)
+    by_name = {}
+    for row in target.values():
+        by_name.setdefault(row['nombre'].lower(), []).append(row)
+    pairs = []
+    for row in rows:
+        nuevo = {column: row.get(column) for column in columns}
+        for actual in by_name.get(nuevo['nombre'].lower(), [None]):
+            pairs.append((nuevo, {column: actual[column] for column in columns} if actual else None))
+    diff = diff_import(columns, pairs)
+    if dry_run:
+        return diff
+    for row in rows:
+        nuevo = {column: row.get(column) for column in columns}
+        existing = by_name.get(nuevo['nombre'].lower())
+        if existing:
+            for actual in existing:
+                actual.update(nuevo)
+        else:
+            row_id = s.next_id(table)
+            target[row_id] = {'id': row_id, **nuevo, 'created_at': datetime.now()}
+    return diff
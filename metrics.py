@@ -0,0 +1,153 @@
+import contextvars
+import functools
+import time
+from collections import deque
+
+from aiohttp import web
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+_invocation = contextvars.ContextVar("invocation", default=None)
+_summaries = {}
+_counters = {}
+_gauges = {}
+
+
+class Summary:
+    def __init__(self, window: int = 2048):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def quantiles(self) -> dict:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+
+def _observe(metric: str, labels: tuple, value: float) -> None:
+    key = (metric, labels)
+    summary = _summaries.get(key)
+    if summary is None:
+        summary = _summaries[key] = Summary()
+    summary.observe(value)
+
+def _increment(metric: str, labels: tuple, value: float = 1) -> None:
+    key = (metric, labels)
+    _counters[key] = _counters.get(key, 0) + value
+
+def increment(metric: str, labels: tuple = (), value: float = 1) -> None:
+    _increment(metric, labels, value)
+
+def counter_value(metric: str, labels: tuple = ()) -> float:
+    return _counters.get((metric, labels), 0)
+
+def record_db(elapsed: float) -> None:
+    invocation = _invocation.get()
+    _increment("botevento_db_calls_total", ())
+    if invocation is not None:
+        invocation["db_calls"] += 1
+        invocation["db_time"] += elapsed
+
+def mark_deferred() -> None:
+    invocation = _invocation.get()
+    if invocation is not None and invocation["deferred"] is None:
+        invocation["deferred"] = time.perf_counter() - invocation["start"]
+
+async def measure(name: str, kind: str, interaction, callback):
+    invocation = {"start": time.perf_counter(), "deferred": None, "db_calls": 0, "db_time": 0.0}
+    token = _invocation.set(invocation)
+    labels = (("kind", kind), ("name", name))
+    try:
+        return await callback()
+    except Exception:
+        _increment("botevento_interaction_errors_total", labels)
+        raise
+    finally:
+        _invocation.reset(token)
+        latency = time.perf_counter() - invocation["start"]
+        deferred = invocation["deferred"]
+        if deferred is None and interaction is not None and interaction.response.is_done():
+            deferred = latency
+        _observe("botevento_interaction_latency_seconds", labels, latency)
+        if deferred is not None:
+            _observe("botevento_interaction_ack_seconds", labels, deferred)
+        _observe("botevento_interaction_db_calls", labels, invocation["db_calls"])
+        _observe("botevento_interaction_db_seconds", labels, invocation["db_time"])
+
+def instrument(name: str, kind: str = "command"):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(interaction, *args, **kwargs):
+            return await measure(name, kind, interaction, lambda: func(interaction, *args, **kwargs))
+        return wrapper
+    return decorator
+
+def instrument_button(func):
+    @functools.wraps(func)
+    async def wrapper(self, interaction, button):
+        name = f"{type(self).__name__}.{func.__name__}"
+        return await measure(name, "button", interaction, lambda: func(self, interaction, button))
+    return wrapper
+
+def register_gauges(prefix: str, collector) -> None:
+    _gauges[prefix] = collector
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+def render() -> str:
+    lines = []
+    by_metric = {}
+    for (metric, labels), summary in sorted(_summaries.items()):
+        by_metric.setdefault(metric, []).append((labels, summary))
+    for metric, entries in by_metric.items():
+        lines.append(f"# TYPE {metric} summary")
+        for labels, summary in entries:
+            for q, value in summary.quantiles().items():
+                lines.append(f"{metric}{_format_labels(labels, (('quantile', q),))} {value}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {summary.sum}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {summary.count}")
+    by_metric = {}
+    for (metric, labels), value in sorted(_counters.items()):
+        by_metric.setdefault(metric, []).append((labels, value))
+    for metric, entries in by_metric.items():
+        lines.append(f"# TYPE {metric} counter")
+        for labels, value in entries:
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+    for prefix, collector in sorted(_gauges.items()):
+        try:
+            values = collector()
+        except Exception:
+            continue
+        for key, value in sorted(values.items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {value}")
+    return "\n".join(lines) + "\n"
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    response = web.Response(text=render())
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return response
+
+async def start_server(host: str = "127.0.0.1", port: int = 9300) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    return runner
@@ -0,0 +1,249 @@
+import json
+import os
+import sys
+
+import db
+from db import DB_BACKEND, get_connection
+
+MIGRATIONS = [
+    (1, "Tablas base", [
+        """CREATE TABLE IF NOT EXISTS jugadores (
+            id BIGINT PRIMARY KEY,
+            username TEXT,
+            monedas INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+        """CREATE TABLE IF NOT EXISTS administradores (
+            id BIGINT PRIMARY KEY,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+        """CREATE TABLE IF NOT EXISTS usuarios_bloqueados (
+            id BIGINT PRIMARY KEY,
+            reason TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+        """CREATE TABLE IF NOT EXISTS belenes (
+            id SERIAL PRIMARY KEY,
+            nombre TEXT NOT NULL,
+            creador_id BIGINT REFERENCES jugadores(id),
+            descripcion TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+        """CREATE TABLE IF NOT EXISTS miembros_belen (
+            belen_id INTEGER NOT NULL REFERENCES belenes(id) ON DELETE CASCADE,
+            jugador_id BIGINT NOT NULL REFERENCES jugadores(id),
+            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (belen_id, jugador_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS solicitudes_union (
+            id SERIAL PRIMARY KEY,
+            belen_id INTEGER NOT NULL REFERENCES belenes(id) ON DELETE CASCADE,
+            jugador_id BIGINT NOT NULL REFERENCES jugadores(id),
+            estado TEXT NOT NULL DEFAULT 'pendiente',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (belen_id, jugador_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS piezas_catalogo (
+            id SERIAL PRIMARY KEY,
+            nombre TEXT NOT NULL,
+            precio INTEGER NOT NULL,
+            descripcion TEXT,
+            emoji TEXT DEFAULT '🎁',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+        """CREATE TABLE IF NOT EXISTS piezas_belen (
+            id SERIAL PRIMARY KEY,
+            belen_id INTEGER NOT NULL REFERENCES belenes(id) ON DELETE CASCADE,
+            pieza_id INTEGER NOT NULL REFERENCES piezas_catalogo(id) ON DELETE CASCADE,
+            comprador_id BIGINT NOT NULL REFERENCES jugadores(id),
+            cantidad INTEGER NOT NULL DEFAULT 1,
+            purchased_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+        """CREATE TABLE IF NOT EXISTS tareas (
+            id SERIAL PRIMARY KEY,
+            nombre TEXT NOT NULL,
+            descripcion TEXT,
+            recompensa INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+        """CREATE TABLE IF NOT EXISTS tareas_completadas (
+            id SERIAL PRIMARY KEY,
+            tarea_id INTEGER NOT NULL REFERENCES tareas(id) ON DELETE CASCADE,
+            jugador_id BIGINT NOT NULL REFERENCES jugadores(id),
+            nota TEXT,
+            estado TEXT NOT NULL DEFAULT 'pendiente',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            reviewed_at TIMESTAMP
+        )""",
+    ]),
+    (2, "Contribuciones acumuladas por miembro", [
+        """CREATE TABLE IF NOT EXISTS contribuciones_belen (
+            belen_id INTEGER NOT NULL REFERENCES belenes(id) ON DELETE CASCADE,
+            jugador_id BIGINT NOT NULL,
+            contribucion BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (belen_id, jugador_id)
+        )""",
+        "LOCK TABLE piezas_belen IN SHARE MODE",
+        """INSERT INTO contribuciones_belen (belen_id, jugador_id, contribucion)
+           SELECT pb.belen_id, pb.comprador_id, SUM(pb.cantidad * pc.precio)
+           FROM piezas_belen pb
+           JOIN piezas_catalogo pc ON pb.pieza_id = pc.id
+           GROUP BY pb.belen_id, pb.comprador_id
+           ON CONFLICT (belen_id, jugador_id) DO NOTHING""",
+    ]),
+    (3, "Índices de las consultas frecuentes", [
+        "CREATE INDEX IF NOT EXISTS idx_belenes_nombre_lower ON belenes (LOWER(nombre))",
+        "CREATE INDEX IF NOT EXISTS idx_piezas_catalogo_nombre_lower ON piezas_catalogo (LOWER(nombre))",
+        "CREATE INDEX IF NOT EXISTS idx_piezas_catalogo_precio ON piezas_catalogo (precio, id)",
+        "CREATE INDEX IF NOT EXISTS idx_miembros_belen_jugador ON miembros_belen (jugador_id)",
+        "CREATE INDEX IF NOT EXISTS idx_solicitudes_union_pendientes ON solicitudes_union (belen_id, created_at) WHERE estado = 'pendiente'",
+        "CREATE INDEX IF NOT EXISTS idx_piezas_belen_belen ON piezas_belen (belen_id, purchased_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_tareas_recompensa ON tareas (recompensa DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_tareas_completadas_tarea_jugador ON tareas_completadas (tarea_id, jugador_id, estado)",
+        "CREATE INDEX IF NOT EXISTS idx_tareas_completadas_pendientes ON tareas_completadas (created_at, id) WHERE estado = 'pendiente'",
+    ]),
+    (4, "Estado persistente del bot", [
+        """CREATE TABLE IF NOT EXISTS bot_estado (
+            clave TEXT PRIMARY KEY,
+            valor TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+    ]),
+    (5, "Precio unitario en cada compra", [
+        "ALTER TABLE piezas_belen ADD COLUMN IF NOT EXISTS precio_unitario INTEGER",
+        """UPDATE piezas_belen pb SET precio_unitario = pc.precio
+           FROM piezas_catalogo pc
+           WHERE pc.id = pb.pieza_id AND pb.precio_unitario IS NULL""",
+        "ALTER TABLE piezas_belen ALTER COLUMN precio_unitario SET NOT NULL",
+        "ALTER TABLE piezas_belen ALTER COLUMN pieza_id DROP NOT NULL",
+        "ALTER TABLE piezas_belen DROP CONSTRAINT IF EXISTS piezas_belen_pieza_id_fkey",
+        """ALTER TABLE piezas_belen ADD CONSTRAINT piezas_belen_pieza_id_fkey
+           FOREIGN KEY (pieza_id) REFERENCES piezas_catalogo(id) ON DELETE SET NULL""",
+    ]),
+]
+
+PLAN_CHECK_ROWS = int(os.environ.get("PLAN_CHECK_ROWS", "20000"))
+
+HOT_QUERIES = [
+    ("find_belen", "idx_belenes_nombre_lower", db.FIND_BELEN_SQL, ("plan-belen-1",)),
+    ("get_user_belen", "idx_miembros_belen_jugador", db.USER_BELEN_SQL, (-1,)),
+    ("get_pending_requests_for_belen", "idx_solicitudes_union_pendientes", db.PENDING_REQUESTS_SQL, (-1,)),
+    ("get_belen_pieces", "idx_piezas_belen_belen", db.BELEN_PIECES_SQL, (3, -1, 10)),
+    ("get_belen_members", "miembros_belen_pkey", db.BELEN_MEMBERS_SQL, (-1,)),
+    ("get_available_tareas_page", "idx_tareas_recompensa",
+     db.keyset_query(db.AVAILABLE_TAREAS_SQL, db.AVAILABLE_TAREAS_ORDER, True), (-1, 5)),
+    ("get_pending_tarea_submissions_page", "idx_tareas_completadas_pendientes",
+     db.keyset_query(db.PENDING_SUBMISSIONS_SQL, db.PENDING_SUBMISSIONS_ORDER, False), (5,)),
+    ("has_pending_submission", ("idx_tareas_completadas_tarea_jugador", "idx_tareas_completadas_pendientes"),
+     db.HAS_PENDING_SUBMISSION_SQL, (-1, -1)),
+]
+
+PLAN_CHECK_SEED = [
+    "INSERT INTO jugadores (id, username) SELECT -g, 'plan-' || g FROM generate_series(1, %(filas)s) g",
+    """INSERT INTO belenes (id, nombre, creador_id)
+       SELECT -g, 'plan-belen-' || g, -g FROM generate_series(1, %(grupos)s) g""",
+    """INSERT INTO miembros_belen (belen_id, jugador_id)
+       SELECT -(g %% %(grupos)s + 1), -g FROM generate_series(1, %(filas)s) g""",
+    """INSERT INTO solicitudes_union (id, belen_id, jugador_id, estado)
+       SELECT -g, -((g + 1) %% %(grupos)s + 1), -g, CASE WHEN g %% 10 = 0 THEN 'pendiente' ELSE 'aceptada' END
+       FROM generate_series(1, %(filas)s) g""",
+    """INSERT INTO contribuciones_belen (belen_id, jugador_id, contribucion)
+       SELECT -(g %% %(grupos)s + 1), -g, g FROM generate_series(1, %(filas)s) g""",
+    """INSERT INTO piezas_catalogo (id, nombre, precio)
+       SELECT -g, 'plan-pieza-' || g, g FROM generate_series(1, %(grupos)s) g""",
+    """INSERT INTO piezas_belen (id, belen_id, pieza_id, comprador_id, precio_unitario, purchased_at)
+       SELECT -g, -(g %% %(grupos)s + 1), -(g %% %(grupos)s + 1), -(g %% %(filas)s + 1), 1, NOW() - g * INTERVAL '1 minute'
+       FROM generate_series(1, %(filas)s * 5) g""",
+    """INSERT INTO tareas (id, nombre, recompensa)
+       SELECT -g, 'plan-tarea-' || g, g %% 50 + 1 FROM generate_series(1, %(grupos)s) g""",
+    """INSERT INTO tareas_completadas (id, tarea_id, jugador_id, estado, created_at)
+       SELECT -g, -(g %% %(grupos)s + 1), -(g %% %(filas)s + 1), CASE WHEN g %% 20 = 0 THEN 'pendiente' ELSE 'aprobada' END,
+              NOW() - g * INTERVAL '1 minute'
+       FROM generate_series(1, %(filas)s * 5) g""",
+]
+
+def current_version() -> int:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+            if not cur.fetchone()[0]:
+                return 0
+            cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+            return cur.fetchone()[0]
+
+def migrate() -> list:
+    if DB_BACKEND == "memory":
+        return []
+    applied = []
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    descripcion TEXT,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+    for version, descripcion, statements in MIGRATIONS:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext('schema_version'))")
+                cur.execute("SELECT 1 FROM schema_version WHERE version = %s", (version,))
+                if cur.fetchone():
+                    continue
+                for statement in statements:
+                    cur.execute(statement)
+                cur.execute(
+                    "INSERT INTO schema_version (version, descripcion) VALUES (%s, %s)",
+                    (version, descripcion)
+                )
+                applied.append(version)
+    return applied
+
+def _indexes_used(plan: dict) -> set:
+    found = set()
+    if "Index Name" in plan:
+        found.add(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        found |= _indexes_used(child)
+    return found
+
+def check_query_plans(seed_rows: int = PLAN_CHECK_ROWS) -> dict:
+    report = {}
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            schema = f"plan_check_{os.getpid()}"
+            cur.execute(f"CREATE SCHEMA {schema}")
+            cur.execute(f"SET LOCAL search_path TO {schema}")
+            for _, _, statements in MIGRATIONS:
+                for statement in statements:
+                    cur.execute(statement)
+            if seed_rows > 0:
+                for statement in PLAN_CHECK_SEED:
+                    cur.execute(statement, {'filas': seed_rows, 'grupos': max(1, seed_rows // 10)})
+                cur.execute("SELECT tablename FROM pg_tables WHERE schemaname = %s", (schema,))
+                cur.execute(f"ANALYZE {', '.join(row[0] for row in cur.fetchall())}")
+            for name, index, sql, params in HOT_QUERIES:
+                cur.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                plan = cur.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                expected = (index,) if isinstance(index, str) else index
+                used = _indexes_used(plan[0]["Plan"])
+                report[name] = {'index': " o ".join(expected), 'ok': bool(used.intersection(expected)), 'used': sorted(used)}
+        conn.rollback()
+    return report
+
+if __name__ == "__main__":
+    applied = migrate()
+    print(f"Esquema en versión {current_version()} (aplicadas: {applied or 'ninguna'})")
+    if "--check" in sys.argv:
+        failed = False
+        for name, result in check_query_plans().items():
+            if result['ok']:
+                print(f"✅ {name}: usa {result['index']}")
+            else:
+                failed = True
+                used = ", ".join(result['used']) or "ningún índice"
+                print(f"❌ {name}: no usa {result['index']} ({used})")
+        sys.exit(1 if failed else 0)
@@ -0,0 +1,148 @@
+import asyncio
+import random
+
+import aiohttp
+import discord
+
+
+class NotificationQueue:
+    def __init__(self, client: discord.Client, concurrency: int = 4, max_retries: int = 4,
+                 base_delay: float = 1.0, max_delay: float = 30.0, digest_window: float = 60.0,
+                 resolve_user=None):
+        self.client = client
+        self.resolve_user = resolve_user or client.fetch_user
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.digest_window = digest_window
+        self._queue = asyncio.Queue()
+        self._outbox = {}
+        self._digests = {}
+        self._sending = set()
+        self._workers = []
+        self.stats = {"queued": 0, "sent": 0, "coalesced": 0, "retries": 0, "failed": 0}
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        for _ in range(self.concurrency):
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        for key in list(self._digests):
+            self._flush_digest(key)
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+
+    def notify(self, user_id: int, content: str = None, *, embed: discord.Embed = None) -> None:
+        self.stats["queued"] += 1
+        self._enqueue(user_id, content, embed)
+
+    def _enqueue(self, user_id: int, content: str, embed: discord.Embed) -> None:
+        messages = self._outbox.get(user_id)
+        if messages is None:
+            self._outbox[user_id] = [(content, embed)]
+            if user_id not in self._sending:
+                self._queue.put_nowait(user_id)
+        else:
+            self.stats["coalesced"] += 1
+            messages.append((content, embed))
+
+    def notify_digest(self, user_id: int, key: str, title: str, line: str, color: discord.Color = None) -> None:
+        self.stats["queued"] += 1
+        digest_key = (user_id, key)
+        digest = self._digests.get(digest_key)
+        if digest is None:
+            self._enqueue(user_id, None, self._digest_embed(title, color, [line]))
+            handle = asyncio.get_running_loop().call_later(self.digest_window, self._flush_digest, digest_key)
+            self._digests[digest_key] = {"title": title, "color": color, "lines": [], "handle": handle}
+        else:
+            self.stats["coalesced"] += 1
+            digest["lines"].append(line)
+
+    def _flush_digest(self, digest_key) -> None:
+        digest = self._digests.pop(digest_key, None)
+        if digest is None:
+            return
+        digest["handle"].cancel()
+        if digest["lines"]:
+            self._enqueue(digest_key[0], None, self._digest_embed(digest["title"], digest["color"], digest["lines"]))
+
+    def _digest_embed(self, title: str, color: discord.Color, lines: list) -> discord.Embed:
+        description = "\n\n".join(lines)
+        if len(description) > 4000:
+            description = description[:3990] + "\n..."
+        if len(lines) > 1:
+            title = f"{title} ({len(lines)})"
+        return discord.Embed(title=title, description=description, color=color or discord.Color.blue())
+
+    async def _worker(self) -> None:
+        while True:
+            user_id = await self._queue.get()
+            self._sending.add(user_id)
+            try:
+                messages = self._outbox.pop(user_id, [])
+                if messages:
+                    await self._deliver(user_id, messages)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"Error enviando notificación a {user_id}: {e}")
+            finally:
+                self._sending.discard(user_id)
+                if user_id in self._outbox:
+                    self._queue.put_nowait(user_id)
+                self._queue.task_done()
+
+    def _payloads(self, messages: list) -> list:
+        payloads = []
+        content = ""
+        for text, _ in messages:
+            if not text:
+                continue
+            if content and len(content) + len(text) + 1 > 2000:
+                payloads.append({"content": content})
+                content = ""
+            content = f"{content}\n{text}" if content else text[:2000]
+        embeds = [embed for _, embed in messages if embed]
+        for start in range(0, len(embeds), 10):
+            payloads.append({"embeds": embeds[start:start + 10]})
+        if content:
+            if payloads and "embeds" in payloads[-1] and "content" not in payloads[-1]:
+                payloads[-1]["content"] = content
+            else:
+                payloads.append({"content": content})
+        return payloads
+
+    async def _deliver(self, user_id: int, messages: list) -> None:
+        payloads = self._payloads(messages)
+        for attempt in range(self.max_retries + 1):
+            try:
+                user = await self.resolve_user(user_id)
+                while payloads:
+                    await user.send(**payloads[0])
+                    payloads.pop(0)
+                self.stats["sent"] += 1
+                return
+            except (discord.Forbidden, discord.NotFound):
+                self.stats["failed"] += 1
+                return
+            except discord.HTTPException as e:
+                if e.status != 429 and e.status < 500:
+                    self.stats["failed"] += 1
+                    return
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+            if attempt == self.max_retries:
+                break
+            self.stats["retries"] += 1
+            delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+        self.stats["failed"] += 1
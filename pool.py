@@ -0,0 +1,209 @@
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+
+class PoolTimeout(PoolError):
+    pass
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool:
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10, timeout: float = 30.0,
+                 max_idle: float = 300.0, max_lifetime: float = 1800.0, check_after: float = 30.0,
+                 connection_factory=None):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Tamaño de pool inválido")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self.connection_factory = connection_factory
+        self._idle = deque()
+        self._in_use = {}
+        self._opening = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "timeouts": 0,
+            "opened": 0,
+            "closed": 0,
+            "recycled": 0,
+            "failed_checks": 0,
+        }
+        for _ in range(min_size):
+            self._idle.append(self._open())
+
+    def _open(self) -> _PooledConnection:
+        if self.connection_factory is not None:
+            conn = psycopg2.connect(self.dsn, connection_factory=self.connection_factory)
+        else:
+            conn = psycopg2.connect(self.dsn)
+        self._stats["opened"] += 1
+        return _PooledConnection(conn)
+
+    def _discard(self, pooled: _PooledConnection, to_close: list) -> None:
+        self._stats["closed"] += 1
+        to_close.append(pooled)
+
+    def _close(self, to_close: list) -> None:
+        for pooled in to_close:
+            try:
+                pooled.conn.close()
+            except Exception:
+                pass
+
+    def _is_stale(self, pooled: _PooledConnection, now: float) -> bool:
+        if pooled.conn.closed:
+            return True
+        if self.max_lifetime and now - pooled.created_at > self.max_lifetime:
+            return True
+        if self.max_idle and now - pooled.last_used > self.max_idle and self._size() > self.min_size:
+            return True
+        return False
+
+    def _is_healthy(self, pooled: _PooledConnection, now: float) -> bool:
+        if now - pooled.last_used < self.check_after:
+            return True
+        try:
+            with pooled.conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            pooled.conn.rollback()
+            return True
+        except psycopg2.Error:
+            self._stats["failed_checks"] += 1
+            return False
+
+    def _size(self) -> int:
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        while True:
+            to_close = []
+            try:
+                with self._cond:
+                    if self._closed:
+                        raise PoolError("El pool está cerrado")
+                    pooled = None
+                    while self._idle:
+                        candidate = self._idle.pop()
+                        if self._is_stale(candidate, time.monotonic()):
+                            self._stats["recycled"] += 1
+                            self._discard(candidate, to_close)
+                            continue
+                        pooled = candidate
+                        break
+                    if pooled is None and self._size() < self.max_size:
+                        self._opening += 1
+                    elif pooled is None:
+                        if to_close:
+                            continue
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._stats["timeouts"] += 1
+                            raise PoolTimeout(f"No hay conexiones libres tras {self.timeout}s")
+                        waited = True
+                        self._cond.wait(remaining)
+                        continue
+                    else:
+                        self._in_use[id(pooled.conn)] = pooled
+            finally:
+                self._close(to_close)
+
+            if pooled is None:
+                try:
+                    pooled = self._open()
+                finally:
+                    with self._cond:
+                        self._opening -= 1
+                        self._cond.notify()
+                with self._cond:
+                    self._in_use[id(pooled.conn)] = pooled
+            elif not self._is_healthy(pooled, time.monotonic()):
+                with self._cond:
+                    del self._in_use[id(pooled.conn)]
+                    self._discard(pooled, to_close)
+                    self._cond.notify()
+                self._close(to_close)
+                continue
+
+            elapsed = time.monotonic() - start
+            with self._cond:
+                self._stats["checkouts"] += 1
+                if waited:
+                    self._stats["waits"] += 1
+                self._stats["wait_time_total"] += elapsed
+                self._stats["wait_time_max"] = max(self._stats["wait_time_max"], elapsed)
+            return pooled.conn
+
+    def putconn(self, conn, close: bool = False) -> None:
+        with self._cond:
+            if id(conn) not in self._in_use:
+                return
+        if not close and not conn.closed:
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                close = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    close = True
+        to_close = []
+        with self._cond:
+            pooled = self._in_use.pop(id(conn), None)
+            if pooled is None:
+                return
+            now = time.monotonic()
+            pooled.last_used = now
+            if close or self._closed or self._is_stale(pooled, now):
+                self._discard(pooled, to_close)
+            else:
+                self._idle.append(pooled)
+            self._cond.notify()
+        self._close(to_close)
+
+    def closeall(self) -> None:
+        to_close = []
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._discard(self._idle.pop(), to_close)
+            self._cond.notify_all()
+        self._close(to_close)
+
+    def stats(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "size": self._size(),
+                "wait_time_avg": stats["wait_time_total"] / stats["checkouts"] if stats["checkouts"] else 0.0,
+            })
+            return stats
@@ -0,0 +1,145 @@
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from psycopg2 import extensions
+
+logger = logging.getLogger("botevento.sql")
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PARAM_RE = re.compile(r"%\((\w+)\)s|%s")
+_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_VALUES_RE = re.compile(r"(VALUES\s*\(\?\.\.\.\))(?:\s*,\s*\(\?\.\.\.\))+", re.IGNORECASE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_sql(sql) -> str:
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    sql = str(sql)
+    sql = _STRING_RE.sub("?", sql)
+    sql = _PARAM_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _SPACE_RE.sub(" ", sql).strip()
+    sql = _LIST_RE.sub("(?...)", sql)
+    return _VALUES_RE.sub(r"\1, ...", sql)
+
+def params_shape(params) -> str:
+    if params is None:
+        return "-"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in params.items()) + "}"
+    if isinstance(params, (list, tuple)):
+        return "(" + ", ".join(type(value).__name__ for value in params) + ")"
+    return type(params).__name__
+
+_PSYCOPG2_DIR = os.path.dirname(extensions.__file__) + os.sep
+
+def _caller() -> str:
+    frame = sys._getframe(2)
+    while frame is not None and (frame.f_code.co_filename == __file__ or frame.f_code.co_filename.startswith(_PSYCOPG2_DIR)):
+        frame = frame.f_back
+    while frame is not None and frame.f_code.co_name.startswith("_") and frame.f_back is not None \
+            and frame.f_back.f_code.co_filename == frame.f_code.co_filename:
+        frame = frame.f_back
+    if frame is None:
+        return "?"
+    return f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})"
+
+
+class QueryProfiler:
+    def __init__(self, enabled: bool = False, slow_threshold: float = 0.2):
+        self.enabled = enabled
+        self.slow_threshold = slow_threshold
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, sql, params, elapsed: float) -> None:
+        normalized = normalize_sql(sql)
+        caller = _caller()
+        with self._lock:
+            entry = self._stats.get(normalized)
+            if entry is None:
+                entry = self._stats[normalized] = {"sql": normalized, "calls": 0, "total": 0.0, "max": 0.0, "slow": 0, "callers": set()}
+            entry["calls"] += 1
+            entry["total"] += elapsed
+            entry["max"] = max(entry["max"], elapsed)
+            entry["callers"].add(caller.split(" ")[0])
+            if elapsed >= self.slow_threshold:
+                entry["slow"] += 1
+        if elapsed >= self.slow_threshold:
+            logger.warning("Consulta lenta (%.1f ms) en %s params=%s: %s", elapsed * 1000, caller, params_shape(params), normalized)
+
+    def top(self, n: int = 10, key: str = "total") -> list:
+        with self._lock:
+            entries = [dict(entry, callers=sorted(entry["callers"])) for entry in self._stats.values()]
+        entries.sort(key=lambda entry: entry[key], reverse=True)
+        for entry in entries:
+            entry["avg"] = entry["total"] / entry["calls"]
+        return entries[:n]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+    def report(self, n: int = 10) -> str:
+        lines = []
+        for entry in self.top(n):
+            lines.append(
+                f"{entry['total'] * 1000:9.1f} ms total | {entry['calls']:6d} llamadas | "
+                f"{entry['avg'] * 1000:7.2f} ms media | {entry['max'] * 1000:7.1f} ms máx | "
+                f"{', '.join(entry['callers'])} | {entry['sql'][:200]}"
+            )
+        return "\n".join(lines)
+
+    def log_report(self, n: int = 10) -> None:
+        logger.warning("Resumen de consultas SQL:\n%s", self.report(n))
+
+
+DB_PROFILE = os.environ.get("DB_PROFILE", "").lower() in ("1", "true", "yes")
+
+profiler = QueryProfiler(
+    enabled=DB_PROFILE,
+    slow_threshold=float(os.environ.get("DB_SLOW_QUERY_MS", "200")) / 1000,
+)
+
+
+class _ProfilingCursorMixin:
+    def execute(self, query, vars=None):
+        if not profiler.enabled:
+            return super().execute(query, vars)
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            profiler.record(query, vars, time.perf_counter() - start)
+
+    def executemany(self, query, vars_list):
+        if not profiler.enabled:
+            return super().executemany(query, vars_list)
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            profiler.record(query, None, time.perf_counter() - start)
+
+
+_cursor_classes = {}
+
+def _profiled(cursor_class):
+    profiled = _cursor_classes.get(cursor_class)
+    if profiled is None:
+        profiled = type(f"Profiled{cursor_class.__name__}", (_ProfilingCursorMixin, cursor_class), {})
+        _cursor_classes[cursor_class] = profiled
+    return profiled
+
+
+class ProfilingConnection(extensions.connection):
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get("cursor_factory") or self.cursor_factory or extensions.cursor
+        kwargs["cursor_factory"] = _profiled(factory)
+        return super().cursor(*args, **kwargs)
@@ -0,0 +1,154 @@
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", str(text).casefold())
+    return " ".join("".join(c for c in text if not unicodedata.combining(c)).split())
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    def __init__(self, loader, label=None, min_similarity: float = 0.2):
+        self._loader = loader
+        self._label = label or (lambda row: row['nombre'])
+        self.min_similarity = min_similarity
+        self._snapshot = None
+        self._changes = None
+        self._lock = threading.Lock()
+        self.loaded_at = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot is not None
+
+    def refresh(self) -> int:
+        with self._lock:
+            self._changes = []
+        try:
+            rows = {row['id']: dict(row) for row in self._loader()}
+        except Exception:
+            with self._lock:
+                self._changes = None
+            raise
+        snapshot = self._build(rows)
+        with self._lock:
+            for row_id, fields in self._changes:
+                self._change(snapshot, row_id, fields)
+            self._changes = None
+            self._snapshot = snapshot
+            self.loaded_at = time.time()
+            return len(snapshot[0])
+
+    def _build(self, rows: dict) -> tuple:
+        entries = {}
+        postings = {}
+        for row_id, row in rows.items():
+            key = normalize(row['nombre'])
+            entries[row_id] = (row, key, self._label(row))
+            for gram in trigrams(key):
+                postings.setdefault(gram, set()).add(row_id)
+        return entries, sorted((entry[1], row_id) for row_id, entry in entries.items()), postings
+
+    def _change(self, snapshot: tuple, row_id: int, fields) -> None:
+        entries, ordered, postings = snapshot
+        previous = entries.get(row_id)
+        if previous is None and (fields is None or 'nombre' not in fields):
+            return
+        if fields is None:
+            del entries[row_id]
+            old_key, new_key = previous[1], None
+        else:
+            row = dict(previous[0] if previous is not None else {'id': row_id})
+            row.update(fields)
+            new_key = normalize(row['nombre'])
+            entries[row_id] = (row, new_key, self._label(row))
+            old_key = previous[1] if previous is not None else None
+        if old_key == new_key:
+            return
+        if old_key is not None:
+            position = bisect_left(ordered, (old_key, row_id))
+            if position < len(ordered) and ordered[position] == (old_key, row_id):
+                del ordered[position]
+        if new_key is not None:
+            insort(ordered, (new_key, row_id))
+        old_grams = trigrams(old_key) if old_key is not None else set()
+        new_grams = trigrams(new_key) if new_key is not None else set()
+        for gram in old_grams - new_grams:
+            ids = postings.get(gram)
+            if ids is not None:
+                ids.discard(row_id)
+                if not ids:
+                    del postings[gram]
+        for gram in new_grams - old_grams:
+            postings.setdefault(gram, set()).add(row_id)
+
+    def _apply(self, row_id: int, fields) -> None:
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((row_id, fields))
+            if self._snapshot is not None:
+                self._change(self._snapshot, row_id, fields)
+
+    def put(self, row: dict) -> None:
+        self._apply(row['id'], dict(row))
+
+    def update(self, row_id: int, fields: dict) -> None:
+        self._apply(row_id, dict(fields))
+
+    def remove(self, row_id: int) -> None:
+        self._apply(row_id, None)
+
+    def search(self, query: str, limit: int = 25) -> list:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return []
+        entries, ordered, postings = snapshot
+        text = normalize(query)
+        found = []
+        seen = set()
+
+        def add(row_id):
+            entry = entries.get(row_id)
+            if entry is not None and row_id not in seen and len(found) < limit:
+                seen.add(row_id)
+                found.append((row_id, entry[2]))
+
+        if not text:
+            for _, row_id in ordered[:limit]:
+                add(row_id)
+            return found
+        if text.isdigit():
+            add(int(text))
+        position = bisect_left(ordered, (text,))
+        for key, row_id in ordered[position:position + limit + 1]:
+            if not key.startswith(text):
+                break
+            add(row_id)
+        if len(found) < limit:
+            wanted = trigrams(text)
+            shared = {}
+            for gram in wanted:
+                for row_id in tuple(postings.get(gram, ())):
+                    shared[row_id] = shared.get(row_id, 0) + 1
+            scored = []
+            for row_id, count in shared.items():
+                entry = entries.get(row_id)
+                if entry is None:
+                    continue
+                key = entry[1]
+                similarity = count / len(wanted | trigrams(key))
+                contains = text in key
+                if contains or similarity >= self.min_similarity:
+                    scored.append((not contains, -similarity, key, row_id))
+            for *_, row_id in sorted(scored):
+                add(row_id)
+        return found
+
+    def __len__(self) -> int:
+        return len(self._snapshot[0]) if self._snapshot is not None else 0
@@ -0,0 +1,68 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+import discord
+
+
+class UserResolver:
+    def __init__(self, client: discord.Client, max_size: int = 1000, ttl: float = 600.0):
+        self.client = client
+        self.max_size = max_size
+        self.ttl = ttl
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self.stats = {"client_hits": 0, "lru_hits": 0, "misses": 0, "deduplicated": 0, "errors": 0}
+
+    def _cached(self, user_id: int):
+        entry = self._cache.get(user_id)
+        if entry is None:
+            return None
+        user, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._cache[user_id]
+            return None
+        self._cache.move_to_end(user_id)
+        return user
+
+    def _store(self, user: discord.User) -> None:
+        self._cache[user.id] = (user, time.monotonic() + self.ttl)
+        self._cache.move_to_end(user.id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    async def _fetch(self, user_id: int) -> discord.User:
+        try:
+            user = await self.client.fetch_user(user_id)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self._inflight.pop(user_id, None)
+        self._store(user)
+        return user
+
+    async def resolve(self, user_id: int) -> discord.User:
+        user = self.client.get_user(user_id)
+        if user is not None:
+            self.stats["client_hits"] += 1
+            return user
+        user = self._cached(user_id)
+        if user is not None:
+            self.stats["lru_hits"] += 1
+            return user
+        task = self._inflight.get(user_id)
+        if task is None:
+            self.stats["misses"] += 1
+            task = asyncio.ensure_future(self._fetch(user_id))
+            self._inflight[user_id] = task
+        else:
+            self.stats["deduplicated"] += 1
+        return await asyncio.shield(task)
+
+    def invalidate(self, user_id: int) -> None:
+        self._cache.pop(user_id, None)
+
+    @property
+    def rest_calls_saved(self) -> int:
+        return self.stats["client_hits"] + self.stats["lru_hits"] + self.stats["deduplicated"]
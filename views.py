@@ -1,4 +1,8 @@
+import time
 import discord
+import aiodb
+import metrics
+from datetime import datetime
 from typing import Callable, Any, Optional
 
 class ConfirmView(discord.ui.View):
@@ -16,12 +20,14 @@ class ConfirmView(discord.ui.View):
         return True
 
     @discord.ui.button(label="Sí", style=discord.ButtonStyle.success, emoji="✅")
+    @metrics.instrument_button
     async def confirm(self, interaction: discord.Interaction, button: discord.ui.Button):
         self.value = True
         self.stop()
         await self.on_confirm(interaction)
 
     @discord.ui.button(label="No", style=discord.ButtonStyle.danger, emoji="❌")
+    @metrics.instrument_button
     async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
         self.value = False
         self.stop()
@@ -34,231 +40,223 @@ class ConfirmView(discord.ui.View):
         self.stop()
 
 
-class StorePaginatorView(discord.ui.View):
-    def __init__(self, items: list, user_id: int, items_per_page: int = 5, timeout: float = 120.0):
-        super().__init__(timeout=timeout)
-        self.items = items
+class KeysetPaginator:
+    kind = ""
+    title = ""
+    description = ""
+    color = discord.Color.default()
+    empty_name = ""
+    empty_value = ""
+    footer_hint = ""
+    items_per_page = 5
+    count_ttl = 5.0
+    _counts = {}
+
+    def __init__(self, user_id: int):
         self.user_id = user_id
-        self.items_per_page = items_per_page
-        self.current_page = 0
-        self.max_pages = (len(items) - 1) // items_per_page + 1 if items else 1
-        self.update_buttons()
-
-    def update_buttons(self):
-        self.first_page.disabled = self.current_page == 0
-        self.prev_page.disabled = self.current_page == 0
-        self.next_page.disabled = self.current_page >= self.max_pages - 1
-        self.last_page.disabled = self.current_page >= self.max_pages - 1
-
-    def get_embed(self) -> discord.Embed:
-        embed = discord.Embed(
-            title="🏪 Tienda de Piezas del Belén",
-            description="Compra piezas para decorar tu belén.",
-            color=discord.Color.gold()
-        )
+
+    async def fetch_page(self, after: tuple = None, before: tuple = None, limit: int = 5, last: bool = False) -> list:
+        raise NotImplementedError
+
+    async def count(self) -> int:
+        raise NotImplementedError
+
+    async def cached_count(self) -> int:
+        now = time.monotonic()
+        cache_key = (self.kind, self.user_id)
+        cached = self._counts.get(cache_key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        total = await self.count()
+        if len(self._counts) > 1000:
+            for stale in [k for k, (expires, _) in self._counts.items() if expires <= now]:
+                del self._counts[stale]
+        self._counts[cache_key] = (now + self.count_ttl, total)
+        return total
+
+    def page_key(self, row) -> tuple:
+        raise NotImplementedError
+
+    def encode_key(self, key: tuple) -> str:
+        return ",".join(str(part) for part in key)
+
+    def decode_key(self, value: str) -> tuple:
+        return tuple(int(part) for part in value.split(","))
+
+    def add_row(self, embed: discord.Embed, row) -> None:
+        raise NotImplementedError
+
+    async def render(self, page: int = 0, action: str = "first", key: str = "") -> tuple:
+        total = await self.cached_count()
+        max_pages = (total - 1) // self.items_per_page + 1 if total else 1
+        rows = []
+        if action == "next" and key:
+            rows = await self.fetch_page(after=self.decode_key(key), limit=self.items_per_page)
+            page += 1
+        elif action == "prev" and key:
+            rows = await self.fetch_page(before=self.decode_key(key), limit=self.items_per_page)
+            page -= 1
+        elif action == "last":
+            remainder = total - (max_pages - 1) * self.items_per_page
+            rows = await self.fetch_page(limit=remainder or self.items_per_page, last=True)
+            page = max_pages - 1
+        if not rows:
+            rows = await self.fetch_page(limit=self.items_per_page)
+            page = 0
+        page = max(0, min(page, max_pages - 1))
+        return self.get_embed(rows, page, max_pages), self.get_view(rows, page, max_pages)
+
+    def get_embed(self, rows: list, page: int, max_pages: int) -> discord.Embed:
+        embed = discord.Embed(title=self.title, description=self.description, color=self.color)
         
-        if not self.items:
-            embed.add_field(name="Sin productos", value="La tienda está vacía.", inline=False)
+        if not rows:
+            embed.add_field(name=self.empty_name, value=self.empty_value, inline=False)
         else:
-            start = self.current_page * self.items_per_page
-            end = start + self.items_per_page
-            page_items = self.items[start:end]
-            
-            for item in page_items:
-                emoji = item.get('emoji', '🎁')
-                nombre = item['nombre']
-                precio = item['precio']
-                desc = item.get('descripcion', 'Sin descripción')
-                embed.add_field(
-                    name=f"{emoji} {nombre} (ID: {item['id']})",
-                    value=f"**Precio:** {precio} 🪙\n{desc}",
-                    inline=False
-                )
+            for row in rows:
+                self.add_row(embed, row)
         
-        embed.set_footer(text=f"Página {self.current_page + 1}/{self.max_pages} | Usa /tienda_comprar para comprar")
+        embed.set_footer(text=f"Página {page + 1}/{max_pages} | {self.footer_hint}")
         return embed
 
+    def get_view(self, rows: list, page: int, max_pages: int) -> discord.ui.View:
+        first_key = self.encode_key(self.page_key(rows[0])) if rows else ""
+        last_key = self.encode_key(self.page_key(rows[-1])) if rows else ""
+        view = discord.ui.View(timeout=None)
+        for action, label, style, key, disabled in (
+            ("first", "⏮️", discord.ButtonStyle.secondary, "", page == 0),
+            ("prev", "◀️", discord.ButtonStyle.primary, first_key, page == 0),
+            ("next", "▶️", discord.ButtonStyle.primary, last_key, page >= max_pages - 1),
+            ("last", "⏭️", discord.ButtonStyle.secondary, "", page >= max_pages - 1),
+        ):
+            view.add_item(PaginatorButton(self.kind, self.user_id, page, action, key, label, style, disabled))
+        return view
+
+
+class PaginatorButton(discord.ui.DynamicItem[discord.ui.Button], template=r"pag:(?P<kind>\w+):(?P<owner>\d+):(?P<page>\d+):(?P<action>first|prev|next|last):(?P<key>.*)"):
+    def __init__(self, kind: str, owner_id: int, page: int, action: str, key: str = "",
+                 label: str = None, style: discord.ButtonStyle = discord.ButtonStyle.secondary, disabled: bool = False):
+        super().__init__(discord.ui.Button(
+            label=label, style=style, disabled=disabled,
+            custom_id=f"pag:{kind}:{owner_id}:{page}:{action}:{key}",
+        ))
+        self.kind = kind
+        self.owner_id = owner_id
+        self.page = page
+        self.action = action
+        self.key = key
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(match['kind'], int(match['owner']), int(match['page']), match['action'], match['key'],
+                   item.label, item.style, item.disabled)
+
     async def interaction_check(self, interaction: discord.Interaction) -> bool:
-        if interaction.user.id != self.user_id:
+        if interaction.user.id != self.owner_id:
             await interaction.response.send_message("Este menú no es para ti.", ephemeral=True)
             return False
         return True
 
-    @discord.ui.button(label="⏮️", style=discord.ButtonStyle.secondary)
-    async def first_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.current_page = 0
-        self.update_buttons()
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
-
-    @discord.ui.button(label="◀️", style=discord.ButtonStyle.primary)
-    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.current_page = max(0, self.current_page - 1)
-        self.update_buttons()
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
-
-    @discord.ui.button(label="▶️", style=discord.ButtonStyle.primary)
-    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.current_page = min(self.max_pages - 1, self.current_page + 1)
-        self.update_buttons()
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
-
-    @discord.ui.button(label="⏭️", style=discord.ButtonStyle.secondary)
-    async def last_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.current_page = self.max_pages - 1
-        self.update_buttons()
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
+    async def callback(self, interaction: discord.Interaction):
+        paginator = PAGINATORS[self.kind](self.owner_id)
 
-    async def on_timeout(self):
-        self.stop()
+        async def update():
+            embed, view = await paginator.render(self.page, self.action, self.key)
+            await interaction.response.edit_message(embed=embed, view=view)
 
+        await metrics.measure(f"{type(paginator).__name__}.{self.action}_page", "button", interaction, update)
 
-class TasksPaginatorView(discord.ui.View):
-    def __init__(self, tasks: list, user_id: int, items_per_page: int = 5, timeout: float = 120.0):
-        super().__init__(timeout=timeout)
-        self.tasks = tasks
-        self.user_id = user_id
-        self.items_per_page = items_per_page
-        self.current_page = 0
-        self.max_pages = (len(tasks) - 1) // items_per_page + 1 if tasks else 1
-        self.update_buttons()
-
-    def update_buttons(self):
-        self.first_page.disabled = self.current_page == 0
-        self.prev_page.disabled = self.current_page == 0
-        self.next_page.disabled = self.current_page >= self.max_pages - 1
-        self.last_page.disabled = self.current_page >= self.max_pages - 1
-
-    def get_embed(self) -> discord.Embed:
-        embed = discord.Embed(
-            title="📋 Tareas Disponibles",
-            description="Completa tareas para ganar monedas.",
-            color=discord.Color.blue()
-        )
-        
-        if not self.tasks:
-            embed.add_field(name="Sin tareas", value="No hay tareas disponibles para ti.", inline=False)
-        else:
-            start = self.current_page * self.items_per_page
-            end = start + self.items_per_page
-            page_tasks = self.tasks[start:end]
-            
-            for task in page_tasks:
-                nombre = task['nombre']
-                recompensa = task['recompensa']
-                desc = task.get('descripcion', 'Sin descripción')
-                embed.add_field(
-                    name=f"📝 {nombre} (ID: {task['id']})",
-                    value=f"**Recompensa:** {recompensa} 🪙\n{desc}",
-                    inline=False
-                )
-        
-        embed.set_footer(text=f"Página {self.current_page + 1}/{self.max_pages} | Usa /agregar_tarea para enviar")
-        return embed
 
-    async def interaction_check(self, interaction: discord.Interaction) -> bool:
-        if interaction.user.id != self.user_id:
-            await interaction.response.send_message("Este menú no es para ti.", ephemeral=True)
-            return False
-        return True
+class StorePaginator(KeysetPaginator):
+    kind = "tienda"
+    title = "🏪 Tienda de Piezas del Belén"
+    description = "Compra piezas para decorar tu belén."
+    color = discord.Color.gold()
+    empty_name = "Sin productos"
+    empty_value = "La tienda está vacía."
+    footer_hint = "Usa /tienda_comprar para comprar"
 
-    @discord.ui.button(label="⏮️", style=discord.ButtonStyle.secondary)
-    async def first_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.current_page = 0
-        self.update_buttons()
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
-
-    @discord.ui.button(label="◀️", style=discord.ButtonStyle.primary)
-    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.current_page = max(0, self.current_page - 1)
-        self.update_buttons()
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
-
-    @discord.ui.button(label="▶️", style=discord.ButtonStyle.primary)
-    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.current_page = min(self.max_pages - 1, self.current_page + 1)
-        self.update_buttons()
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
-
-    @discord.ui.button(label="⏭️", style=discord.ButtonStyle.secondary)
-    async def last_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.current_page = self.max_pages - 1
-        self.update_buttons()
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
+    async def fetch_page(self, after: tuple = None, before: tuple = None, limit: int = 5, last: bool = False) -> list:
+        return await aiodb.get_store_items_page(after, before, limit, last)
 
-    async def on_timeout(self):
-        self.stop()
+    async def count(self) -> int:
+        return await aiodb.count_store_items()
 
+    def page_key(self, row) -> tuple:
+        return (row['precio'], row['id'])
 
-class PendingSubmissionsPaginatorView(discord.ui.View):
-    def __init__(self, submissions: list, user_id: int, items_per_page: int = 5, timeout: float = 120.0):
-        super().__init__(timeout=timeout)
-        self.submissions = submissions
-        self.user_id = user_id
-        self.items_per_page = items_per_page
-        self.current_page = 0
-        self.max_pages = (len(submissions) - 1) // items_per_page + 1 if submissions else 1
-        self.update_buttons()
-
-    def update_buttons(self):
-        self.first_page.disabled = self.current_page == 0
-        self.prev_page.disabled = self.current_page == 0
-        self.next_page.disabled = self.current_page >= self.max_pages - 1
-        self.last_page.disabled = self.current_page >= self.max_pages - 1
-
-    def get_embed(self) -> discord.Embed:
-        embed = discord.Embed(
-            title="📋 Solicitudes de Tareas Pendientes",
-            description="Revisa y aprueba/rechaza las tareas completadas.",
-            color=discord.Color.orange()
+    def add_row(self, embed: discord.Embed, item) -> None:
+        emoji = item.get('emoji', '🎁')
+        nombre = item['nombre']
+        precio = item['precio']
+        desc = item.get('descripcion', 'Sin descripción')
+        embed.add_field(
+            name=f"{emoji} {nombre} (ID: {item['id']})",
+            value=f"**Precio:** {precio} 🪙\n{desc}",
+            inline=False
         )
-        
-        if not self.submissions:
-            embed.add_field(name="Sin solicitudes", value="No hay solicitudes pendientes.", inline=False)
-        else:
-            start = self.current_page * self.items_per_page
-            end = start + self.items_per_page
-            page_subs = self.submissions[start:end]
-            
-            for sub in page_subs:
-                nota = sub.get('nota', 'Sin nota')
-                embed.add_field(
-                    name=f"ID: {sub['id']} | {sub['tarea_nombre']}",
-                    value=f"**Usuario:** {sub['username']}\n**Recompensa:** {sub['recompensa']} 🪙\n**Nota:** {nota}",
-                    inline=False
-                )
-        
-        embed.set_footer(text=f"Página {self.current_page + 1}/{self.max_pages} | Usa /admin_aceptar_tarea o /admin_rechazar_tarea")
-        return embed
 
-    async def interaction_check(self, interaction: discord.Interaction) -> bool:
-        if interaction.user.id != self.user_id:
-            await interaction.response.send_message("Este menú no es para ti.", ephemeral=True)
-            return False
-        return True
 
-    @discord.ui.button(label="⏮️", style=discord.ButtonStyle.secondary)
-    async def first_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.current_page = 0
-        self.update_buttons()
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
-
-    @discord.ui.button(label="◀️", style=discord.ButtonStyle.primary)
-    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.current_page = max(0, self.current_page - 1)
-        self.update_buttons()
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
-
-    @discord.ui.button(label="▶️", style=discord.ButtonStyle.primary)
-    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.current_page = min(self.max_pages - 1, self.current_page + 1)
-        self.update_buttons()
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
-
-    @discord.ui.button(label="⏭️", style=discord.ButtonStyle.secondary)
-    async def last_page(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.current_page = self.max_pages - 1
-        self.update_buttons()
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
+class TasksPaginator(KeysetPaginator):
+    kind = "tareas"
+    title = "📋 Tareas Disponibles"
+    description = "Completa tareas para ganar monedas."
+    color = discord.Color.blue()
+    empty_name = "Sin tareas"
+    empty_value = "No hay tareas disponibles para ti."
+    footer_hint = "Usa /agregar_tarea para enviar"
+
+    async def fetch_page(self, after: tuple = None, before: tuple = None, limit: int = 5, last: bool = False) -> list:
+        return await aiodb.get_available_tareas_page(self.user_id, after, before, limit, last)
+
+    async def count(self) -> int:
+        return await aiodb.count_available_tareas(self.user_id)
+
+    def page_key(self, row) -> tuple:
+        return (row['recompensa'], row['id'])
+
+    def add_row(self, embed: discord.Embed, task) -> None:
+        nombre = task['nombre']
+        recompensa = task['recompensa']
+        desc = task.get('descripcion', 'Sin descripción')
+        embed.add_field(
+            name=f"📝 {nombre} (ID: {task['id']})",
+            value=f"**Recompensa:** {recompensa} 🪙\n{desc}",
+            inline=False
+        )
 
-    async def on_timeout(self):
-        self.stop()
+
+class PendingSubmissionsPaginator(KeysetPaginator):
+    kind = "pendientes"
+    title = "📋 Solicitudes de Tareas Pendientes"
+    description = "Revisa y aprueba/rechaza las tareas completadas."
+    color = discord.Color.orange()
+    empty_name = "Sin solicitudes"
+    empty_value = "No hay solicitudes pendientes."
+    footer_hint = "Usa /admin_aceptar_tarea, /admin_rechazar_tarea o /admin_revisar_tareas"
+
+    async def fetch_page(self, after: tuple = None, before: tuple = None, limit: int = 5, last: bool = False) -> list:
+        return await aiodb.get_pending_tarea_submissions_page(after, before, limit, last)
+
+    async def count(self) -> int:
+        return await aiodb.count_pending_tarea_submissions()
+
+    def page_key(self, row) -> tuple:
+        return (row['created_at'], row['id'])
+
+    def encode_key(self, key: tuple) -> str:
+        return f"{key[0].isoformat()},{key[1]}"
+
+    def decode_key(self, value: str) -> tuple:
+        created_at, submission_id = value.rsplit(",", 1)
+        return (datetime.fromisoformat(created_at), int(submission_id))
+
+    def add_row(self, embed: discord.Embed, sub) -> None:
+        nota = sub.get('nota', 'Sin nota')
+        embed.add_field(
+            name=f"ID: {sub['id']} | {sub['tarea_nombre']}",
+            value=f"**Usuario:** {sub['username']}\n**Recompensa:** {sub['recompensa']} 🪙\n**Nota:** {nota}",
+            inline=False
+        )
+
+
+PAGINATORS = {paginator.kind: paginator for paginator in (StorePaginator, TasksPaginator, PendingSubmissionsPaginator)}